@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+import time
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench.synthetic import synthetic_sam_rows
+from common.xml_stream import StreamingSetWriter
+from samSubmit.create_sam_xml import convert_lines
+
+"""
+Usage: bench_sam_emitter.py [-h] [-n ROWS] [--seed SEED] [--keep]
+
+Rows/sec of the SAMPLE row loop before (element built from scratch per row) and after
+(compiled checklist emitter, common/checklist.py) on a synthetic sam.tsv, written through the
+streaming writer.
+Both outputs are compared byte by byte.
+
+    python3 bench/bench_sam_emitter.py -n 1000000
+"""
+
+
+def run(convert, lines, xmlOutFile):
+    """
+    Time one converter over all lines; returns (seconds, samples written).
+    """
+    start = time.perf_counter()
+    with StreamingSetWriter(xmlOutFile, "SAMPLE_SET") as writer:
+        convert(lines, 1, writer)
+    return time.perf_counter() - start, writer.count
+
+
+def create_sample_attribute(parent, tag, value, units=None):
+    """
+    Create a SAMPLE_ATTRIBUTE XML element (used by the baseline below).
+    """
+    sample_attr = etree.SubElement(parent, "SAMPLE_ATTRIBUTE")
+    etree.SubElement(sample_attr, "TAG").text = tag
+    etree.SubElement(sample_attr, "VALUE").text = value
+    if units:
+        etree.SubElement(sample_attr, "UNITS").text = units
+
+
+def legacy_convert_lines(lines, first_line, writer, accessions=None):
+    """
+    The SAMPLE row loop before the compiled emitter (kept verbatim as the benchmark baseline).
+    """
+    line_counter = first_line - 1  # Last line number processed
+    skipped_lines = 0  # Number of skipped lines (header, errors, or incomplete data)
+
+    for line in lines:
+        line_counter += 1
+        line = line.strip()
+
+        # skip empty or malformed lines (not exactly 16 tab-separated values)
+        if not line or len(line.split('\t')) != 16:
+            print(f"Warning: Skipping malformed or incomplete line {line_counter}.")
+            skipped_lines+= 1
+            continue
+
+        # skip lines containing "alias" (header or irrelevant)
+        if "alias" in line:
+            skipped_lines+= 1
+            print("Skipping header")
+            continue
+
+        try:
+            # Extract required values from TSV (expecting exactly 16 tab-separated fields)
+            (
+                insdc_acc, sam_title, isolate, date,
+                alias, region, host_sex, host_sc,
+                host_comm, iso_host, lat, long,
+                host_disease_out, host_health_stat, host_sub_id, pub
+            ) = line.split('\t')
+
+            # Ensure required fields are not empty
+            required_fields = [
+                insdc_acc, sam_title, isolate, date, alias, region, host_sex, host_sc,
+                host_comm, iso_host, lat, long, host_disease_out, host_health_stat, host_sub_id, pub
+            ]
+            if not all(required_fields):
+                print(f"Warning: Line {line_counter} contains empty values. Skipping.")
+                skipped_lines += 1
+                continue
+
+        except ValueError:
+            print(f"Warning: Line {line_counter} does not have the expected 16 tab-separated values. Skipping.")
+            skipped_lines +=1
+            continue
+
+        # Fill in an ignored INSDC accession from the accession index
+        if accessions is not None and insdc_acc == "IGNORE":
+            insdc_acc = accessions.lookup("SAMPLE", alias) or insdc_acc
+
+        # Create SAMPLE element
+        sample = etree.Element("SAMPLE", {"alias": alias, "center_name": "One Health Pact Consortium (2020–2022), EcoAlert Collaborative Team (2016–2019)"})
+
+        # Add TITLE
+        etree.SubElement(sample, "TITLE").text = sam_title
+
+        # Add SAMPLE_NAME
+        sample_name = etree.SubElement(sample, "SAMPLE_NAME")
+        etree.SubElement(sample_name, "TAXON_ID").text = "64286"
+        etree.SubElement(sample_name, "SCIENTIFIC_NAME").text = "Usutu virus"
+        etree.SubElement(sample_name, "COMMON_NAME").text = "Usutu virus"
+
+        # Mapping keywords to specific descriptions
+        description_mapping = {
+            "blood": "Human blood donor samples testing RT-PCR positive for Usutu virus (CT values below 32) "
+                     "were subjected to whole-genome sequencing using an amplicon-based Oxford Nanopore approach.",
+            "mosquitoes": "Mosquito samples testing RT-PCR positive for Usutu virus (CT values below 32) "
+                          "were subjected to whole-genome sequencing using an amplicon-based Oxford Nanopore approach.",
+            "free-ranging": "Samples from free-ranging birds testing RT-PCR positive for Usutu virus (CT values below 32) "
+                            "were subjected to whole-genome sequencing using an amplicon-based Oxford Nanopore approach.",
+            "captivity": "Samples from birds in captivity testing RT-PCR positive for Usutu virus (CT values below 32) "
+                         "were subjected to whole-genome sequencing using an amplicon-based Oxford Nanopore approach."
+        }
+
+        # Default description
+        default_description = (
+            "Samples collected from humans (blood donors), wildlife (birds and mosquitoes), and captive birds in the Netherlands "
+            "that tested RT-PCR positive for Usutu virus (CT values below 32) were subjected to whole-genome sequencing using an "
+            "amplicon-based Oxford Nanopore approach."
+        )
+
+        # Determine the description based on sam_title
+        description = next(
+            (desc for keyword, desc in description_mapping.items() if keyword in sam_title),
+            default_description
+        )
+
+        # Add DESCRIPTION
+        etree.SubElement(sample, "DESCRIPTION").text = description
+
+        # Add SAMPLE_ATTRIBUTES
+        sample_attributes = etree.SubElement(sample, "SAMPLE_ATTRIBUTES")
+        create_sample_attribute(sample_attributes, "collecting institution", "One Health Pact Consortium (2020–2022), EcoAlert Collaborative Team (2016–2019)") #One Health PACT Usutu virus workgroup
+        create_sample_attribute(sample_attributes, "collection date", date)
+        create_sample_attribute(sample_attributes, "collector name", "One Health Pact Consortium (2020–2022), EcoAlert Collaborative Team (2016–2019)")
+        create_sample_attribute(sample_attributes, "geographic location (country and/or sea)", "Netherlands")
+        if region != "IGNORE": # Add optional attributes if applicable
+            create_sample_attribute(sample_attributes, "geographic location (region and locality)", region)
+        create_sample_attribute(sample_attributes, "geographic location (latitude)", lat, "DD")
+        create_sample_attribute(sample_attributes, "geographic location (longitude)", long, "DD")
+        create_sample_attribute(sample_attributes, "sample capture status", "active surveillance not initiated by an outbreak")
+        if iso_host != "IGNORE": # Add optional attributes if applicable
+            create_sample_attribute(sample_attributes, "isolation source host-associated", iso_host)
+        create_sample_attribute(sample_attributes, "host scientific name", host_sc)
+        create_sample_attribute(sample_attributes, "host common name", host_comm)
+        create_sample_attribute(sample_attributes, "host health state", host_health_stat)
+        if host_disease_out != "IGNORE": # Add optional attributes if applicable
+            create_sample_attribute(sample_attributes, "host disease outcome", host_disease_out)
+        create_sample_attribute(sample_attributes, "host sex", host_sex)
+        create_sample_attribute(sample_attributes, "host subject id", host_sub_id)
+        create_sample_attribute(sample_attributes, "isolate", isolate)
+        create_sample_attribute(sample_attributes, "publication", pub)
+        if insdc_acc != "IGNORE": # Add optional attributes if applicable
+            create_sample_attribute(sample_attributes, "INSDC accession", insdc_acc)
+        create_sample_attribute(sample_attributes, "ENA-CHECKLIST", "ERC000033")
+
+        # Serialize the SAMPLE straight to disk (with its TSV line for validation reports)
+        writer.write(sample, line_counter)
+
+    return line_counter - first_line + 1, skipped_lines
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Benchmark the compiled SAMPLE emitter against the per-row builder.")
+    parser.add_argument("-n", "--rows", type=int, default=1000000, help="Number of synthetic sam.tsv rows.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic data.")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated TSV and XML files.")
+
+    # Parse arguments
+    args = parser.parse_args()
+    lines = list(synthetic_sam_rows(args.rows, args.seed))
+    workdir = tempfile.mkdtemp(prefix="bench_sam_")
+    before_xml = os.path.join(workdir, "before.xml")
+    after_xml = os.path.join(workdir, "after.xml")
+
+    # quiet the per-line "Skipping header" messages
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        before_seconds, before_count = run(legacy_convert_lines, lines, before_xml)
+        after_seconds, after_count = run(convert_lines, lines, after_xml)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    identical = filecmp.cmp(before_xml, after_xml, shallow=False)
+
+    print(f"    {args.rows} rows, {before_count} samples")
+    print(f"    before: {before_seconds:8.2f} s  {args.rows / before_seconds:10.0f} rows/s")
+    print(f"    after:  {after_seconds:8.2f} s  {args.rows / after_seconds:10.0f} rows/s  "
+          f"({before_seconds / after_seconds:.2f}x)")
+    print(f"    output identical: {identical}")
+
+    if args.keep:
+        with open(os.path.join(workdir, "sam.tsv"), 'w') as f:
+            f.writelines(lines)
+        print(f"    files kept in {workdir}")
+    else:
+        os.remove(before_xml)
+        os.remove(after_xml)
+        os.rmdir(workdir)
+    if not identical or before_count != after_count:
+        sys.exit(1)
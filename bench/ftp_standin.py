@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import socket
+import socketserver
+import time
+
+"""
+Usage: ftp_standin.py [-h] [--root ROOT] [--host HOST] [--port PORT] [--drop-after BYTES] [--latency SECONDS]
+
+Minimal local FTP server standing in for the Webin upload area, to exercise common/upload.py
+without credentials or network:
+
+    python3 bench/ftp_standin.py --root /tmp/upload_area --port 2121 --drop-after 50M &
+    U_NAME=x PASS_WORD=y python3 common/upload.py -i runExp.tsv --host 127.0.0.1 --port 2121
+
+Any user name and password are accepted. Passive mode, binary transfers and the commands used by
+ftplib (SIZE, REST, STOR, RETR, CWD, MKD, ...) are supported. --drop-after closes the data
+connection of every upload after that many bytes, so uploads only finish by resuming;
+--latency delays every reply.
+"""
+
+
+def parse_bytes(text):
+    """
+    "50M" -> 52428800
+    """
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper()
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+class FtpSession(socketserver.StreamRequestHandler):
+    """
+    One control connection.
+    """
+
+    def reply(self, text):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write(f"{text}\r\n".encode("UTF-8"))
+
+    def local_path(self, name):
+        path = os.path.normpath(os.path.join(self.cwd, name))  # "/dir/file", never above "/"
+        return os.path.join(self.server.root, path.lstrip("/"))
+
+    def open_data(self):
+        if self.passive is None:
+            self.reply("425 Use PASV or EPSV first.")
+            return None
+        listener, self.passive = self.passive, None
+        listener.settimeout(30)
+        try:
+            connection, _ = listener.accept()
+        except OSError:
+            self.reply("425 Cannot open data connection.")
+            return None
+        finally:
+            listener.close()
+        return connection
+
+    def handle(self):
+        self.cwd = "/"
+        self.rest = 0
+        self.passive = None
+        self.reply("220 Upload area stand-in ready.")
+        for raw in self.rfile:
+            command, _, argument = raw.decode("UTF-8", "replace").strip().partition(" ")
+            command = command.upper()
+            handler = getattr(self, "ftp_" + command, None)
+            if command == "QUIT":
+                self.reply("221 Bye.")
+                break
+            if handler is None:
+                self.reply(f"502 {command} not implemented.")
+            else:
+                handler(argument)
+        if self.passive is not None:
+            self.passive.close()
+
+    def ftp_USER(self, argument):
+        self.reply("331 Password required.")
+
+    def ftp_PASS(self, argument):
+        self.reply("230 Logged in.")
+
+    def ftp_SYST(self, argument):
+        self.reply("215 UNIX Type: L8")
+
+    def ftp_TYPE(self, argument):
+        self.reply("200 Type set.")
+
+    def ftp_NOOP(self, argument):
+        self.reply("200 OK.")
+
+    def ftp_PWD(self, argument):
+        self.reply(f'257 "{self.cwd}"')
+
+    def ftp_CWD(self, argument):
+        if os.path.isdir(self.local_path(argument)):
+            self.cwd = os.path.normpath(os.path.join(self.cwd, argument))
+            self.reply("250 OK.")
+        else:
+            self.reply("550 No such directory.")
+
+    def ftp_MKD(self, argument):
+        try:
+            os.makedirs(self.local_path(argument))
+            self.reply(f'257 "{argument}" created.')
+        except OSError:
+            self.reply("550 Cannot create directory.")
+
+    def ftp_SIZE(self, argument):
+        path = self.local_path(argument)
+        if os.path.isfile(path):
+            self.reply(f"213 {os.path.getsize(path)}")
+        else:
+            self.reply("550 No such file.")
+
+    def ftp_DELE(self, argument):
+        try:
+            os.remove(self.local_path(argument))
+            self.reply("250 Deleted.")
+        except OSError:
+            self.reply("550 No such file.")
+
+    def ftp_REST(self, argument):
+        self.rest = int(argument)
+        self.reply(f"350 Restarting at {self.rest}.")
+
+    def _listen(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind((self.server.server_address[0], 0))
+        listener.listen(1)
+        if self.passive is not None:
+            self.passive.close()
+        self.passive = listener
+        return listener.getsockname()
+
+    def ftp_PASV(self, argument):
+        host, port = self._listen()
+        self.reply(f"227 Entering Passive Mode ({host.replace('.', ',')},{port >> 8},{port & 255}).")
+
+    def ftp_EPSV(self, argument):
+        _, port = self._listen()
+        self.reply(f"229 Entering Extended Passive Mode (|||{port}|).")
+
+    def ftp_RETR(self, argument):
+        path = self.local_path(argument)
+        if not os.path.isfile(path):
+            self.reply("550 No such file.")
+            return
+        connection = self.open_data()
+        if connection is None:
+            return
+        self.reply("150 Sending.")
+        with connection, open(path, 'rb') as f:
+            f.seek(self.rest)
+            self.rest = 0
+            while True:
+                block = f.read(1024 ** 2)
+                if not block:
+                    break
+                connection.sendall(block)
+        self.reply("226 Transfer complete.")
+
+    def ftp_STOR(self, argument):
+        path = self.local_path(argument)
+        if not os.path.isdir(os.path.dirname(path)):
+            self.reply("553 No such directory.")
+            return
+        connection = self.open_data()
+        if connection is None:
+            return
+        self.reply("150 Receiving.")
+        offset, self.rest = self.rest, 0
+        limit = self.server.drop_after
+        received = 0
+        with connection, open(path, 'r+b' if offset and os.path.exists(path) else 'wb') as f:
+            f.truncate(offset)
+            f.seek(offset)
+            while True:
+                block = connection.recv(1024 ** 2)
+                if not block:
+                    break
+                if limit and received + len(block) > limit:
+                    f.write(block[:limit - received])
+                    connection.shutdown(socket.SHUT_RDWR)  # simulate a dropped transfer
+                    self.reply("426 Connection closed; transfer aborted.")
+                    return
+                f.write(block)
+                received += len(block)
+        self.reply("226 Transfer complete.")
+
+
+class FtpStandin(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, root, drop_after=0, latency=0.0):
+        super().__init__(address, FtpSession)
+        self.root = os.path.abspath(root)
+        self.drop_after = drop_after
+        self.latency = latency
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Local FTP stand-in for the Webin upload area.")
+    parser.add_argument("--root", help="Directory holding the uploaded files.", default="upload_area")
+    parser.add_argument("--host", help="Address to listen on.", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2121, help="Control port.")
+    parser.add_argument("--drop-after", type=parse_bytes, default=0,
+                        help="Drop the data connection of every upload after this many bytes (e.g. 50M).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before every reply.")
+
+    # Parse arguments
+    args = parser.parse_args()
+    os.makedirs(args.root, exist_ok=True)
+    server = FtpStandin((args.host, args.port), args.root, args.drop_after, args.latency)
+    print(f"    Upload area stand-in on {args.host}:{args.port}, files in '{server.root}'.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
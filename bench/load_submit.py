@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.compression import open_input
+from common.submit import SubmissionClient, SubmissionError, discover_shard_batches, parse_batch, receipt_success
+
+"""
+Usage: load_submit.py [-h] [--url URL] [--shard-dir DIR] [--batch FIELD=FILE [FIELD=FILE ...]]
+                      [-c N [N ...]] [--repeat N] [--retries N] [--timeout SECONDS] [-o OUTPUT]
+
+Submission load generator: replays submission batches (sharded sam/exp/run XML, or explicit
+batches) against a dropbox at one or more concurrency levels, with common/submit.py's pooled
+client, and reports per level the latency percentiles of the posts and the objects per second.
+
+    python3 bench/mock_dropbox.py --stateless --latency 150 --latency-per-object 1 --jitter 50 &
+    python3 samSubmit/create_sam_xml.py -i /tmp/bench/sam.tsv --shard-objects 1000
+    python3 bench/load_submit.py --shard-dir samSubmit -c 1 2 4 8 16 --repeat 2 -o load.json
+
+Latency is measured per post, including encoding the multipart body and any retries. A post that
+fails (after --retries, default 0 so that errors are counted rather than hidden) or gets an
+unsuccessful receipt counts as failed; its objects are not counted. Never point it at the
+production dropbox.
+"""
+
+LOCAL_URL = "http://127.0.0.1:8089/ena/submit/drop-box/submit/"
+OBJECT_TAG = re.compile(rb"<(?:SAMPLE|EXPERIMENT|RUN)[\s>/]")
+
+
+def count_objects(batch):
+    """
+    Number of SAMPLE/EXPERIMENT/RUN objects in the files of a batch.
+    """
+    count = 0
+    for field, path in batch.items():
+        if field == "SUBMISSION":
+            continue
+        with open_input(path, 'rb') as f:
+            count += len(OBJECT_TAG.findall(f.read()))
+    return count
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of sorted `values`.
+    """
+    if not values:
+        return None
+    rank = max(1, min(len(values), math.ceil(fraction * len(values))))
+    return values[rank - 1]
+
+
+def run_level(url, batches, objects, concurrency, repeat=1, retries=0, timeout=300):
+    """
+    Post every batch `repeat` times with `concurrency` posts in flight.
+    Returns the summary of the level (latencies in milliseconds).
+    """
+    client = SubmissionClient(url, "load", "test", concurrency, retries, timeout)
+    work = [index for _ in range(repeat) for index in range(len(batches))]
+
+    def post(index):
+        start = time.perf_counter()
+        try:
+            success = receipt_success(client.post(batches[index]))
+        except (SubmissionError, OSError):
+            success = False
+        return index, success, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(post, work))
+    wall = time.perf_counter() - start
+    client.close()
+
+    latencies = sorted(seconds * 1000 for _, _, seconds in results)
+    succeeded = [index for index, success, _ in results if success]
+    submitted = sum(objects[index] for index in succeeded)
+    return {
+        "concurrency": concurrency,
+        "posts": len(results),
+        "failed": len(results) - len(succeeded),
+        "objects": submitted,
+        "wall_seconds": round(wall, 3),
+        "objects_per_second": round(submitted / wall, 1) if wall else None,
+        "posts_per_second": round(len(results) / wall, 2) if wall else None,
+        "latency_ms": {name: round(percentile(latencies, fraction), 1)
+                       for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))},
+    }
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Replay submission batches against a (mock) dropbox and report latency and throughput.")
+    parser.add_argument("--url", help=f"Dropbox URL (default: the local mock, {LOCAL_URL}).", default=LOCAL_URL)
+    parser.add_argument("--shard-dir", action="append", default=[],
+                        help="Replay every sam/runExp shard batch found in this directory. Repeatable.")
+    parser.add_argument("--batch", nargs="+", action="append", metavar="FIELD=FILE", default=[],
+                        help="One batch: form fields and files, e.g. SUBMISSION=add_submission.xml SAMPLE=sam.xml. Repeatable.")
+    parser.add_argument("-c", "--concurrency", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Concurrency levels (posts in flight) to measure.")
+    parser.add_argument("--repeat", type=int, default=1, help="Post every batch this many times per level.")
+    parser.add_argument("--retries", type=int, default=0, help="Retries per post (on 5xx and timeouts).")
+    parser.add_argument("--timeout", type=float, default=300, help="Socket timeout in seconds.")
+    parser.add_argument("-o", "--output", help="Write the results as JSON.", default=None)
+
+    # Parse arguments
+    args = parser.parse_args()
+    if "ebi.ac.uk" in args.url:
+        parser.error("refusing to load-test an ENA dropbox, use the local mock (bench/mock_dropbox.py)")
+    try:
+        batches = [parse_batch(items) for items in args.batch]
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    for directory in args.shard_dir:
+        batches.extend(discover_shard_batches(directory))
+    if not batches:
+        parser.error("nothing to replay: use --batch and/or --shard-dir")
+
+    try:
+        objects = [count_objects(batch) for batch in batches]
+    except FileNotFoundError as e:
+        print(f"    Error: The file '{e.filename}' does not exist.")
+        sys.exit(1)
+    print(f"    {len(batches)} batches, {sum(objects)} objects, {args.url}")
+
+    levels = []
+    for concurrency in args.concurrency:
+        level = run_level(args.url, batches, objects, concurrency, args.repeat, args.retries, args.timeout)
+        levels.append(level)
+        latency = level["latency_ms"]
+        print(f"    c={concurrency:<3d} {level['posts']} posts ({level['failed']} failed), "
+              f"{level['objects_per_second']} objects/s, {level['posts_per_second']} posts/s, "
+              f"latency p50 {latency['p50']} ms, p90 {latency['p90']} ms, p99 {latency['p99']} ms, max {latency['max']} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"url": args.url, "batches": len(batches), "objects": sum(objects), "repeat": args.repeat,
+                       "levels": levels}, f, indent=2)
+            f.write("\n")
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+import argparse
+import base64
+import datetime
+import email.parser
+import email.policy
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lxml import etree
+
+"""
+Usage: mock_dropbox.py [-h] [--host HOST] [--port PORT] [--latency MS] [--latency-per-object MS]
+                       [--jitter MS] [--error-rate P] [--drop-rate P] [--test] [--stateless] [--seed SEED]
+
+Local stand-in for the ENA dropbox (…/ena/submit/drop-box/submit/), for testing and load tests:
+
+    python3 bench/mock_dropbox.py --port 8089 --latency 200 --latency-per-object 2 --error-rate 0.05 &
+    python3 common/submit.py --url http://127.0.0.1:8089/ena/submit/drop-box/submit/ --batch ...
+    ./make-submit-xml.sh -u http://127.0.0.1:8089/ena/submit/drop-box/submit/
+
+It accepts the same multipart posts (SUBMISSION plus SAMPLE/EXPERIMENT/RUN files, any Basic auth
+credentials) and answers with a RECEIPT like ENA's: an accession per object (ERS/SAMEA for
+samples, ERX, ERR, ERA for the submission), success="false" with an ERROR for an ADD of an alias
+it already holds or a MODIFY of an unknown one, and the TEST message with --test. The receipts
+can be indexed by common/receipts.py. With --stateless every ADD is accepted (for replaying the
+same files in load tests).
+
+Each response waits --latency plus --latency-per-object per object (± --jitter); with probability
+--error-rate it is a 500/502/503 instead, with --drop-rate the connection is closed without an
+answer. Accessions are kept in memory only.
+"""
+
+OBJECT_PREFIXES = {"SAMPLE": "ERS", "EXPERIMENT": "ERX", "RUN": "ERR"}
+ERROR_STATUSES = (500, 502, 503)
+TEST_INFO = "This submission is a TEST submission and will be discarded within 24 hours"
+OBJECT_TAG = re.compile(rb"<(?:SAMPLE|EXPERIMENT|RUN)[\s>/]")  # not SAMPLE_ATTRIBUTE, EXPERIMENT_REF, ...
+
+
+class Dropbox:
+    """
+    Accession state of the mock dropbox: {(object type, alias): accession}.
+    """
+
+    def __init__(self, stateless=False, test=False):
+        self.stateless = stateless
+        self.test = test
+        self.accessions = {}
+        self.counters = dict.fromkeys(list(OBJECT_PREFIXES) + ["SUBMISSION", "BIOSAMPLE"], 0)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.objects = 0
+
+    def _next(self, kind):
+        # called with the lock held
+        self.counters[kind] += 1
+        if kind == "BIOSAMPLE":
+            return f"SAMEA{90000000 + self.counters[kind]}"
+        prefix = "ERA" if kind == "SUBMISSION" else OBJECT_PREFIXES[kind]
+        return f"{prefix}{9000000 + self.counters[kind]}"
+
+    def submit(self, files):
+        """
+        Process one post ({form field: file bytes}) and return the RECEIPT bytes.
+        """
+        try:
+            actions = [action.tag for action in etree.fromstring(files["SUBMISSION"]).iterfind(".//ACTION/*")]
+        except (KeyError, etree.XMLSyntaxError) as e:
+            return self._receipt([], ["Invalid or missing SUBMISSION XML: " + str(e)], [], False)
+        action = "MODIFY" if "MODIFY" in actions else "ADD"
+
+        objects = []
+        errors = []
+        for field, content in files.items():
+            if field == "SUBMISSION":
+                continue
+            try:
+                root = etree.fromstring(content)
+            except etree.XMLSyntaxError as e:
+                errors.append(f"Invalid {field} XML: {e}")
+                continue
+            for element in root:
+                if element.tag in OBJECT_PREFIXES:
+                    objects.append((element.tag, element.get("alias")))
+
+        receipt_objects = []
+        with self.lock:
+            self.requests += 1
+            self.objects += len(objects)
+            for object_type, alias in objects:
+                known = self.accessions.get((object_type, alias))
+                if action == "ADD" and known and not self.stateless:
+                    errors.append(f'In {object_type.lower()}, alias: "{alias}". The object being added already '
+                                  f'exists in the submission account with accession: "{known[0]}".')
+                elif action == "MODIFY" and not known:
+                    errors.append(f'In {object_type.lower()}, alias: "{alias}". The object being modified '
+                                  f'does not exist in the submission account.')
+            if not errors:
+                for object_type, alias in objects:
+                    known = self.accessions.get((object_type, alias))
+                    if action == "ADD" or not known:
+                        known = (self._next(object_type), self._next("BIOSAMPLE") if object_type == "SAMPLE" else None)
+                        if not self.test:
+                            self.accessions[object_type, alias] = known
+                    receipt_objects.append((object_type, alias, known))
+                submission = self._next("SUBMISSION")
+        return self._receipt(receipt_objects, errors, actions, not errors, None if errors else submission)
+
+    def _receipt(self, objects, errors, actions, success, submission=None):
+        receipt = etree.Element("RECEIPT", receiptDate=datetime.datetime.now().astimezone().isoformat(timespec="milliseconds"),
+                                submissionFile="submission.xml", success="true" if success else "false")
+        for object_type, alias, (accession, ext_accession) in objects:
+            element = etree.SubElement(receipt, object_type, accession=accession, alias=alias, status="PRIVATE")
+            if ext_accession:
+                etree.SubElement(element, "EXT_ID", accession=ext_accession, type="biosample")
+        if submission:
+            etree.SubElement(receipt, "SUBMISSION", accession=submission, alias=f"SUBMISSION-{submission}")
+        messages = etree.SubElement(receipt, "MESSAGES")
+        for error in errors:
+            etree.SubElement(messages, "ERROR").text = error
+        if self.test:
+            etree.SubElement(messages, "INFO").text = TEST_INFO
+        elif success:
+            etree.SubElement(messages, "INFO").text = "Submission has been committed."
+        for action in actions:
+            etree.SubElement(receipt, "ACTIONS").text = action
+        return etree.tostring(receipt, encoding="UTF-8", xml_declaration=True, pretty_print=True)
+
+
+def parse_multipart(content_type, body):
+    """
+    Return {form field: file bytes} of a multipart/form-data body.
+    """
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+    if not message.is_multipart():
+        raise ValueError("not a multipart/form-data body")
+    files = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if name:
+            files[name.upper()] = part.get_payload(decode=True)
+    return files
+
+
+class DropboxHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real dropbox
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type="application/xml"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        kind, _, token = self.headers.get("Authorization", "").partition(" ")
+        try:
+            return kind == "Basic" and b":" in base64.b64decode(token, validate=True)
+        except ValueError:
+            return False
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self._authorized():
+            self.send_response(401)
+            self.send_header("WWW-Authenticate", 'Basic realm="ENA"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        try:
+            files = parse_multipart(self.headers.get("Content-Type", ""), body)
+        except ValueError as e:
+            self._send(400, str(e).encode("UTF-8"), "text/plain")
+            return
+
+        n_objects = sum(len(OBJECT_TAG.findall(content)) for field, content in files.items() if field != "SUBMISSION")
+        delay = server.latency + server.latency_per_object * n_objects + server.random.uniform(-1, 1) * server.jitter
+        time.sleep(max(delay, 0) / 1000)
+
+        roll = server.random.random()
+        if roll < server.drop_rate:
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)  # no answer at all, as on a dropped connection
+            return
+        if roll < server.drop_rate + server.error_rate:
+            status = server.random.choice(ERROR_STATUSES)
+            self._send(status, f"<html><body>{status} injected error</body></html>".encode(), "text/html")
+            return
+        self._send(200, server.dropbox.submit(files))
+
+
+class MockDropbox(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, dropbox, latency=0.0, latency_per_object=0.0, jitter=0.0, error_rate=0.0,
+                 drop_rate=0.0, seed=None, verbose=False):
+        super().__init__(address, DropboxHandler)
+        self.dropbox = dropbox
+        self.latency = latency                    # ms per request
+        self.latency_per_object = latency_per_object  # ms per SAMPLE/EXPERIMENT/RUN
+        self.jitter = jitter                      # ms, uniform ±
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.verbose = verbose
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Local mock of the ENA dropbox with latency and error injection.")
+    parser.add_argument("--host", help="Address to listen on.", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089, help="Port to listen on.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Milliseconds per request.")
+    parser.add_argument("--latency-per-object", type=float, default=0.0, help="Additional milliseconds per object.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random ± milliseconds added to every response.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 5xx error.")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of connections closed without an answer.")
+    parser.add_argument("--test", action="store_true", help="Answer like the test dropbox (TEST receipts, nothing kept).")
+    parser.add_argument("--stateless", action="store_true", help="Accept every ADD, also of aliases already added.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the injected latency and errors.")
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+
+    # Parse arguments
+    args = parser.parse_args()
+    server = MockDropbox((args.host, args.port), Dropbox(args.stateless, args.test), args.latency,
+                         args.latency_per_object, args.jitter, args.error_rate, args.drop_rate, args.seed, args.verbose)
+    print(f"    Mock dropbox on http://{args.host}:{args.port}/ena/submit/drop-box/submit/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"    {server.dropbox.requests} submissions, {server.dropbox.objects} objects received.")
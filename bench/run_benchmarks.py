@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench.synthetic import synthetic_sam_rows, synthetic_runexp_rows, write_tsv
+
+"""
+Usage: run_benchmarks.py [-h] [-n ROWS [ROWS ...]] [-c CONVERTER [CONVERTER ...]] [--seed SEED] [--repeat N]
+                         [-o OUTPUT] [--compare BASELINE] [--tolerance FRACTION] [--workdir DIR] [--keep]
+
+Benchmark every tsv2XML on seeded synthetic data (bench/synthetic.py) and save the results as JSON.
+
+For every row count and converter, tsv2XML runs in a fresh process and reports
+  - throughput:  input rows per second (best of --repeat runs, default 3)
+  - peak RSS:    maximum resident memory of the process, and the RSS before the conversion started
+  - output size: total bytes of the XML written
+
+    python3 bench/run_benchmarks.py -n 1e3 1e4 1e5 1e6 -o bench_results.json
+    python3 bench/run_benchmarks.py -n 1e5 --compare bench_results.json    # exit 1 on a regression
+
+With --compare, only measurements of at least MIN_COMPARE_ROWS rows can count as a regression:
+smaller runs take milliseconds and are dominated by interpreter and lxml startup noise, so their
+ratios are printed but not checked.
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_REPEAT = 3
+MIN_COMPARE_ROWS = 100000   # smaller runs are too short to compare
+
+# converter: (module, input TSV, output files)
+CONVERTERS = {
+    "sam": ("samSubmit.create_sam_xml", "sam.tsv", ("sam.xml",)),
+    "exp": ("exp.create_exp_xml", "runExp.tsv", ("exp.xml",)),
+    "run": ("run.create_run_xml", "runExp.tsv", ("run.xml",)),
+    "runexp": ("runExpSubmit.create_runexp_xml", "runExp.tsv", ("exp.xml", "run.xml")),
+}
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process in bytes.
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def measure(converter, tsvInFile, workdir):
+    """
+    Run one converter's tsv2XML (in a fresh worker process) and return its measurements.
+    """
+    module, _, outputs = CONVERTERS[converter]
+    tsv2XML = importlib.import_module(module).tsv2XML
+    outFiles = [os.path.join(workdir, f"{converter}.{output}") for output in outputs]
+
+    # the converters print per-line warnings
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        baseline = peak_rss()
+        start = time.perf_counter()
+        tsv2XML(tsvInFile, *outFiles)
+        seconds = time.perf_counter() - start
+        peak = peak_rss()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    output_bytes = sum(os.path.getsize(outFile) for outFile in outFiles)
+    for outFile in outFiles:
+        os.remove(outFile)
+    return {"seconds": seconds, "baseline_rss_bytes": baseline, "peak_rss_bytes": peak, "output_bytes": output_bytes}
+
+
+def run_benchmark(converter, rows, tsvInFile, workdir, repeat=DEFAULT_REPEAT):
+    """
+    Measure one converter `repeat` times, each in a new process. Returns the result record.
+    """
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            runs.append(executor.submit(measure, converter, tsvInFile, workdir).result())
+    seconds = min(run["seconds"] for run in runs)
+    return {
+        "converter": converter,
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds, 1),
+        "peak_rss_mb": round(max(run["peak_rss_bytes"] for run in runs) / 1024 ** 2, 1),
+        "baseline_rss_mb": round(min(run["baseline_rss_bytes"] for run in runs) / 1024 ** 2, 1),
+        "input_bytes": os.path.getsize(tsvInFile),
+        "output_bytes": runs[0]["output_bytes"],
+    }
+
+
+def environment(seed, repeat):
+    """
+    Describe the machine and code version the results were measured on.
+    """
+    try:
+        commit = subprocess.run(["git", "-C", REPO_DIR, "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "lxml": ".".join(map(str, etree.LXML_VERSION)),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "repeat": repeat,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a previous results file.
+    Returns a list of regression messages (throughput down or peak RSS up by more than `tolerance`),
+    for the measurements of at least MIN_COMPARE_ROWS rows.
+    """
+    previous = {(record["converter"], record["rows"]): record for record in baseline["results"]}
+    version = baseline["environment"].get("commit") or baseline["environment"].get("timestamp")
+    regressions = []
+    for record in results:
+        old = previous.get((record["converter"], record["rows"]))
+        if old is None:
+            continue
+        speed = record["rows_per_sec"] / old["rows_per_sec"]
+        memory = record["peak_rss_mb"] / old["peak_rss_mb"]
+        checked = record["rows"] >= MIN_COMPARE_ROWS
+        print(f"    {record['converter']:>7} {record['rows']:>9}: {speed:6.2f}x rows/s, {memory:6.2f}x peak RSS "
+              f"(vs {version})" + ("" if checked else f", not checked (fewer than {MIN_COMPARE_ROWS} rows)"))
+        if not checked:
+            continue
+        if speed < 1 - tolerance:
+            regressions.append(f"{record['converter']} at {record['rows']} rows: throughput {speed:.2f}x")
+        if memory > 1 + tolerance:
+            regressions.append(f"{record['converter']} at {record['rows']} rows: peak RSS {memory:.2f}x")
+    return regressions
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Benchmark the TSV -> XML converters on seeded synthetic data.")
+    parser.add_argument("-n", "--rows", nargs="+", type=lambda value: int(float(value)), default=[1000, 10000, 100000],
+                        help="Row counts to benchmark, e.g. 1e3 1e4 1e5 1e6 1e7.")
+    parser.add_argument("-c", "--converters", nargs="+", choices=list(CONVERTERS), default=list(CONVERTERS),
+                        help="Converters to benchmark.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic data.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per measurement (the fastest is kept).")
+    parser.add_argument("-o", "--output", help="Results JSON file.", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous results JSON to check for regressions.", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Allowed throughput drop / peak RSS growth before a change counts as a regression "
+                             f"(checked from {MIN_COMPARE_ROWS} rows on).")
+    parser.add_argument("--workdir", help="Directory for the generated TSV and XML files (default: a temporary one).",
+                        default=None)
+    parser.add_argument("--keep", action="store_true", help="Keep the generated TSV files.")
+
+    # Parse arguments
+    args = parser.parse_args()
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare, 'r') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"    Error: Cannot read '{args.compare}': {e}")
+            sys.exit(1)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    try:
+        for rows in args.rows:
+            inputs = {
+                "sam.tsv": synthetic_sam_rows(rows, args.seed),
+                "runExp.tsv": synthetic_runexp_rows(rows, args.seed),
+            }
+            tsvInFiles = {}
+            for name, lines in inputs.items():
+                if any(CONVERTERS[converter][1] == name for converter in args.converters):
+                    tsvInFiles[name] = os.path.join(workdir, f"{rows}.{name}")
+                    write_tsv(tsvInFiles[name], lines)
+
+            for converter in args.converters:
+                record = run_benchmark(converter, rows, tsvInFiles[CONVERTERS[converter][1]], workdir, args.repeat)
+                results.append(record)
+                print(f"    {converter:>7} {rows:>9} rows: {record['seconds']:9.2f} s {record['rows_per_sec']:10.0f} rows/s "
+                      f"{record['peak_rss_mb']:8.1f} MiB peak RSS {record['output_bytes'] / 1024 ** 2:9.1f} MiB output")
+
+            if not args.keep:
+                for tsvInFile in tsvInFiles.values():
+                    os.remove(tsvInFile)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump({"environment": environment(args.seed, args.repeat), "results": results}, f, indent=2)
+        f.write("\n")
+    print(f"    Results written to '{args.output}'.")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"    Error: regression: {message}.")
+        if regressions:
+            sys.exit(1)
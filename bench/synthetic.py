@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import random
+
+"""
+Usage: synthetic.py [-h] [-n ROWS] [--seed SEED] [-o OUTDIR]
+
+Seeded generator of realistic synthetic metadata for the benchmarks:
+  - sam.tsv     16 columns, like samSubmit/sam.tsv (header included)
+  - runExp.tsv  5 columns, like runExpSubmit/runExp.tsv, one experiment/run per sample
+
+The rows look like real batches: most INSDC accessions, regions, isolation sources and disease
+outcomes are IGNORE'd, about a third of the coordinates are "not collected", and hosts, regions
+and titles repeat from small pools. The same seed always gives the same files.
+
+    python3 bench/synthetic.py -n 1000000 -o /tmp/bench
+"""
+
+SAM_HEADER = (
+    "INSDC accession", "sample_title", "isolate", "collection_date", "alias", "region and locality",
+    "host_sex", "Host Scientific Name", "Host Common Name", "isolation source host-associated",
+    "geographic location (latitude)", "geographic location (longitude)", "host disease outcome",
+    "host health status", "host subject id", "Publication",
+)
+
+TITLES = (
+    "Usutu virus in blood donors",
+    "Usutu virus in mosquitoes",
+    "Usutu virus in free-ranging birds",
+    "Usutu virus in birds in captivity",
+    "Usutu virus in wildlife",
+)
+
+# (host scientific name, host common name, isolation sources)
+HOSTS = (
+    ("Homo sapiens", "human", ("blood", "plasma")),
+    ("Culex pipiens", "common house mosquito", ("mosquito pool",)),
+    ("Turdus merula", "Eurasian blackbird", ("brain", "kidney", "liver")),
+    ("Strix nebulosa", "great grey owl", ("brain", "spleen")),
+    ("Passer domesticus", "house sparrow", ("brain", "heart")),
+)
+
+REGIONS = ("Utrecht", "Gelderland", "Noord-Brabant", "Zuid-Holland", "Noord-Holland", "Overijssel", "Limburg")
+HOST_SEX = ("male", "female", "not collected", "not applicable")
+HEALTH_STATES = ("diseased", "healthy", "not collected")
+DISEASE_OUTCOMES = ("dead", "recovered")
+PUBLICATIONS = ("greatpaper_123", "not applicable")
+
+# INSTRUMENT_MODEL values accepted by the ENA schema for OXFORD_NANOPORE, weighted by use
+PLATFORMS = ("MinION",) * 6 + ("GridION",) * 3 + ("PromethION",)
+
+BARCODES = 96  # samples per sequencing run
+
+
+def sample_alias(i):
+    """
+    Alias of synthetic sample i, in the repo's ran<run>_bike<barcode> style.
+    """
+    return f"ran{80000 + i // BARCODES}_bike{i % BARCODES + 1:02d}"
+
+
+def synthetic_sam_rows(n_rows, seed=0):
+    """
+    Yield the header and `n_rows` complete sam.tsv lines.
+    """
+    rng = random.Random(seed)
+    yield "\t".join(SAM_HEADER) + "\n"
+    for i in range(n_rows):
+        year = 2016 + rng.randrange(7)
+        host_sc, host_comm, sources = rng.choice(HOSTS)
+        if rng.random() < 0.3:
+            lat = long = "not collected"
+        else:
+            lat, long = f"{rng.uniform(50.75, 53.55):.4f}", f"{rng.uniform(3.36, 7.23):.4f}"
+        yield "\t".join((
+            f"SAMEA{7000000 + i}" if rng.random() < 0.1 else "IGNORE",
+            rng.choice(TITLES),
+            f"USUV/NL/{year}/{sample_alias(i)}",
+            f"{year}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+            sample_alias(i),
+            rng.choice(REGIONS) if rng.random() < 0.6 else "IGNORE",
+            rng.choice(HOST_SEX),
+            host_sc,
+            host_comm,
+            rng.choice(sources) if rng.random() < 0.5 else "IGNORE",
+            lat,
+            long,
+            rng.choice(DISEASE_OUTCOMES) if rng.random() < 0.3 else "IGNORE",
+            rng.choice(HEALTH_STATES),
+            f"{host_comm.split()[-1]}_{rng.randrange(n_rows)}",
+            rng.choice(PUBLICATIONS),
+        )) + "\n"
+
+
+def synthetic_runexp_rows(n_rows, seed=0):
+    """
+    Yield `n_rows` runExp.tsv lines (sample alias, experiment alias, fastq, md5, platform),
+    referencing the samples of synthetic_sam_rows().
+    """
+    rng = random.Random(seed + 1)
+    for i in range(n_rows):
+        alias = sample_alias(i)
+        run = 80000 + i // BARCODES
+        barcode = i % BARCODES + 1
+        yield "\t".join((
+            alias,
+            f"fly_{alias}",
+            f"ran{run}_BC{barcode:02d}.fastq.gz",
+            f"{rng.getrandbits(128):032x}",
+            rng.choice(PLATFORMS),
+        )) + "\n"
+
+
+def write_tsv(path, rows):
+    """
+    Write generated lines to `path` in large blocks. Returns the file size in bytes.
+    """
+    with open(path, 'w', buffering=1024 * 1024) as f:
+        f.writelines(rows)
+    return os.path.getsize(path)
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Generate seeded synthetic sam.tsv and runExp.tsv files.")
+    parser.add_argument("-n", "--rows", type=lambda value: int(float(value)), default=1000,
+                        help="Number of samples (and experiments/runs), e.g. 1e6.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    parser.add_argument("-o", "--outdir", help="Output directory.", default=".")
+
+    # Parse arguments
+    args = parser.parse_args()
+    os.makedirs(args.outdir, exist_ok=True)
+    for name, rows in (("sam.tsv", synthetic_sam_rows(args.rows, args.seed)),
+                       ("runExp.tsv", synthetic_runexp_rows(args.rows, args.seed))):
+        path = os.path.join(args.outdir, name)
+        size = write_tsv(path, rows)
+        print(f"    {args.rows} rows written to '{path}' ({size / 1024 ** 2:.1f} MiB).")
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.receipts import AccessionIndex, DEFAULT_INDEX
+
+"""
+Usage: aliases.py [-h] [--index INDEX] {build,check} ...
+
+Duplicate-alias detection for the converters (--check-aliases).
+
+ENA rejects a whole submission if one alias was already submitted or appears twice. While the
+converters stream the rows, every SAMPLE/EXPERIMENT/RUN alias is checked
+  - against the aliases earlier in the same file (kept as a set of 64-bit alias hashes, not the
+    alias strings), and
+  - against all aliases submitted before: the alias -> accession index (accessions.sqlite, filled
+    from the receipts by common/receipts.py) is the exact on-disk history; a Bloom filter built
+    from it (accessions.sqlite.bloom, ~1.8 bytes per alias at a 0.1 % false positive rate) answers
+    almost every "never submitted" alias without touching the database.
+The Bloom filter is rebuilt (one streaming pass over the index) whenever the index has changed.
+Aliases in the delta manifest are expected to be submitted again (MODIFY) and are not reported.
+
+    python3 common/aliases.py build                    # (re)build the Bloom filter
+    python3 common/aliases.py check SAMPLE ran80849_bike18
+"""
+
+BLOOM_ERROR_RATE = 0.001
+BLOOM_MIN_CAPACITY = 10000
+
+
+def alias_digest(object_type, alias):
+    """
+    16-byte hash of an (object type, alias) pair: the Bloom filter positions and the in-file key.
+    """
+    return hashlib.blake2b(f"{object_type}\t{alias}".encode("UTF-8"), digest_size=16).digest()
+
+
+class BloomFilter:
+    """
+    Bloom filter over alias digests (double hashing of the two 64-bit halves of the digest).
+    """
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE, stamp=None):
+        capacity = max(capacity, BLOOM_MIN_CAPACITY)
+        self.n_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+        self.stamp = stamp  # state of the index the filter was built from
+
+    def _positions(self, digest):
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        n_bits = self.n_bits
+        return [(h1 + i * h2) % n_bits for i in range(self.n_hashes)]
+
+    def add(self, digest):
+        bits = self.bits
+        for position in self._positions(digest):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest):
+        bits = self.bits
+        for position in self._positions(digest):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def save(self, path):
+        tmp_file = path + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(json.dumps({"n_bits": self.n_bits, "n_hashes": self.n_hashes, "stamp": self.stamp}).encode() + b"\n")
+            f.write(self.bits)
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+            bloom = cls.__new__(cls)
+            bloom.n_bits = header["n_bits"]
+            bloom.n_hashes = header["n_hashes"]
+            bloom.stamp = header["stamp"]
+            bloom.bits = bytearray(f.read())
+        if len(bloom.bits) != (bloom.n_bits + 7) // 8:
+            raise ValueError(f"'{path}' is truncated")
+        return bloom
+
+
+class AliasHistory:
+    """
+    All submitted (object type, alias) pairs: the accession index, with a Bloom filter in front.
+    """
+
+    def __init__(self, index_file=DEFAULT_INDEX):
+        self.index = AccessionIndex(index_file)
+        self.bloom_file = index_file + ".bloom"
+        self.lookups = 0          # aliases checked
+        self.exact_lookups = 0    # aliases the Bloom filter could not rule out
+        self.bloom = self._load_bloom()
+
+    def _stamp(self):
+        # row count and last change of the index; any new receipt changes it
+        count, last = self.index.db.execute("SELECT count(*), max(indexed_at) FROM accessions").fetchone()
+        return [count, last]
+
+    def _load_bloom(self):
+        stamp = self._stamp()
+        try:
+            bloom = BloomFilter.load(self.bloom_file)
+            if bloom.stamp == stamp:
+                return bloom
+        except (OSError, ValueError):
+            pass
+        return self.build(stamp)
+
+    def build(self, stamp=None):
+        """
+        Rebuild the Bloom filter from the index in one streaming pass and save it.
+        """
+        stamp = stamp or self._stamp()
+        bloom = BloomFilter(stamp[0], stamp=stamp)
+        for object_type, alias in self.index.db.execute("SELECT object_type, alias FROM accessions"):
+            bloom.add(alias_digest(object_type, alias))
+        try:
+            bloom.save(self.bloom_file)
+        except OSError:
+            pass  # a read-only index still works, the filter is just rebuilt next time
+        self.bloom = bloom
+        return bloom
+
+    def submitted(self, object_type, alias, digest=None):
+        """
+        Return the accession if the alias was submitted before, else None.
+        """
+        self.lookups += 1
+        if (digest or alias_digest(object_type, alias)) not in self.bloom:
+            return None
+        self.exact_lookups += 1
+        return self.index.lookup(object_type, alias)
+
+    def close(self):
+        self.index.close()
+
+
+class AliasCheckingWriter:
+    """
+    Wrap a set writer and report aliases that were submitted before or repeat within the file.
+
+    Errors are printed with the source TSV line and counted in `duplicates`; elements are
+    written either way so that all problems are reported in one run. Aliases in `allowed`
+    (the delta manifest of the object type) are re-submissions on purpose.
+    """
+
+    def __init__(self, writer, history=None, source=None, allowed=None):
+        self.writer = writer
+        self.history = history
+        self.source = source
+        self.allowed = allowed if allowed is not None else {}
+        self.seen = set()  # 64-bit hashes of the aliases written so far
+        self.duplicates = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def _report(self, element, line, message):
+        self.duplicates += 1
+        where = f"line {line}" if line else "unknown line"
+        if self.source:
+            where = f"{os.path.basename(self.source)} {where}"
+        print(f"Error: {where} ({element.tag} '{element.get('alias')}'): {message}")
+
+    def write(self, element, line=None):
+        object_type = element.tag
+        alias = element.get("alias")
+        digest = alias_digest(object_type, alias)
+        key = int.from_bytes(digest[:8], "little")
+        if key in self.seen:
+            self._report(element, line, "alias appears more than once in this file")
+        else:
+            self.seen.add(key)
+            if self.history is not None and alias not in self.allowed:
+                accession = self.history.submitted(object_type, alias, digest)
+                if accession:
+                    self._report(element, line, f"alias was already submitted ({accession})")
+        self.writer.write(element, line)
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Bloom-filtered history of submitted aliases.")
+    parser.add_argument("--index", help="Alias -> accession index (default: accessions.sqlite).", default=DEFAULT_INDEX)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="(Re)build the Bloom filter from the index.")
+    check_parser = subparsers.add_parser("check", help="Check whether aliases were submitted before.")
+    check_parser.add_argument("object_type", choices=["SAMPLE", "EXPERIMENT", "RUN"])
+    check_parser.add_argument("alias", nargs="+")
+
+    # Parse arguments
+    args = parser.parse_args()
+    history = AliasHistory(args.index)
+    if args.command == "build":
+        bloom = history.build()
+        print(f"    Bloom filter of {bloom.stamp[0]} aliases ({len(bloom.bits)} bytes, {bloom.n_hashes} hashes) "
+              f"written to '{history.bloom_file}'.")
+    else:
+        for alias in args.alias:
+            accession = history.submitted(args.object_type, alias)
+            print(f"    {alias}: {'submitted as ' + accession if accession else 'not submitted'}")
+    history.close()
@@ -0,0 +1,513 @@
+import json
+import os
+import string
+from copy import deepcopy
+from functools import lru_cache
+from itertools import chain
+from operator import itemgetter
+
+from lxml import etree
+
+from common.compression import open_input
+from common.metrics import active_metrics
+from common.normalize import Normalizer
+
+"""
+Declarative checklist engine behind the TSV -> XML converters.
+
+A checklist config (JSON, see common/checklists/usutu_ont.json) describes
+  - constants:  center name, study accession, taxon, checklist, ... (usable as {name} in templates)
+  - tables:     the TSV layouts, as {field name: header name} in the default column order, and the
+                normalizers of repeated values ({field: "text"/"date"/"coordinate"/{"vocabulary": ...}},
+                see common/normalize.py), applied to the row values before anything is derived
+  - objects:    per object type (SAMPLE, EXPERIMENT, RUN) the table it is built from, the required
+                fields, derived values and the XML template
+
+Templates are nested lists: [tag, {attributes}, child or text, ...]. Text, attribute values and tags
+may contain {field} placeholders. An element with {"@optional": field} is left out when that field is
+empty or the ignore value; an attribute whose value renders empty is left out.
+
+Derived values (evaluated in order, each usable by the following ones and the template):
+  {"contains": field, "cases": [[keyword, value], ...], "default": value}   first keyword found in field
+  {"map": field, "cases": {key: value}, "default": value}                   exact lookup
+  {"lookup": table, "key": field, "default": value}                         runtime table (e.g. checksums)
+  {"accession": TYPE, "alias": field, "given": field}                       given value, else accession index
+  {"unless": field, "value": value}                                         empty when field is set
+Values are templates as well ("{md5}").
+
+Columns are resolved once per file by header name, so their order may change and a data value
+containing "alias" is no longer mistaken for a header. Files without a header (runExp.tsv) use the
+default column order. Each object type compiles into an Emitter that deep-copies a prebuilt template
+and fills in only the per-row values.
+"""
+
+CHECKLIST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "checklists")
+DEFAULT_CHECKLIST = os.path.join(CHECKLIST_DIR, "usutu_ont.json")
+
+PLACEHOLDER_TAG = "PLACEHOLDER"
+
+
+class ChecklistError(Exception):
+    """
+    Invalid checklist config or a TSV that does not match it.
+    """
+
+
+def normalize_header(name):
+    """
+    "Host Scientific Name", "host_scientific_name" -> "host scientific name"
+    """
+    return " ".join(name.replace("_", " ").lower().split())
+
+
+class Layout:
+    """
+    Column positions of one TSV file: {field name: column index}.
+    Plain data, so it can be passed to shard worker processes.
+    """
+
+    def __init__(self, table, indices, n_fields, header=None):
+        self.table = table
+        self.indices = indices      # field name -> column index
+        self.n_fields = n_fields    # expected number of tab-separated values per row
+        self.header = header        # header line (stripped), skipped wherever it occurs
+
+    def __repr__(self):
+        return f"Layout({self.table!r}, {self.indices!r}, {self.n_fields}, header={self.header is not None})"
+
+
+def compile_value(template, names, constants):
+    """
+    Compile a "{field} text" template against the row value names.
+    Returns ("const", text), ("field", index) or ("format", [(literal, index or None), ...]).
+    """
+    parts = []
+    for literal, field, _, _ in string.Formatter().parse(template):
+        if field is None:
+            parts.append((literal, None))
+        elif field in constants:
+            parts.append((literal + constants[field], None))
+        elif field in names:
+            parts.append((literal, names[field]))
+        else:
+            raise ChecklistError(f"unknown field '{{{field}}}' in '{template}'")
+    if all(index is None for _, index in parts):
+        return ("const", "".join(literal for literal, _ in parts))
+    if len(parts) == 1 and not parts[0][0]:
+        return ("field", parts[0][1])
+    return ("format", parts)
+
+
+def render(compiled, values):
+    """
+    Render a compiled value for one row.
+    """
+    kind, data = compiled
+    if kind == "field":
+        return values[data]
+    if kind == "const":
+        return data
+    return "".join(literal if index is None else literal + values[index] for literal, index in data)
+
+
+def _tuple_getter(indices):
+    """
+    itemgetter that always returns a tuple (also of zero or one item).
+    """
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda values: (values[index],)
+    if not indices:
+        return lambda values: ()
+    return itemgetter(*indices)
+
+
+class Emitter:
+    """
+    Compiled builder of one object type for one TSV layout.
+    """
+
+    def __init__(self, checklist, object_type, layout, accessions=None, lookups=None):
+        spec = checklist.objects[object_type]
+        table_fields = list(checklist.tables[spec["table"]])
+        self.object_type = object_type
+        self.ignore = checklist.ignore_value
+        self.accessions = accessions
+        self.lookups = lookups or {}
+        self.normalizer = checklist.normalizer(spec["table"])
+
+        # row values: the table fields (in config order), then the derived values
+        self.columns = [layout.indices[field] for field in table_fields]
+        self.getter = itemgetter(*self.columns)
+        self.names = {field: index for index, field in enumerate(table_fields)}
+        self.normalize = [(self.names[field], field) for field in self.normalizer.fields] if self.normalizer else []
+        self.derived = []
+        for name, derivation in spec.get("derived", {}).items():
+            self.derived.append(self._compile_derived(derivation, checklist.constants))
+            self.names[name] = len(self.names)
+        self.required = [self.names[field] for field in spec.get("required", table_fields)]
+
+        # template with the constant parts filled in; slots hold the per-row parts
+        self.slots = []       # (path, kind, attribute name, compiled value)
+        self.optional = []    # (path, value index), removed when the value is empty or ignored
+        self.template = self._build(spec["template"], (), checklist.constants)
+        self.optional.sort(reverse=True)  # remove from the end so earlier paths stay valid
+
+    def _compile_derived(self, derivation, constants):
+        def field(name):
+            if name not in self.names:
+                raise ChecklistError(f"{self.object_type}: unknown field '{name}'")
+            return self.names[name]
+
+        def value(template):
+            return compile_value(template, self.names, constants)
+
+        if "contains" in derivation:
+            index = field(derivation["contains"])
+            cases = [(keyword, value(result)) for keyword, result in derivation["cases"]]
+            default = value(derivation.get("default", ""))
+
+            def derive(values):
+                text = values[index]
+                for keyword, result in cases:
+                    if keyword in text:
+                        return render(result, values)
+                return render(default, values)
+
+        elif "map" in derivation:
+            index = field(derivation["map"])
+            cases = {key: value(result) for key, result in derivation["cases"].items()}
+            default = value(derivation.get("default", ""))
+
+            def derive(values):
+                return render(cases.get(values[index], default), values)
+
+        elif "lookup" in derivation:
+            table = derivation["lookup"]
+            index = field(derivation["key"])
+            default = value(derivation.get("default", ""))
+
+            def derive(values):
+                lookup = self.lookups.get(table)
+                if lookup is not None:
+                    result = lookup.get(values[index])
+                    if result is not None:
+                        return result
+                return render(default, values)
+
+        elif "accession" in derivation:
+            object_type = derivation["accession"]
+            index = field(derivation["alias"])
+            given = field(derivation["given"]) if "given" in derivation else None
+
+            def derive(values):
+                if given is not None and values[given] and values[given] != self.ignore:
+                    return values[given]
+                if self.accessions is None:
+                    return ""
+                return self.accessions.lookup(object_type, values[index]) or ""
+
+        elif "unless" in derivation:
+            index = field(derivation["unless"])
+            result = value(derivation["value"])
+
+            def derive(values):
+                return "" if values[index] else render(result, values)
+
+        else:
+            raise ChecklistError(f"{self.object_type}: unknown derived value {derivation}")
+        return derive
+
+    def _build(self, node, path, constants, parent=None):
+        if not isinstance(node, list) or not node or not isinstance(node[0], str):
+            raise ChecklistError(f"{self.object_type}: template elements are [tag, ...], got {node!r}")
+        tag, children = node[0], node[1:]
+        attributes = children.pop(0) if children and isinstance(children[0], dict) else {}
+
+        compiled_tag = compile_value(tag, self.names, constants)
+        element_tag = compiled_tag[1] if compiled_tag[0] == "const" else PLACEHOLDER_TAG
+        element = etree.Element(element_tag) if parent is None else etree.SubElement(parent, element_tag)
+        if compiled_tag[0] != "const":
+            self.slots.append((path, "tag", None, compiled_tag))
+
+        for name, template in attributes.items():
+            if name == "@optional":
+                if template not in self.names:
+                    raise ChecklistError(f"{self.object_type}: unknown optional field '{template}'")
+                self.optional.append((path, self.names[template]))
+                continue
+            compiled = compile_value(template, self.names, constants)
+            element.set(name, compiled[1] if compiled[0] == "const" else "")
+            if compiled[0] != "const":
+                self.slots.append((path, "attribute", name, compiled))
+
+        position = 0
+        for child in children:
+            if isinstance(child, str):
+                compiled = compile_value(child, self.names, constants)
+                if compiled[0] == "const":
+                    element.text = compiled[1]
+                else:
+                    self.slots.append((path, "text", None, compiled))
+            else:
+                self._build(child, path + (position,), constants, element)
+                position += 1
+        return element
+
+    def row_values(self, fields, n_derived=None):
+        """
+        The values of one row (normalized table fields, then derived values, indexed by `names`),
+        or None if a required value is empty. Only the first `n_derived` derived values are computed
+        if it is given.
+        """
+        values = list(self.getter(fields))
+        if self.normalize:
+            normalizers = self.normalizer.fields
+            for index, field in self.normalize:
+                values[index] = normalizers[field](values[index])
+        for derive in self.derived[:n_derived]:
+            values.append(derive(values))
+        for index in self.required:
+            if not values[index]:
+                return None
+        return values
+
+    def selector(self, fields):
+        """
+        Function returning the values of `fields` (names) for one row, or None if the row is skipped,
+        like row_values but without building the row: only the requested columns are normalized.
+        A normalizer turns a value blank if and only if it is blank already (common/normalize.py),
+        so the other required columns are only checked for blanks. Derived values are computed
+        (through row_values) only if one is requested or required.
+        """
+        n_table = len(self.columns)
+        wanted = [self.names[field] for field in fields]
+        n_derived = max([index - n_table + 1 for index in wanted + self.required if index >= n_table], default=0)
+        if n_derived:
+            def select_derived(row):
+                values = self.row_values(row, n_derived)
+                return None if values is None else [values[index] for index in wanted]
+
+            return select_derived
+
+        normalized = dict(self.normalize)
+        normalizers = self.normalizer.fields if self.normalizer else {}
+        others = [index for index in self.required if index not in wanted]
+        blank = _tuple_getter([self.columns[index] for index in others if index not in normalized])
+        stripped = _tuple_getter([self.columns[index] for index in others if index in normalized])
+        read = _tuple_getter([self.columns[index] for index in wanted])
+        normalize = [(position, normalizers[normalized[index]]) for position, index in enumerate(wanted)
+                     if index in normalized]
+        wanted_required = _tuple_getter([position for position, index in enumerate(wanted) if index in self.required])
+
+        def select(row):
+            if not all(blank(row)) or not all(map(str.strip, stripped(row))):
+                return None
+            values = list(read(row))
+            for position, function in normalize:
+                values[position] = function(values[position])
+            if not all(wanted_required(values)):
+                return None
+            return values
+
+        return select
+
+    def emit(self, fields):
+        """
+        Build the element for the TSV fields of one row, or return None if a required value is empty.
+        """
+        values = self.row_values(fields)
+        if values is None:
+            return None
+
+        element = deepcopy(self.template)
+        for path, kind, name, compiled in self.slots:
+            node = element
+            for position in path:
+                node = node[position]
+            value = render(compiled, values)
+            if kind == "text":
+                node.text = value
+            elif kind == "attribute":
+                if value:
+                    node.set(name, value)
+                else:
+                    del node.attrib[name]
+            else:
+                node.tag = value
+
+        for path, index in self.optional:
+            if not values[index] or values[index] == self.ignore:
+                parent = element
+                for position in path[:-1]:
+                    parent = parent[position]
+                del parent[path[-1]]
+        return element
+
+
+class Checklist:
+    """
+    A loaded checklist config.
+    """
+
+    def __init__(self, config, source=None):
+        self.source = source
+        self.name = config.get("name", source)
+        self.ignore_value = config.get("ignore_value", "IGNORE")
+        self.constants = config.get("constants", {})
+        self.tables = {name: table["columns"] for name, table in config["tables"].items()}
+        self.normalizers = {}  # table -> Normalizer, shared by its emitters (one set of caches per process)
+        for name, table in config["tables"].items():
+            spec = table.get("normalize")
+            if not spec:
+                continue
+            unknown = [field for field in spec if field not in self.tables[name]]
+            if unknown:
+                raise ChecklistError(f"{name}: cannot normalize unknown field(s) {', '.join(unknown)}")
+            try:
+                self.normalizers[name] = Normalizer(name, spec)
+            except ValueError as e:
+                raise ChecklistError(str(e))
+        self.objects = config["objects"]
+        for object_type, spec in self.objects.items():
+            if spec.get("table") not in self.tables:
+                raise ChecklistError(f"{object_type}: unknown table '{spec.get('table')}'")
+
+    def table_of(self, object_type):
+        return self.objects[object_type]["table"]
+
+    def normalizer(self, table):
+        return self.normalizers.get(table)
+
+    def layout(self, table, first_line=None):
+        """
+        Resolve the column positions of a TSV file from its first line.
+
+        The first line is the header if any of its values is one of the table's header names;
+        every field must then be present. Otherwise the file has no header and the columns are
+        in the default (config) order.
+        """
+        columns = self.tables[table]
+        fields = first_line.strip().split('\t') if first_line and first_line.strip() else []
+        headers = [normalize_header(field) for field in fields]
+        wanted = {normalize_header(header): field for field, header in columns.items()}
+
+        if not any(header in wanted for header in headers):
+            return Layout(table, {field: index for index, field in enumerate(columns)}, len(columns))
+
+        indices = {}
+        for index, header in enumerate(headers):
+            if header in wanted and wanted[header] not in indices:
+                indices[wanted[header]] = index
+        missing = [columns[field] for field in columns if field not in indices]
+        if missing:
+            raise ChecklistError(f"{table} header is missing the column(s): {', '.join(missing)}")
+        return Layout(table, indices, len(fields), header=first_line.strip())
+
+    def layout_of_file(self, table, tsvInFile):
+        """
+        Resolve the layout of a TSV file from its first non-empty line.
+        """
+        with open_input(tsvInFile) as f:
+            for line in f:
+                if line.strip():
+                    return self.layout(table, line)
+        return self.layout(table)
+
+    def emitter(self, object_type, layout, accessions=None, lookups=None):
+        return Emitter(self, object_type, layout, accessions, lookups)
+
+
+@lru_cache(maxsize=None)
+def load_checklist(path=DEFAULT_CHECKLIST):
+    """
+    Load (once per process) and check a checklist config.
+    """
+    try:
+        with open(path, 'r', encoding="UTF-8") as f:
+            config = json.load(f)
+    except ValueError as e:
+        raise ChecklistError(f"{path}: {e}")
+    checklist = Checklist(config, path)
+    # compile every template once with the default layout to report config errors up front
+    for object_type in checklist.objects:
+        checklist.emitter(object_type, checklist.layout(checklist.table_of(object_type)))
+    return checklist
+
+
+def resolve_layout(checklist, table, lines):
+    """
+    Resolve the layout from the first line of `lines` (for callers without a file name).
+    Returns (layout, lines).
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return checklist.layout(table), []
+    return checklist.layout(table, first), chain([first], lines)
+
+
+def convert_rows(lines, first_line, layout, targets):
+    """
+    Shared row loop: split each TSV line once and emit one element per target.
+
+    `targets` is a list of (emitter, writer, label); the label names the object in warnings.
+    Returns (lines processed, [lines skipped per target]).
+    """
+    metrics = active_metrics()
+    if metrics is not None:
+        for emitter, _, _ in targets:
+            if emitter.normalizer is not None:
+                metrics.track_caches(emitter.normalizer)
+        lines = metrics.timed_lines(lines)
+        targets = [(metrics.timed_emitter(emitter), writer, label) for emitter, writer, label in targets]
+        mark = metrics.loop_started()
+        if metrics.profiler is not None:
+            metrics.profiler.enable()
+
+    line_counter = first_line - 1  # Last line number processed
+    skipped = [0] * len(targets)   # Lines that did not produce an element, per target
+    n_fields = layout.n_fields
+    header = layout.header
+
+    for line in lines:
+        line_counter += 1
+        line = line.strip()
+        fields = line.split('\t')
+
+        # skip empty or malformed lines (not the expected number of tab-separated values)
+        if not line or len(fields) != n_fields:
+            print(f"Warning: Skipping malformed or incomplete line {line_counter}.")
+            skipped = [count + 1 for count in skipped]
+            if metrics is not None:
+                for emitter, _, _ in targets:
+                    metrics.skip(emitter.object_type, "malformed")
+            continue
+
+        # skip the header (resolved by column name, wherever it is repeated)
+        if line == header:
+            print("Skipping header")
+            skipped = [count + 1 for count in skipped]
+            if metrics is not None:
+                for emitter, _, _ in targets:
+                    metrics.skip(emitter.object_type, "header")
+            continue
+
+        for target, (emitter, writer, label) in enumerate(targets):
+            element = emitter.emit(fields)
+            if element is None:
+                print(f"Warning: Line {line_counter} contains empty {label}values. Skipping.")
+                skipped[target] += 1
+                if metrics is not None:
+                    metrics.skip(emitter.object_type, "empty_values")
+                continue
+            # Serialize the element straight to disk (with its TSV line for validation reports)
+            writer.write(element, line_counter)
+
+    processed = line_counter - first_line + 1
+    if metrics is not None:
+        if metrics.profiler is not None:
+            metrics.profiler.disable()
+        metrics.loop_done(mark, layout.table, processed,
+                          {emitter.object_type: processed - count for (emitter, _, _), count in zip(targets, skipped)})
+    return processed, skipped
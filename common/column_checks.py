@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import os
+import re
+import sys
+from itertools import islice
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.compression import CompressionError, open_input
+from common.checklist import DEFAULT_CHECKLIST, ChecklistError, load_checklist
+from common.metrics import stage
+from common.normalize import MISSING_VALUES
+
+"""
+Usage: column_checks.py [-h] [--checklist CHECKLIST] [--chunk-bytes N] [--max-report N] [TSV]
+
+Bulk validation of sample metadata values, run before any XML is built.
+
+The TSV is read in large chunks. One compiled regex extracts the checked columns of every complete
+row of a chunk (in C, without splitting the other fields), the columns are transposed, and each
+column is validated as a whole: every distinct value is checked once, and rows are only looked at
+again for chunks with invalid values.
+Sample sheets repeat the same dates, vocabulary terms and missing-value terms on many rows, so this
+is much faster than checking row by row.
+
+Checks (ENA virus pathogen checklist ERC000033):
+  - collection date:  YYYY, YYYY-MM, YYYY-MM-DD (optionally with a time, or a range A/B),
+                      a real calendar date, not in the future, or an INSDC missing-value term
+  - latitude:         decimal degrees within [-90, 90], or a missing-value term
+  - longitude:        decimal degrees within [-180, 180], or a missing-value term
+  - host sex:         controlled vocabulary (the terms of the checklist config's normalize section)
+
+Rows are selected like create_sam_xml.py does (all fields non-empty, header skipped), with the
+columns found by their header names in the checklist config. Values are checked after the
+normalizers of the config (common/normalize.py), i.e. as they will be written to the XML.
+"""
+
+DEFAULT_SAM = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "samSubmit", "sam.tsv")
+
+CHUNK_BYTES = 16 * 1024 ** 2  # TSV text checked at once
+
+DATE_PATTERN = re.compile(
+    r"(\d{4})(?:-(\d{2})(?:-(\d{2})(?:T\d{2}:\d{2}(?::\d{2})?Z?(?:[+-]\d{1,2})?)?)?)?"
+)
+
+
+def check_date(value):
+    """
+    Return an error message for an invalid collection date, or None.
+    """
+    if value in MISSING_VALUES:
+        return None
+    today = datetime.date.today()
+    for part in value.split("/", 1):
+        match = DATE_PATTERN.fullmatch(part)
+        if not match:
+            return "not a date (YYYY, YYYY-MM or YYYY-MM-DD)"
+        year, month, day = (int(group) if group else 1 for group in match.groups())
+        try:
+            date = datetime.date(year, month, day)
+        except ValueError:
+            return "not a calendar date"
+        if date > today:
+            return "in the future"
+    return None
+
+
+def check_coordinate(value, limit):
+    """
+    Return an error message for an invalid latitude (limit 90) or longitude (limit 180), or None.
+    """
+    if value in MISSING_VALUES:
+        return None
+    try:
+        degrees = float(value)
+    except ValueError:
+        return "not a number in decimal degrees"
+    if not -limit <= degrees <= limit:
+        return f"outside [-{limit}, {limit}]"
+    return None
+
+
+def vocabulary_check(vocabulary):
+    """
+    Check returning an error message for a value outside `vocabulary`, or None.
+    """
+    def check_term(value):
+        if value in vocabulary:
+            return None
+        return "not one of " + ", ".join(sorted(vocabulary))
+
+    return check_term
+
+
+# sam table field: (attribute name, check)
+COLUMN_CHECKS = {
+    "collection_date": ("collection date", check_date),
+    "latitude": ("geographic location (latitude)", lambda value: check_coordinate(value, 90)),
+    "longitude": ("geographic location (longitude)", lambda value: check_coordinate(value, 180)),
+}
+VOCABULARY_CHECKS = {"host_sex": "host sex"}  # terms from the checklist's normalize section
+
+
+def column_checks(normalizer=None):
+    """
+    The checks of the sam table: COLUMN_CHECKS, plus the vocabulary fields whose terms the
+    checklist config declares.
+    """
+    checks = dict(COLUMN_CHECKS)
+    vocabularies = normalizer.vocabularies if normalizer else {}
+    for field, name in VOCABULARY_CHECKS.items():
+        if field in vocabularies:
+            checks[field] = (name, vocabulary_check(vocabularies[field]))
+    return checks
+
+
+class RowPattern:
+    """
+    Regex matching a complete row of a sam.tsv layout (all fields non-empty, not the header),
+    capturing the checked columns. `checks` lists (column, (name, check)) in capture order,
+    `normalize` the normalizer of a checked column.
+    """
+
+    def __init__(self, layout, normalizer=None):
+        checks = column_checks(normalizer)
+        # plain normalizers: every distinct value of a chunk is checked once anyway
+        self.normalize = {layout.indices[field]: normalize for field, normalize in normalizer.functions.items()
+                          if field in checks} if normalizer else {}
+        self.checks = sorted(((layout.indices[field], check) for field, check in checks.items()),
+                             key=lambda item: item[0])
+        captured = {column for column, _ in self.checks}
+        fields = [r"([^\t\n]+)" if column in captured else r"[^\t\n]+" for column in range(layout.n_fields)]
+        header = rf"(?![ \r]*{re.escape(layout.header)}[ \r]*$)" if layout.header else ""
+        self.regex = re.compile(r"^" + header + r"[ \r]*" + r"\t".join(fields) + r"[ \r]*$", re.MULTILINE)
+
+
+def check_chunk(lines, first_line, problems, pattern):
+    """
+    Check the value columns of one chunk of sam.tsv lines (starting at line `first_line`).
+    Adds {line number: [messages]} to `problems`; returns the number of rows checked.
+    """
+    # extract the checked columns of all complete rows in one regex pass (in C), then transpose them
+    rows = pattern.regex.findall("".join(lines))
+    columns = list(zip(*rows)) or [()] * len(pattern.checks)
+
+    errors = {}  # column -> (name, {invalid value: message})
+    for (column, (name, check)), values in zip(pattern.checks, columns):
+        invalid = {}
+        normalize = pattern.normalize.get(column)
+        for value in set(values):
+            message = check(normalize(value) if normalize else value)
+            if message:
+                invalid[value] = message
+        if invalid:
+            errors[column] = (name, invalid)
+
+    # find the lines of the invalid values (only for chunks with errors)
+    if errors:
+        for line_counter, line in enumerate(lines, first_line):
+            if not pattern.regex.match(line):
+                continue
+            fields = line.strip().split('\t')
+            for column, (name, invalid) in errors.items():
+                message = invalid.get(fields[column])
+                if message:
+                    problems.setdefault(line_counter, []).append(f"{name} '{fields[column]}' {message}")
+    return len(rows)
+
+
+@stage("check_values")
+def check_sam_tsv(tsvInFile, chunk_bytes=CHUNK_BYTES, checklist=DEFAULT_CHECKLIST):
+    """
+    Check the values of every sample row in a sam.tsv file.
+    Returns (rows checked, {line number: [messages]} sorted by line).
+    """
+    config = load_checklist(checklist)
+    pattern = RowPattern(config.layout_of_file("sam", tsvInFile), config.normalizer("sam"))
+    problems = {}
+    checked = 0
+    with open_input(tsvInFile) as f:
+        first_line = 1
+        while True:
+            lines = f.readlines(chunk_bytes)
+            if not lines:
+                break
+            checked += check_chunk(lines, first_line, problems, pattern)
+            first_line += len(lines)
+    return checked, dict(sorted(problems.items()))
+
+
+def print_report(tsvInFile, problems, max_report=50):
+    """
+    Print one line per row with problems (at most `max_report` rows).
+    """
+    for line_counter, messages in islice(problems.items(), max_report):
+        print(f"    Error: {os.path.basename(tsvInFile)} line {line_counter}: {'; '.join(messages)}.")
+    if len(problems) > max_report:
+        print(f"    ... {len(problems) - max_report} more rows with errors.")
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Check collection dates, coordinates and host sex of every row in sam.tsv."
+    )
+    parser.add_argument("tsv", nargs="?", help="Sample TSV.", default=DEFAULT_SAM)
+    parser.add_argument("--checklist", help="Checklist config defining the sam.tsv columns.", default=DEFAULT_CHECKLIST)
+    parser.add_argument("--chunk-bytes", type=int, default=CHUNK_BYTES, help="TSV bytes per column chunk.")
+    parser.add_argument("--max-report", type=int, default=50, help="Maximum number of rows reported.")
+
+    # Parse arguments
+    args = parser.parse_args()
+    try:
+        checked, problems = check_sam_tsv(args.tsv, args.chunk_bytes, args.checklist)
+    except FileNotFoundError:
+        print(f"    Error: The file '{args.tsv}' does not exist.")
+        sys.exit(1)
+    except (ChecklistError, CompressionError) as e:
+        print(f"    Error: {e}")
+        sys.exit(1)
+
+    print_report(args.tsv, problems, args.max_report)
+    print(f"    {checked} sample rows checked, {len(problems)} with invalid values.")
+    if problems:
+        sys.exit(1)
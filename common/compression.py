@@ -0,0 +1,194 @@
+import gzip
+import io
+import os
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for .zst files
+    zstandard = None
+
+"""
+Transparent compressed input and output, chosen by file extension.
+
+    open_input("sam.tsv.gz")       # text stream of the decompressed TSV
+    open_output("sam.xml.zst")     # binary stream, compressed on the fly
+
+`.gz` (gzip) and `.zst` (Zstandard, needs the `zstandard` package) are supported; any other
+name is opened as a plain file. (De)compression runs in a background thread, connected to the
+caller by a small queue of 1 MiB blocks, so the parse/serialize loop does not wait for zlib/zstd
+(both release the GIL while they work). gzip output has no timestamp, so the same XML always
+gives the same compressed bytes.
+"""
+
+COMPRESSION_EXTENSIONS = (".gz", ".zst")
+BLOCK_SIZE = 1024 ** 2   # bytes per block passed between the threads
+QUEUE_BLOCKS = 8         # blocks buffered between the threads
+GZIP_LEVEL = 1           # the XML is so repetitive that level 1 already gives ~20x
+ZSTD_LEVEL = 3
+
+
+class CompressionError(Exception):
+    """
+    A compressed file cannot be read or written (e.g. `.zst` without the zstandard package).
+    """
+
+
+def split_compression(path):
+    """
+    sam.xml.gz -> ("sam.xml", ".gz"); sam.xml -> ("sam.xml", "")
+    """
+    base, ext = os.path.splitext(path)
+    if ext in COMPRESSION_EXTENSIONS:
+        return base, ext
+    return path, ""
+
+
+def _require_zstandard(path):
+    if zstandard is None:
+        raise CompressionError(f"'{path}': .zst files need the zstandard package (pip install zstandard).")
+
+
+class _ThreadedReader(io.RawIOBase):
+    """
+    Raw stream of the decompressed bytes of a file, decompressed ahead by a background thread.
+    """
+
+    def __init__(self, path, ext):
+        if ext == ".zst":
+            _require_zstandard(path)
+        self._file = open(path, 'rb')
+        if ext == ".gz":
+            self._reader = gzip.GzipFile(fileobj=self._file, mode='rb')
+        else:
+            self._reader = zstandard.ZstdDecompressor().stream_reader(self._file, read_across_frames=True)
+        self._queue = queue.Queue(QUEUE_BLOCKS)
+        self._block = memoryview(b"")
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"decompress {os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                block = self._reader.read(BLOCK_SIZE)
+                self._queue.put(block)
+                if not block:
+                    break
+        except Exception as e:  # handed to the reading thread
+            self._queue.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._block:
+            if self._eof:
+                return 0
+            block = self._queue.get()
+            if isinstance(block, Exception):
+                self._eof = True
+                raise CompressionError(f"Cannot decompress '{self._file.name}': {block}") from block
+            if not block:
+                self._eof = True
+                return 0
+            self._block = memoryview(block)
+        size = min(len(buffer), len(self._block))
+        buffer[:size] = self._block[:size]
+        self._block = self._block[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            # unblock the thread if it is waiting for room in the queue
+            while self._thread.is_alive():
+                try:
+                    self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self._reader.close()
+            self._file.close()
+        super().close()
+
+
+class _ThreadedWriter(io.RawIOBase):
+    """
+    Raw stream whose bytes are compressed and written to a file by a background thread.
+    """
+
+    def __init__(self, path, ext):
+        if ext == ".zst":
+            _require_zstandard(path)
+        self._path = path
+        self._file = open(path, 'wb')
+        if ext == ".gz":
+            self._writer = gzip.GzipFile(fileobj=self._file, mode='wb', compresslevel=GZIP_LEVEL, mtime=0,
+                                         filename="")
+        else:
+            self._writer = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(self._file, closefd=False)
+        self._queue = queue.Queue(QUEUE_BLOCKS)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=f"compress {os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                block = self._queue.get()
+                if block is None:
+                    break
+                self._writer.write(block)
+            self._writer.close()
+        except Exception as e:  # reported to the writing thread
+            self._error = e
+            # keep draining so the writing thread never blocks on a full queue
+            while self._queue.get() is not None:
+                pass
+
+    def _check(self):
+        if self._error is not None:
+            raise CompressionError(f"Cannot compress '{self._path}': {self._error}") from self._error
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._check()
+        self._queue.put(bytes(data))
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._queue.put(None)
+            self._thread.join()
+            self._file.close()
+            super().close()
+            self._check()
+
+
+def open_input(path, mode='r'):
+    """
+    Open a file for reading ('r': UTF-8 text, 'rb': binary), decompressing `.gz`/`.zst` files on the fly.
+    """
+    ext = split_compression(path)[1]
+    if not ext:
+        if 'b' in mode:
+            return open(path, mode)
+        return open(path, mode, encoding="UTF-8")
+    stream = io.BufferedReader(_ThreadedReader(path, ext), BLOCK_SIZE)
+    if 'b' in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding="UTF-8")
+
+
+def open_output(path):
+    """
+    Open a binary file for writing, compressing it on the fly if it is named `*.gz`/`*.zst`.
+    """
+    ext = split_compression(path)[1]
+    if not ext:
+        return open(path, 'wb')
+    return io.BufferedWriter(_ThreadedWriter(path, ext), BLOCK_SIZE)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.receipts import AccessionIndex, DEFAULT_INDEX
+from common.compression import open_input
+from common.checklist import DEFAULT_CHECKLIST, ChecklistError, load_checklist
+
+"""
+Usage: integrity.py [-h] [--sam SAM] [--exp EXP] [--run RUN] [--accessions [INDEX]] [--checklist CHECKLIST] [--max-report N]
+
+Cross-object referential integrity check, run before any XML is generated or submitted.
+
+Builds hash-set indexes of the sample, experiment and run aliases in one linear pass over each
+TSV (the shared runExp.tsv is read once for both experiments and runs) and reports, with line numbers:
+  - dangling references: an experiment whose sample alias is not in sam.tsv,
+                         a run whose experiment alias is not in the experiment TSV
+  - duplicate aliases:   the same sample, experiment or run alias on more than one line
+  - orphaned samples:    samples not referenced by any experiment (warning only)
+
+References to objects already submitted (present in the accession index) are not dangling.
+Rows are selected exactly like the converters do: by field count and header, then by the
+required fields of the emitters compiled from the checklist config, so a row is indexed if and
+only if it becomes a SAMPLE, EXPERIMENT or RUN. Only the alias and reference columns are read and
+normalized (Emitter.selector), no row values or elements are built.
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SAM = os.path.join(REPO_DIR, "samSubmit", "sam.tsv")
+DEFAULT_RUNEXP = os.path.join(REPO_DIR, "runExpSubmit", "runExp.tsv")
+
+
+def iter_rows(tsvInFile, layout):
+    """
+    Yield (line number, fields) for the rows with the expected number of fields (not the header).
+    """
+    with open_input(tsvInFile) as f:
+        for line_counter, line in enumerate(f, 1):
+            line = line.strip()
+            fields = line.split('\t')
+            if len(fields) != layout.n_fields or line == layout.header:
+                continue
+            yield line_counter, fields
+
+
+def iter_objects(tsvInFile, layout, emitter, fields):
+    """
+    Yield (line number, values of `fields`) for the rows `emitter` turns into an object.
+    """
+    select = emitter.selector(fields)
+    for line_counter, row in iter_rows(tsvInFile, layout):
+        values = select(row)
+        if values is not None:
+            yield line_counter, values
+
+
+def index_aliases(rows, object_type, tsvInFile, problems):
+    """
+    Return {alias: first line number}, recording duplicate aliases in `problems`.
+    """
+    aliases = {}
+    for line_counter, alias in rows:
+        first = aliases.get(alias)
+        if first is None:
+            aliases[alias] = line_counter
+        else:
+            problems.append((tsvInFile, line_counter, f"duplicate {object_type} alias '{alias}' (first on line {first})"))
+    return aliases
+
+
+def check_integrity(sam_tsv, exp_tsv, run_tsv, accessions=None, checklist=DEFAULT_CHECKLIST):
+    """
+    Check the references between the sample, experiment and run TSVs.
+    Returns (errors, warnings) as lists of (file, line number, message).
+    """
+    errors = []
+    warnings = []
+    config = load_checklist(checklist)
+
+    # SAMPLE aliases
+    layout = config.layout_of_file("sam", sam_tsv)
+    samples = index_aliases(((line_counter, alias) for line_counter, (alias,) in
+                             iter_objects(sam_tsv, layout, config.emitter("SAMPLE", layout), ["alias"])),
+                            "sample", sam_tsv, errors)
+
+    # EXPERIMENT and RUN rows, indexed in the same pass over a shared runExp.tsv
+    experiments = {}         # experiment alias -> first line
+    runs = {}                # run alias -> first line
+    run_refs = []            # (line, experiment alias), resolved once all experiments are known
+    referenced_samples = set()
+    for tsvInFile in dict.fromkeys([exp_tsv, run_tsv]):
+        layout = config.layout_of_file("runExp", tsvInFile)
+        selectors = []
+        for object_type, object_tsv in (("EXPERIMENT", exp_tsv), ("RUN", run_tsv)):
+            if tsvInFile == object_tsv:
+                selectors.append((object_type, config.emitter(object_type, layout).selector(["sample_alias", "experiment_alias"])))
+        for line_counter, row in iter_rows(tsvInFile, layout):
+            for object_type, select in selectors:
+                values = select(row)
+                if values is None:
+                    continue
+                samAlias, expAlias = values
+                if object_type == "EXPERIMENT":
+                    first = experiments.setdefault(expAlias, line_counter)
+                    if first != line_counter:
+                        errors.append((exp_tsv, line_counter, f"duplicate experiment alias '{expAlias}' (first on line {first})"))
+                    referenced_samples.add(samAlias)
+                    if samAlias not in samples and not (accessions and accessions.lookup("SAMPLE", samAlias)):
+                        errors.append((exp_tsv, line_counter, f"experiment references unknown sample '{samAlias}'"))
+                else:
+                    first = runs.setdefault(samAlias, line_counter)
+                    if first != line_counter:
+                        errors.append((run_tsv, line_counter, f"duplicate run alias '{samAlias}' (first on line {first})"))
+                    run_refs.append((line_counter, expAlias))
+
+    # dangling run -> experiment references
+    for line_counter, expAlias in run_refs:
+        if expAlias not in experiments and not (accessions and accessions.lookup("EXPERIMENT", expAlias)):
+            errors.append((run_tsv, line_counter, f"run references unknown experiment '{expAlias}'"))
+
+    # orphaned samples
+    for alias, line_counter in samples.items():
+        if alias not in referenced_samples:
+            warnings.append((sam_tsv, line_counter, f"sample '{alias}' is not referenced by any experiment"))
+
+    errors.sort(key=lambda problem: (problem[0], problem[1]))
+    return errors, warnings
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Check references between sam.tsv and the experiment/run TSVs before submission."
+    )
+    parser.add_argument("--sam", help="Sample TSV.", default=DEFAULT_SAM)
+    parser.add_argument("--exp", help="Experiment TSV.", default=DEFAULT_RUNEXP)
+    parser.add_argument("--run", help="Run TSV.", default=DEFAULT_RUNEXP)
+    parser.add_argument(
+        "--accessions",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Accept references to objects already in the accession index (see common/receipts.py).",
+        default=None
+    )
+    parser.add_argument("--checklist", help="Checklist config defining the TSV columns.", default=DEFAULT_CHECKLIST)
+    parser.add_argument("--max-report", type=int, default=50, help="Maximum number of problems printed per kind.")
+
+    # Parse arguments
+    args = parser.parse_args()
+    accessions = AccessionIndex(args.accessions) if args.accessions else None
+
+    try:
+        errors, warnings = check_integrity(args.sam, args.exp, args.run, accessions, args.checklist)
+    except FileNotFoundError as e:
+        print(f"    Error: The file '{e.filename}' does not exist.")
+        sys.exit(1)
+    except ChecklistError as e:
+        print(f"    Error: {e}")
+        sys.exit(1)
+
+    for kind, problems in (("Warning", warnings), ("Error", errors)):
+        for tsvInFile, line_counter, message in problems[:args.max_report]:
+            print(f"    {kind}: {os.path.basename(tsvInFile)} line {line_counter}: {message}.")
+        if len(problems) > args.max_report:
+            print(f"    ... {len(problems) - args.max_report} more {kind.lower()}s.")
+
+    print(f"    {len(errors)} integrity errors, {len(warnings)} warnings.")
+    if errors:
+        sys.exit(1)
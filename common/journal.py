@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.compression import open_input
+
+"""
+Usage: journal.py [-h] status JOURNAL
+
+Append-only journal of submission units, for resuming an interrupted submission.
+
+Every batch posted by common/submit.py --journal is one unit: its object types, shard number,
+a hash of its payload (the form fields and the decompressed content of every file) and the
+receipt status. A "started" record is written before the post and an "accepted", "rejected" or
+"failed" record (with the receipt) after it; each record is one JSON line, flushed and fsync'd
+before the submission goes on, so the journal survives a crash or Ctrl-C at any point:
+
+    python3 ../common/submit.py --url "$url" --shard-dir . --journal ../submission.journal --resume
+    python3 ../common/journal.py status ../submission.journal
+
+With --resume, units the journal shows as accepted by the same dropbox URL are not posted again
+and their recorded receipts are written to the receipt log as if they had been. A unit posted
+without a receipt (the process died while posting, or the retries timed out) is posted again; if
+ENA then rejects it only because all its objects already exist, it was accepted the first time
+and is recorded as such.
+"""
+
+DEFAULT_JOURNAL = "submission.journal"
+SHARD = re.compile(r"\.(\d{3})\.")
+DUPLICATE_ERROR = re.compile(r"already exists in the submission account")
+
+
+def payload_digest(batch):
+    """
+    Hash of a batch ({form field: file path}): field names and decompressed file contents.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    for field, path in sorted(batch.items()):
+        digest.update(field.encode("UTF-8") + b"\0")
+        with open_input(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 ** 2), b""):
+                digest.update(block)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def already_submitted(receipt):
+    """
+    True if a receipt is a rejection only because every object already exists in the account.
+    """
+    try:
+        root = etree.fromstring(receipt)
+    except etree.XMLSyntaxError:
+        return False
+    errors = [error.text or "" for error in root.iterfind("MESSAGES/ERROR")]
+    return root.get("success") == "false" and bool(errors) and all(DUPLICATE_ERROR.search(error) for error in errors)
+
+
+class SubmissionJournal:
+    """
+    Append-only JSON-lines journal; the latest record of each (URL, payload) is its state.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL, url=None):
+        self.path = path
+        self.url = url
+        self.units = {}    # (url, payload) -> latest record
+        self.payloads = {}  # batch items -> payload digest
+        self.lock = threading.Lock()
+        self.fd = None
+        self.complete = 0   # size of the journal up to its last complete line
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for line in f:
+                    if line.endswith(b"\n"):
+                        self.complete += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of a crashed write
+                    self.units[record["url"], record["payload"]] = record
+
+    def payload(self, batch):
+        key = tuple(sorted(batch.items()))
+        if key not in self.payloads:
+            self.payloads[key] = payload_digest(batch)
+        return self.payloads[key]
+
+    def state(self, batch):
+        """
+        Latest record of a batch at this journal's URL, or None.
+        """
+        return self.units.get((self.url, self.payload(batch)))
+
+    def record(self, batch, status, receipt=None, error=None, recovered=False):
+        """
+        Append a record of `batch` and fsync it.
+        `recovered` marks a unit found to be accepted by an interrupted earlier post (its receipt is lost).
+        """
+        objects = [field for field in batch if field != "SUBMISSION"]
+        shard = SHARD.search(os.path.basename(batch[objects[0]])) if objects else None
+        record = {
+            "time": datetime.datetime.now().astimezone().isoformat(timespec="seconds"),
+            "url": self.url,
+            "unit": " ".join(f"{field}={os.path.basename(path)}" for field, path in batch.items()),
+            "objects": objects,
+            "shard": int(shard.group(1)) if shard else None,
+            "payload": self.payload(batch),
+            "status": status,
+        }
+        if receipt is not None:
+            record["receipt"] = receipt.decode("UTF-8", "replace")
+        if error is not None:
+            record["error"] = error
+        if recovered:
+            record["recovered"] = True
+        line = (json.dumps(record) + "\n").encode("UTF-8")
+        with self.lock:
+            if self.fd is None:
+                new = not os.path.exists(self.path)
+                self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                if os.fstat(self.fd).st_size > self.complete:
+                    # cut a torn last line off, or the next record would continue it
+                    os.ftruncate(self.fd, self.complete)
+                    os.fsync(self.fd)
+                if new:  # make the new directory entry durable too
+                    directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+                    try:
+                        os.fsync(directory)
+                    finally:
+                        os.close(directory)
+            os.write(self.fd, line)
+            os.fsync(self.fd)
+            self.units[self.url, record["payload"]] = record
+        return record
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Inspect the journal of submission units.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    status_parser = subparsers.add_parser("status", help="Show the latest state of every unit.")
+    status_parser.add_argument("journal", help="Path to the journal, e.g. submission.journal")
+
+    # Parse arguments
+    args = parser.parse_args()
+    if not os.path.exists(args.journal):
+        print(f"    Error: The journal '{args.journal}' does not exist.")
+        sys.exit(1)
+    journal = SubmissionJournal(args.journal)
+    counts = {}
+    for (url, payload), record in journal.units.items():
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+        print(f"    {record['time']}  {record['status']:<9s} {record['unit']}  ({url}, {payload[:12]})")
+    print("    " + ", ".join(f"{n} {status}" for status, n in sorted(counts.items())) + " unit(s).")
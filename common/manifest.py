@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.xml_stream import StreamingSetWriter
+from common.compression import split_compression
+
+"""
+Usage: manifest.py [-h] commit MANIFEST
+
+Row-hash manifest for incremental (delta) submissions.
+
+The manifest maps every submitted alias to a hash of its generated XML element, per object
+type (SAMPLE, EXPERIMENT, RUN). In delta mode the converters compare each new element against
+it and write only new aliases to `<name>.add.xml` and changed aliases to `<name>.modify.xml`.
+The updated manifest is written to `<manifest>.pending` and only replaces the manifest once
+the submission has been accepted by ENA:
+
+    python3 ../common/manifest.py commit sam.manifest.json
+
+"""
+
+def element_hash(element):
+    """
+    Return a content hash of an (un-indented) XML element.
+    """
+    return hashlib.blake2b(etree.tostring(element, encoding="UTF-8"), digest_size=16).hexdigest()
+
+
+class Manifest:
+    """
+    {object type: {alias: hash}} state of the last successful submission.
+    """
+
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        self.pending_file = manifest_file + ".pending"
+        self.entries = {}
+        if os.path.exists(manifest_file):
+            with open(manifest_file, 'r') as f:
+                self.entries = json.load(f)
+
+    def objects(self, object_type):
+        return self.entries.setdefault(object_type, {})
+
+    def save_pending(self):
+        """
+        Write the updated manifest next to the current one, to be committed after submission.
+        """
+        tmp_file = self.pending_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.entries, f, sort_keys=True)
+        os.replace(tmp_file, self.pending_file)
+
+
+def commit(manifest_file):
+    """
+    Promote `<manifest>.pending` to the manifest after a successful submission.
+    """
+    pending_file = manifest_file + ".pending"
+    if not os.path.exists(pending_file):
+        print(f"    Error: No pending manifest '{pending_file}' to commit.")
+        return False
+    os.replace(pending_file, manifest_file)
+    return True
+
+
+def delta_paths(xmlOutFile):
+    """
+    sam.xml -> (sam.add.xml, sam.modify.xml), sam.xml.gz -> (sam.add.xml.gz, sam.modify.xml.gz)
+    """
+    path, compression = split_compression(xmlOutFile)
+    base, ext = os.path.splitext(path)
+    return base + ".add" + ext + compression, base + ".modify" + ext + compression
+
+
+class DeltaSetWriter:
+    """
+    Drop-in replacement for StreamingSetWriter that routes each element by its manifest entry:
+    new aliases to the ADD file, changed aliases to the MODIFY file, unchanged ones nowhere.
+    """
+
+    def __init__(self, xmlOutFile, root_tag, manifest):
+        self.root_tag = root_tag
+        self.object_type = root_tag.replace("_SET", "")
+        self.add_file, self.modify_file = delta_paths(xmlOutFile)
+        self.hashes = manifest.objects(self.object_type)
+        self.add_writer = StreamingSetWriter(self.add_file, root_tag)
+        self.modify_writer = StreamingSetWriter(self.modify_file, root_tag)
+        self.unchanged = 0
+
+    def __enter__(self):
+        self.add_writer.__enter__()
+        self.modify_writer.__enter__()
+        return self
+
+    def write(self, element, line=None):
+        alias = element.get("alias")
+        new_hash = element_hash(element)
+        old_hash = self.hashes.get(alias)
+        if old_hash is None:
+            self.add_writer.write(element)
+        elif old_hash != new_hash:
+            self.modify_writer.write(element)
+        else:
+            self.unchanged += 1
+            return
+        self.hashes[alias] = new_hash
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.add_writer.__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.modify_writer.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            print(f"    {self.object_type}: {self.add_writer.count} new -> '{self.add_file}', "
+                  f"{self.modify_writer.count} changed -> '{self.modify_file}', {self.unchanged} unchanged.")
+        return False
+
+
+def open_set_writer(xmlOutFile, root_tag, manifest=None):
+    """
+    Full output writer, or a delta writer when a manifest is given.
+    """
+    if manifest is None:
+        return StreamingSetWriter(xmlOutFile, root_tag)
+    return DeltaSetWriter(xmlOutFile, root_tag, manifest)
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Manage the row-hash manifest used for incremental (delta) submissions."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    commit_parser = subparsers.add_parser("commit", help="Promote the pending manifest after a successful submission.")
+    commit_parser.add_argument("manifest", help="Path to the manifest file, e.g. sam.manifest.json")
+
+    # Parse arguments
+    args = parser.parse_args()
+    if args.command == "commit":
+        if not commit(args.manifest):
+            sys.exit(1)
+        print(f"    Manifest '{args.manifest}' updated.")
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from common.checklist import DEFAULT_CHECKLIST, load_checklist
+from common.compression import open_input
+
+"""
+Parallel, cached MD5 engine for the fastq files referenced in `run.tsv`.
+
+Files are hashed in a process pool with large buffered reads. Results are kept in a
+persistent JSON cache keyed by (path, size, mtime), so unchanged files are never re-hashed.
+"""
+
+READ_SIZE = 8 * 1024 * 1024   # 8 MiB reads keep the disk busy without large memory use
+DEFAULT_CACHE = ".md5_cache.json"
+
+
+def read_fastq_rows(tsvInFile, checklist=DEFAULT_CHECKLIST):
+    """
+    The fastq files referenced in a run TSV (run.tsv/runExp.tsv, columns found by header name).
+    Returns a list of (line number, fastq filename, md5 from the TSV in lower case).
+    """
+    layout = load_checklist(checklist).layout_of_file("runExp", tsvInFile)
+    fastq_column, md5_column = layout.indices["fastq"], layout.indices["md5"]
+    rows = []
+    with open_input(tsvInFile) as f:
+        for line_counter, line in enumerate(f, 1):
+            line = line.strip()
+            fields = line.split('\t')
+            if len(fields) != layout.n_fields or line == layout.header:
+                continue
+            gzFile, md5 = fields[fastq_column], fields[md5_column]
+            if gzFile:
+                rows.append((line_counter, gzFile, md5.lower()))
+    return rows
+
+
+def md5_file(path):
+    """
+    Return the hex MD5 digest of a file, read in large buffered chunks.
+    """
+    md5 = hashlib.md5()
+    buffer = bytearray(READ_SIZE)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            md5.update(view[:n])
+    return md5.hexdigest()
+
+
+class Md5Cache:
+    """
+    Persistent {path: (size, mtime_ns, md5)} cache stored as JSON.
+    """
+
+    def __init__(self, cache_file=DEFAULT_CACHE):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.dirty = False
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r') as f:
+                    self.entries = json.load(f)
+            except (ValueError, OSError):
+                print(f"Warning: Ignoring unreadable checksum cache '{cache_file}'.")
+                self.entries = {}
+
+    def get(self, path, stat):
+        entry = self.entries.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["md5"]
+        return None
+
+    def put(self, path, stat, md5):
+        self.entries[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "md5": md5}
+        self.dirty = True
+
+    def save(self):
+        """
+        Write the cache atomically (temporary file + rename).
+        """
+        if not self.cache_file or not self.dirty:
+            return
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.cache_file)
+        self.dirty = False
+
+
+def _md5_or_error(path):
+    """
+    Worker task: (md5, None), or (None, reason) if the file cannot be read.
+    """
+    try:
+        return md5_file(path), None
+    except OSError as e:
+        return None, e.strerror or str(e)
+
+
+def md5_files(paths, cache_file=DEFAULT_CACHE, workers=None):
+    """
+    Compute MD5 digests for `paths`, reusing cached values for unchanged files.
+
+    Returns (checksums, unreadable): a {path: md5} dict and a {path: reason} dict of the files
+    that do not exist or cannot be read (e.g. "Permission denied", "Is a directory").
+    """
+    cache = Md5Cache(cache_file)
+    checksums = {}
+    unreadable = {}
+    to_hash = []
+
+    for path in dict.fromkeys(paths):  # de-duplicate, keep order
+        key = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            unreadable[path] = e.strerror or str(e)
+            continue
+        cached = cache.get(key, stat)
+        if cached:
+            checksums[path] = cached
+        else:
+            to_hash.append((path, key, stat))
+
+    if to_hash:
+        hash_paths = [path for path, _, _ in to_hash]
+        if len(to_hash) == 1 or workers == 1:
+            results = list(map(_md5_or_error, hash_paths))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_md5_or_error, hash_paths))
+
+        for (path, key, stat), (md5, error) in zip(to_hash, results):
+            if error is not None:
+                unreadable[path] = error
+                continue
+            checksums[path] = md5
+            cache.put(key, stat, md5)
+        cache.save()
+
+    return checksums, unreadable
@@ -0,0 +1,233 @@
+import atexit
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+"""
+Per-stage timing and counters for the TSV -> XML generators (--metrics/--profile).
+
+    start_metrics("metrics.json", "convert.pstats")    # once, in the CLI; metrics.prom: Prometheus text format
+    with stage("samples"):
+        tsv2XML(...)
+    # the files are written when the process exits (also on sys.exit(1))
+
+While metrics are active, the shared row loop (common/checklist.py:convert_rows) and the writers
+record where the time of every row goes:
+  read       reading (and decompressing) the TSV lines
+  split      stripping/splitting the lines and the rest of the loop (incl. --delta row hashing)
+  build      building the SAMPLE/EXPERIMENT/RUN elements
+  validate   XSD validation (--validate)
+  indent     pretty-printing the elements
+  write      serializing the elements to the (compressed) output
+together with the rows processed per table, the objects written and the rows skipped per object
+and reason (malformed, header, empty_values), the wall time of the named pipeline stages and the
+peak memory (max RSS) of the process, and the hits and misses of the value normalization caches
+(common/normalize.py) per table and field. With `profile`, the row loop runs under cProfile and the
+stats are dumped for `python3 -m pstats`.
+
+When no metrics are active nothing is timed, so the generators run at full speed. Rows converted in
+--shard-workers processes are not counted.
+"""
+
+ROW_STAGES = ("read", "split", "build", "validate", "indent", "write")
+PROMETHEUS_PREFIX = "ena_xml"
+
+_active = None  # Metrics of this process, None when disabled
+
+
+class Metrics:
+    """
+    Timings and counters of one generator run.
+    """
+
+    def __init__(self, output=None, profile=None):
+        self.output = output
+        self.started = time.perf_counter()
+        self.stages = {}                                 # pipeline stage -> seconds
+        self.row_stages = dict.fromkeys(ROW_STAGES, 0.0)  # row stage -> seconds
+        self.loop_seconds = {}                           # table -> seconds spent in the row loop
+        self.rows = {}                                   # table -> rows processed
+        self.objects = {}                                # object type -> elements written
+        self.skipped = {}                                # object type -> {reason: rows}
+        self.caches = {}                                 # table -> Normalizer (cache statistics)
+        self.profile = profile
+        self.profiler = cProfile.Profile() if profile else None
+
+    def add(self, row_stage, seconds):
+        self.row_stages[row_stage] += seconds
+
+    def skip(self, object_type, reason, rows=1):
+        reasons = self.skipped.setdefault(object_type, {})
+        reasons[reason] = reasons.get(reason, 0) + rows
+
+    def track_caches(self, normalizer):
+        """
+        Report the cache statistics of a table's Normalizer.
+        """
+        self.caches[normalizer.table] = normalizer
+
+    def timed_lines(self, lines):
+        """
+        Iterate over `lines`, adding the time spent getting each one to the read stage.
+        """
+        lines = iter(lines)
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            line = next(lines, None)
+            self.row_stages["read"] += clock() - start
+            if line is None:
+                return
+            yield line
+
+    def timed_emitter(self, emitter):
+        """
+        Wrap an Emitter so that building its elements is added to the build stage.
+        """
+        return _TimedEmitter(emitter, self.row_stages)
+
+    def loop_started(self):
+        """
+        Mark the start of a row loop, returned to `loop_done`.
+        """
+        return time.perf_counter(), self._accounted()
+
+    def loop_done(self, mark, table, rows, written):
+        """
+        Record a finished row loop: `rows` processed from `table`, `written` = {object type: elements}.
+        The loop time not spent in the other row stages is added to `split`.
+        """
+        seconds = time.perf_counter() - mark[0]
+        self.row_stages["split"] += seconds - (self._accounted() - mark[1])
+        self.rows[table] = self.rows.get(table, 0) + rows
+        self.loop_seconds[table] = self.loop_seconds.get(table, 0.0) + seconds
+        for object_type, count in written.items():
+            self.objects[object_type] = self.objects.get(object_type, 0) + count
+
+    def _accounted(self):
+        return sum(seconds for name, seconds in self.row_stages.items() if name != "split")
+
+    def report(self):
+        """
+        The metrics as a JSON-serializable dict.
+        """
+        rusage = resource.getrusage(resource.RUSAGE_SELF)
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        peak = rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+        return {
+            "wall_seconds": round(time.perf_counter() - self.started, 6),
+            "peak_rss_bytes": peak,
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "row_stages": {name: round(seconds, 6) for name, seconds in self.row_stages.items()},
+            "rows": dict(self.rows),
+            "rows_per_second": {table: round(rows / self.loop_seconds[table], 1) if self.loop_seconds[table] else None
+                                for table, rows in self.rows.items()},
+            "objects": dict(self.objects),
+            "skipped_rows": {object_type: dict(reasons) for object_type, reasons in self.skipped.items()},
+            "normalize_caches": {table: normalizer.stats() for table, normalizer in self.caches.items()},
+        }
+
+    def prometheus(self):
+        """
+        The metrics in the Prometheus text exposition format (e.g. for the node exporter textfile collector).
+        """
+        report = self.report()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                             else f"{PROMETHEUS_PREFIX}_{name} {value}")
+
+        metric("wall_seconds", "gauge", "Wall time of the generator run.", [({}, report["wall_seconds"])])
+        metric("peak_rss_bytes", "gauge", "Peak resident memory of the generator process.",
+               [({}, report["peak_rss_bytes"])])
+        metric("stage_seconds", "gauge", "Wall time per pipeline stage.",
+               [({"stage": name}, seconds) for name, seconds in report["stages"].items()])
+        metric("row_stage_seconds", "gauge", "Time spent per row-loop stage.",
+               [({"stage": name}, seconds) for name, seconds in report["row_stages"].items()])
+        metric("rows", "gauge", "TSV rows processed per table.",
+               [({"table": table}, rows) for table, rows in report["rows"].items()])
+        metric("rows_per_second", "gauge", "TSV rows processed per second of row loop, per table.",
+               [({"table": table}, rate) for table, rate in report["rows_per_second"].items() if rate is not None])
+        metric("objects", "gauge", "Elements written per object type.",
+               [({"object": object_type}, count) for object_type, count in report["objects"].items()])
+        metric("skipped_rows", "gauge", "Rows without an element, per object type and reason.",
+               [({"object": object_type, "reason": reason}, count)
+                for object_type, reasons in report["skipped_rows"].items() for reason, count in reasons.items()])
+        for result in ("hits", "misses"):
+            metric(f"normalize_cache_{result}", "counter", f"Value normalization cache {result}, per table and field.",
+                   [({"table": table, "field": field}, stats[result])
+                    for table, fields in report["normalize_caches"].items() for field, stats in fields.items()])
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """
+        Write the metrics to the output file (Prometheus text format for *.prom, JSON otherwise)
+        and dump the cProfile stats if profiling.
+        """
+        if self.output:
+            text = self.prometheus() if self.output.endswith(".prom") else json.dumps(self.report(), indent=2) + "\n"
+            tmpFile = self.output + ".tmp"
+            with open(tmpFile, 'w') as f:
+                f.write(text)
+            os.replace(tmpFile, self.output)  # a scraper never sees a half-written file
+        if self.profiler is not None:
+            self.profiler.dump_stats(self.profile)
+
+
+class _TimedEmitter:
+    """
+    Emitter proxy timing `emit`.
+    """
+
+    def __init__(self, emitter, row_stages):
+        self.emitter = emitter
+        self.object_type = emitter.object_type
+        self.row_stages = row_stages
+
+    def emit(self, fields):
+        start = time.perf_counter()
+        element = self.emitter.emit(fields)
+        self.row_stages["build"] += time.perf_counter() - start
+        return element
+
+
+def start_metrics(output=None, profile=None):
+    """
+    Activate metrics for this process; they are written to `output` when it exits.
+    If `profile` names a stats file, the row loop runs under cProfile.
+    """
+    global _active
+    _active = Metrics(output, profile)
+    atexit.register(_active.write)
+    return _active
+
+
+def active_metrics():
+    """
+    The active Metrics, or None.
+    """
+    return _active
+
+
+@contextmanager
+def stage(name):
+    """
+    Add the wall time of the block to the pipeline stage `name` (no-op without active metrics).
+    """
+    if _active is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _active.stages[name] = _active.stages.get(name, 0.0) + time.perf_counter() - start
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import os
+import re
+import sys
+from collections import Counter
+from functools import lru_cache
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.compression import CompressionError, open_input
+
+"""
+Usage: normalize.py [-h] [--checklist CHECKLIST] [--max-report N] [TSV]
+
+Canonical forms of repeated metadata values, applied by the emitters before any XML is built.
+
+A table of the checklist config may declare a normalizer per field:
+    "normalize": {"collection_date": "date", "latitude": "coordinate", "region": "text",
+                  "host_sex": {"vocabulary": ["male", "female", ...], "synonyms": {"m": "male"}}}
+  text        trimmed, runs of whitespace collapsed, INSDC missing-value terms in lower case
+  date        text, then 2019/5/1, 2019.05.01 -> 2019-05-01; 13-5-2019, 13/05/2019 (day first) -> 2019-05-13;
+              5/2019 -> 2019-05; an Excel time of 00:00:00 is dropped. Only dates that exist are
+              rewritten; 01/05/2019 (day or month first?) and 05/13/2019 are left as they are
+  coordinate  text, then a decimal comma, degree sign, leading + and N/S/E/W hemisphere are
+              turned into signed decimal degrees ("52,08 N" -> "52.08", "4.9 W" -> "-4.9"); the
+              digits are kept as written
+  vocabulary  text, matched case-insensitively against the terms (and synonyms) of the vocabulary
+Values a normalizer does not recognize are passed on trimmed, for the checks to report. A value
+becomes blank if and only if it is blank (empty or whitespace) already; Emitter.selector relies on it.
+Values that are already canonical come back unchanged, so normalizing a clean sheet is a no-op.
+
+Sample sheets repeat the same dates, regions, host names and vocabulary terms on thousands of rows.
+Every field normalizer is memoized in its own bounded LRU cache (CACHE_SIZE values), so each
+distinct value is parsed once, and the results are interned: a repeated value is one string object
+whatever field or row it comes from. A field whose values hardly repeat (e.g. precise coordinates)
+would only pay for the cache: once its hit rate is below MIN_HIT_RATE after a cache full of misses,
+the field is normalized without the cache for the rest of the run. The hits and misses of every
+cache are reported by --metrics.
+
+Run as a script, it lists the values of a TSV that normalization changes, with the cache hit rates:
+
+    python3 common/normalize.py samSubmit/sam.tsv
+"""
+
+CACHE_SIZE = 4096    # distinct values memoized per field
+MIN_HIT_RATE = 0.5   # below this a cache costs more than it saves
+
+# INSDC missing value reporting terms
+MISSING_VALUES = frozenset({
+    "not applicable", "not collected", "not provided", "restricted access",
+    "missing: control sample", "missing: sample group", "missing: synthetic construct",
+    "missing: lab stock", "missing: third party data", "missing: data agreement established pre-2023",
+    "missing: endangered species", "missing: human-identifiable",
+})
+
+ISO_DATE = re.compile(
+    r"\d{4}(?:-\d{2}(?:-\d{2}(?:T\d{2}:\d{2}(?::\d{2})?Z?(?:[+-]\d{1,2})?)?)?)?"
+    r"(?:/\d{4}(?:-\d{2}(?:-\d{2}(?:T\d{2}:\d{2}(?::\d{2})?Z?(?:[+-]\d{1,2})?)?)?)?)?"
+)
+YEAR_FIRST = re.compile(r"(\d{4})[-/.](\d{1,2})(?:[-/.](\d{1,2}))?(?:[ T]00:00(?::00)?)?")
+DAY_FIRST = re.compile(r"(?:(\d{1,2})[-/.])?(\d{1,2})[-/.](\d{4})(?:[ T]00:00(?::00)?)?")
+COORDINATE = re.compile(r"([NSEW]?)\s*([-+−]?)(\d+(?:[.,]\d+)?)\s*°?\s*([NSEW]?)", re.IGNORECASE)
+
+
+def normalize_text(value):
+    """
+    Trim, collapse whitespace and lower-case INSDC missing-value terms.
+    """
+    text = " ".join(value.split())
+    lower = text.lower()
+    return lower if lower in MISSING_VALUES else text
+
+
+def normalize_date(value):
+    """
+    Canonical ISO 8601 form (YYYY, YYYY-MM, YYYY-MM-DD) of a collection date.
+    """
+    text = normalize_text(value)
+    if text in MISSING_VALUES or ISO_DATE.fullmatch(text):
+        return text
+    match = YEAR_FIRST.fullmatch(text)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = DAY_FIRST.fullmatch(text)
+        if not match:
+            return text
+        day, month, year = match.groups()
+        if day and int(day) <= 12 and int(month) <= 12 and int(day) != int(month):
+            return text  # 01/05/2019: day or month first, for the checks to report
+    try:
+        datetime.date(int(year), int(month), int(day) if day else 1)
+    except ValueError:
+        return text  # 2019-13-05, 2019-05-40
+    return f"{year}-{int(month):02d}" + (f"-{int(day):02d}" if day else "")
+
+
+def normalize_coordinate(value):
+    """
+    Signed decimal degrees of a latitude or longitude, with the digits as written.
+    """
+    text = normalize_text(value)
+    if text in MISSING_VALUES:
+        return text
+    match = COORDINATE.fullmatch(text)
+    if not match:
+        return text
+    before, sign, digits, after = match.groups()
+    hemisphere = (before or after).upper()
+    if (before and after) or (hemisphere and sign):
+        return text  # "N 52.1 E", "-52.1 S": ambiguous
+    negative = sign in ("-", "−") or hemisphere in ("S", "W")
+    return ("-" if negative else "") + digits.replace(",", ".")
+
+
+def vocabulary_normalizer(spec):
+    """
+    Normalizer mapping case variants and synonyms onto the terms of a controlled vocabulary.
+    """
+    terms = {term.lower(): term for term in spec["vocabulary"]}
+    terms.update({synonym.lower(): terms.get(term.lower(), term) for synonym, term in spec.get("synonyms", {}).items()})
+
+    def normalize_term(value):
+        text = normalize_text(value)
+        return terms.get(text.lower(), text)
+
+    return normalize_term
+
+
+NORMALIZERS = {
+    "text": normalize_text,
+    "date": normalize_date,
+    "coordinate": normalize_coordinate,
+}
+
+
+class Normalizer:
+    """
+    The field normalizers of one table.
+
+    `fields` holds the current normalize(value) of every field, memoized until its cache is
+    bypassed; callers look it up per row. `functions` holds the plain normalizers, for callers
+    that only see distinct values. `vocabularies` holds the terms of the vocabulary fields.
+    """
+
+    def __init__(self, table, spec, cache_size=CACHE_SIZE):
+        self.table = table
+        self.cache_size = cache_size
+        self.functions = {}
+        self.fields = {}
+        self.caches = {}     # field -> memoized normalizer (its cache statistics)
+        self.bypassed = {}   # field -> cache statistics when the cache was bypassed
+        self.vocabularies = {}  # field -> frozenset of terms
+        for field, kind in spec.items():
+            if isinstance(kind, dict) and "vocabulary" in kind:
+                function = vocabulary_normalizer(kind)
+                self.vocabularies[field] = frozenset(kind["vocabulary"])
+            elif kind in NORMALIZERS:
+                function = NORMALIZERS[kind]
+            else:
+                raise ValueError(f"{table}: unknown normalizer {kind!r} for '{field}'")
+            self.functions[field] = function
+            self.fields[field] = self.caches[field] = self._memoized(field, function)
+
+    def _memoized(self, field, function):
+        misses = 0
+
+        @lru_cache(maxsize=self.cache_size)
+        def normalize(value):
+            nonlocal misses
+            misses += 1
+            if misses % self.cache_size == 0:
+                info = normalize.cache_info()
+                if info.hits < MIN_HIT_RATE * (info.hits + info.misses):
+                    self.fields[field] = function
+                    self.bypassed[field] = info
+                    normalize.cache_clear()
+            return sys.intern(function(value))
+
+        return normalize
+
+    def stats(self):
+        """
+        {field: {"hits", "misses", "cached", "hit_rate", "bypassed"}} of the field caches.
+        """
+        stats = {}
+        for field, normalize in self.caches.items():
+            info = self.bypassed.get(field) or normalize.cache_info()
+            calls = info.hits + info.misses
+            stats[field] = {"hits": info.hits, "misses": info.misses, "cached": normalize.cache_info().currsize,
+                            "hit_rate": round(info.hits / calls, 4) if calls else None,
+                            "bypassed": field in self.bypassed}
+        return stats
+
+
+def changed_values(tsvInFile, config, table="sam"):
+    """
+    Count the values of a TSV that normalization changes, with the normalizers of a loaded checklist.
+    Returns ({field: Counter((value, normalized value))}, normalizer).
+    """
+    layout = config.layout_of_file(table, tsvInFile)
+    normalizer = config.normalizer(table)
+    if normalizer is None:
+        return {}, None
+    columns = [(field, layout.indices[field]) for field in normalizer.fields]
+    normalizers = normalizer.fields
+    changes = {field: Counter() for field in normalizer.fields}
+    with open_input(tsvInFile) as f:
+        for line in f:
+            line = line.strip()
+            fields = line.split('\t')
+            if not line or line == layout.header or len(fields) != layout.n_fields:
+                continue
+            for field, column in columns:
+                value = fields[column]
+                normalized = normalizers[field](value)
+                if normalized != value:
+                    changes[field][value, normalized] += 1
+    return changes, normalizer
+
+
+# Main execution
+if __name__ == '__main__':
+    from common.checklist import DEFAULT_CHECKLIST, ChecklistError, load_checklist  # imports this module
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="List the sam.tsv values that normalization changes.")
+    parser.add_argument("tsv", nargs="?", help="Sample TSV.",
+                        default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "samSubmit", "sam.tsv"))
+    parser.add_argument("--checklist", help="Checklist config declaring the normalizers.", default=DEFAULT_CHECKLIST)
+    parser.add_argument("--max-report", type=int, default=20, help="Maximum number of changed values listed per field.")
+
+    # Parse arguments
+    args = parser.parse_args()
+    try:
+        changes, normalizer = changed_values(args.tsv, load_checklist(args.checklist))
+    except FileNotFoundError:
+        print(f"    Error: The file '{args.tsv}' does not exist.")
+        sys.exit(1)
+    except (ChecklistError, CompressionError) as e:
+        print(f"    Error: {e}")
+        sys.exit(1)
+    if normalizer is None:
+        print("    The checklist config declares no normalizers for the sam table.")
+        sys.exit(0)
+
+    stats = normalizer.stats()
+    for field, counts in changes.items():
+        rate = stats[field]["hit_rate"]
+        print(f"    {field}: {sum(counts.values())} values changed, cache hit rate "
+              f"{'-' if rate is None else f'{rate:.1%}'}"
+              f"{' (cache bypassed)' if stats[field]['bypassed'] else ''}")
+        for (value, normalized), count in counts.most_common(args.max_report):
+            print(f"        {value!r} -> {normalized!r} ({count}x)")
@@ -0,0 +1,192 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+"""
+Content-addressed cache of generated XML.
+
+A conversion is keyed by a fingerprint of its input TSV, the converter code (every module
+involved in generating XML), the checklist config and the options that change the output.
+After a successful conversion the outputs are hard-linked into `<output dir>/.xml_cache/<key>/`;
+when the fingerprint is seen again the cached files are linked back into place and nothing is
+parsed. If the outputs are still the cached files (the usual no-op rerun), nothing is written.
+
+Input digests are memoized by (size, mtime_ns, inode) like the fastq checksums, so an unchanged
+multi-GB TSV is not read again; a touched but identical file is read and hashed, not parsed.
+A cache entry records the size and mtime of its files, so an entry that was overwritten in place
+through one of its links (e.g. by a standalone converter) is detected and regenerated.
+"""
+
+CACHE_DIR = ".xml_cache"
+CACHE_VERSION = 1
+KEEP_ENTRIES = 4     # entries kept per cache directory, most recently used first
+READ_SIZE = 8 * 1024 * 1024
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE_FILES = ["create_xml.py", "samSubmit/create_sam_xml.py", "runExpSubmit/create_runexp_xml.py", "common/*.py"]
+
+
+def file_digest(path):
+    """
+    Return the hex BLAKE2b digest of a file, read in large chunks.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    buffer = bytearray(READ_SIZE)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def _stat_key(stat):
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+class OutputCache:
+    """
+    Cache of the outputs of one output directory, in `<directory>/.xml_cache/`.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.join(os.path.abspath(directory), CACHE_DIR)
+        self.digest_file = os.path.join(self.directory, "digests.json")
+        self.digests = {}   # path -> {"stat": [size, mtime_ns, inode], "digest": ...}
+        self.dirty = False
+        if os.path.exists(self.digest_file):
+            try:
+                with open(self.digest_file, 'r') as f:
+                    self.digests = json.load(f)
+            except (ValueError, OSError):
+                self.digests = {}
+
+    def digest(self, path):
+        """
+        Digest of a file, read only if its size, mtime or inode changed since it was last hashed.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.digests.get(path)
+        if entry and entry["stat"] == _stat_key(stat):
+            return entry["digest"]
+        digest = file_digest(path)
+        self.digests[path] = {"stat": _stat_key(stat), "digest": digest}
+        self.dirty = True
+        return digest
+
+    def fingerprint(self, inputs, config, options):
+        """
+        Cache key of a conversion: `inputs` and `config` are files, `options` a JSON-serializable dict.
+        """
+        code = [self.digest(path) for pattern in CODE_FILES
+                for path in sorted(glob.glob(os.path.join(REPO_DIR, pattern)))]
+        key = {
+            "version": CACHE_VERSION,
+            "code": code,
+            "config": self.digest(config),
+            "inputs": [self.digest(path) for path in inputs],
+            "options": options,
+        }
+        return hashlib.blake2b(json.dumps(key, sort_keys=True).encode("UTF-8"), digest_size=20).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def lookup(self, key, outputs):
+        """
+        Link the cached outputs of `key` into place. Returns the info stored with them, or None on a miss.
+        """
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, "entry.json"), 'r') as f:
+                stored = json.load(f)
+            for path in outputs:
+                name = os.path.basename(path)
+                stat = os.stat(os.path.join(entry, name))
+                if [stat.st_size, stat.st_mtime_ns] != stored["files"][name]:
+                    return None  # overwritten in place through a link
+        except (OSError, ValueError, KeyError):
+            return None
+        for path in outputs:
+            _link(os.path.join(entry, os.path.basename(path)), path)
+        os.utime(entry)  # most recently used
+        return stored["info"]
+
+    def detach(self, outputs):
+        """
+        Remove outputs that are linked to a cache entry, so that regenerating them leaves the entry intact.
+        """
+        for path in outputs:
+            try:
+                if os.stat(path).st_nlink > 1:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def store(self, key, outputs, info=None):
+        """
+        Record the outputs of a successful conversion under `key` (hard links, copies across filesystems).
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        entry = self._entry(key)
+        tmp_entry = entry + ".tmp"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        os.makedirs(tmp_entry)
+        files = {}
+        for path in outputs:
+            name = os.path.basename(path)
+            _link(path, os.path.join(tmp_entry, name))
+            stat = os.stat(os.path.join(tmp_entry, name))
+            files[name] = [stat.st_size, stat.st_mtime_ns]
+        with open(os.path.join(tmp_entry, "entry.json"), 'w') as f:
+            json.dump({"files": files, "info": info}, f, indent=1)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp_entry, entry)
+        self.prune()
+
+    def prune(self, keep=KEEP_ENTRIES):
+        """
+        Remove all but the `keep` most recently used entries.
+        """
+        entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                   if os.path.isdir(os.path.join(self.directory, name))]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for entry in entries[keep:]:
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def save(self):
+        """
+        Write the input digests atomically (temporary file + rename).
+        """
+        if not self.dirty:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_file = self.digest_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.digests, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.digest_file)
+        self.dirty = False
+
+
+def _link(source, target):
+    """
+    Hard-link `source` to `target` (replacing it), or copy it if linking is not possible.
+    Nothing is done if `target` already is `source`.
+    """
+    try:
+        if os.path.samefile(source, target):
+            return
+    except FileNotFoundError:
+        pass
+    tmp_target = target + ".tmp"
+    if os.path.lexists(tmp_target):
+        os.remove(tmp_target)
+    try:
+        os.link(source, tmp_target)
+    except OSError:
+        shutil.copyfile(source, tmp_target)  # other filesystem, or no hard links
+    os.replace(tmp_target, target)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+
+from lxml import etree
+
+"""
+Usage: receipts.py [-h] [--index INDEX] {index,lookup} ...
+
+Parse ENA RECEIPT XML into a persistent alias -> accession index (SQLite).
+
+    python3 ../common/receipts.py index submit_samLog.txt       # store the accessions of successful receipts
+    python3 ../common/receipts.py lookup SAMPLE ran80849_bike18  # print the accession of an alias
+
+Receipt logs may contain several concatenated receipts (plus curl output between them); each
+receipt is stream-parsed and only successful, non-TEST receipts are stored. The generators query
+the index with one primary-key lookup per row (`--accessions`).
+"""
+
+DEFAULT_INDEX = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "accessions.sqlite")
+
+OBJECT_TYPES = {"SAMPLE", "EXPERIMENT", "RUN", "SUBMISSION", "STUDY", "PROJECT", "ANALYSIS"}
+TEST_MESSAGE = "TEST submission"
+BATCH_SIZE = 10000
+
+
+def iter_receipts(path):
+    """
+    Stream-parse every RECEIPT in a log file.
+
+    Yields (receipt attributes, is_test, [(object type, alias, accession, ext accession, status), ...])
+    per receipt. Object elements are cleared as soon as they are read. A receipt that cannot be
+    parsed (truncated, or mixed up with an HTML error page) is reported and yielded with attributes None.
+    """
+    parser = None
+    attributes = None
+    records = []
+    is_test = False
+
+    with open(path, 'r', encoding="UTF-8", errors="replace") as f:
+        for line_counter, line in enumerate(f, 1):
+            while line:
+                if parser is None:
+                    start = line.find("<RECEIPT")
+                    if start < 0:
+                        break
+                    line = line[start:]
+                    parser = etree.XMLPullParser(events=("start", "end"))
+                    attributes, records, is_test = None, [], False
+
+                end = line.find("</RECEIPT>")
+                chunk = line if end < 0 else line[:end + len("</RECEIPT>")]
+                line = "" if end < 0 else line[end + len("</RECEIPT>"):]
+                try:
+                    parser.feed(chunk)
+                    events = list(parser.read_events())
+                except etree.XMLSyntaxError as e:
+                    # truncated receipt or an HTML error page: skip it and look for the next one
+                    print(f"Warning: {os.path.basename(path)} line {line_counter}: skipping unreadable receipt ({e}).")
+                    yield None, False, []
+                    parser = None
+                    continue
+
+                for event, element in events:
+                    if event == "start":
+                        if element.tag == "RECEIPT":
+                            attributes = dict(element.attrib)
+                        continue
+                    if element.tag in OBJECT_TYPES and element.get("accession"):
+                        ext_id = element.find("EXT_ID")
+                        records.append((
+                            element.tag,
+                            element.get("alias"),
+                            element.get("accession"),
+                            ext_id.get("accession") if ext_id is not None else None,
+                            element.get("status"),
+                        ))
+                        element.clear()
+                    elif element.tag in ("INFO", "ERROR") and element.text and TEST_MESSAGE in element.text:
+                        is_test = True
+                    elif element.tag == "RECEIPT":
+                        yield attributes, is_test, records
+                        parser = None
+                        break
+
+    if parser is not None:
+        print(f"Warning: {os.path.basename(path)}: skipping truncated receipt at the end of the file.")
+        yield None, False, []
+
+
+class AccessionIndex:
+    """
+    SQLite-backed {(object type, alias): accession} index.
+    """
+
+    def __init__(self, index_file=DEFAULT_INDEX):
+        self.index_file = index_file
+        self.db = sqlite3.connect(index_file)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS accessions ("
+            " object_type TEXT NOT NULL,"
+            " alias TEXT NOT NULL,"
+            " accession TEXT NOT NULL,"
+            " ext_accession TEXT,"
+            " status TEXT,"
+            " receipt_date TEXT,"
+            " indexed_at TEXT NOT NULL,"
+            " PRIMARY KEY (object_type, alias)"
+            ") WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS accessions_by_accession ON accessions (accession)")
+        self.db.commit()
+
+    def __getstate__(self):
+        # shard worker processes open their own connection
+        return {"index_file": self.index_file}
+
+    def __setstate__(self, state):
+        self.__init__(state["index_file"])
+
+    def add(self, rows):
+        """
+        Insert or update (object type, alias, accession, ext accession, status, receipt date) rows.
+        """
+        indexed_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        self.db.executemany(
+            "INSERT INTO accessions VALUES (?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (object_type, alias) DO UPDATE SET"
+            " accession = excluded.accession, ext_accession = excluded.ext_accession,"
+            " status = excluded.status, receipt_date = excluded.receipt_date, indexed_at = excluded.indexed_at",
+            (row + (indexed_at,) for row in rows)
+        )
+        self.db.commit()
+
+    def index_receipts(self, path, include_test=False):
+        """
+        Store the accessions of every successful receipt in a log file.
+        Returns (receipts stored, receipts skipped, objects stored).
+        """
+        stored = skipped = objects = 0
+        batch = []
+        for attributes, is_test, records in iter_receipts(path):
+            if not attributes or attributes.get("success") != "true" or (is_test and not include_test):
+                skipped += 1
+                continue
+            stored += 1
+            receipt_date = attributes.get("receiptDate")
+            for record in records:
+                batch.append(record + (receipt_date,))
+            if len(batch) >= BATCH_SIZE:
+                self.add(batch)
+                objects += len(batch)
+                batch = []
+        if batch:
+            self.add(batch)
+            objects += len(batch)
+        return stored, skipped, objects
+
+    def lookup(self, object_type, alias):
+        """
+        Return the accession of an alias, or None.
+        """
+        row = self.db.execute(
+            "SELECT accession FROM accessions WHERE object_type = ? AND alias = ?", (object_type, alias)
+        ).fetchone()
+        return row[0] if row else None
+
+    def alias_of(self, object_type, accession):
+        """
+        Return the alias of an accession, or None.
+        """
+        row = self.db.execute(
+            "SELECT alias FROM accessions WHERE object_type = ? AND accession = ?", (object_type, accession)
+        ).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self.db.close()
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Parse ENA receipts into a persistent alias -> accession index."
+    )
+    parser.add_argument("--index", help="SQLite index file.", default=DEFAULT_INDEX)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    index_parser = subparsers.add_parser("index", help="Store the accessions from receipt logs.")
+    index_parser.add_argument("receipts", nargs="+", help="Receipt XML or submission log files.")
+    index_parser.add_argument("--include-test", action="store_true",
+                              help="Also store receipts of TEST submissions (discarded by ENA).")
+    lookup_parser = subparsers.add_parser("lookup", help="Print the accession of an alias.")
+    lookup_parser.add_argument("object_type", help="SAMPLE, EXPERIMENT, RUN, ...")
+    lookup_parser.add_argument("alias")
+
+    # Parse arguments
+    args = parser.parse_args()
+    index = AccessionIndex(args.index)
+    try:
+        if args.command == "index":
+            for path in args.receipts:
+                try:
+                    stored, skipped, objects = index.index_receipts(path, args.include_test)
+                except FileNotFoundError:
+                    print(f"    Error: The file '{path}' does not exist.")
+                    sys.exit(1)
+                print(f"    {path}: {objects} accessions from {stored} receipts stored, {skipped} receipts skipped.")
+        else:
+            accession = index.lookup(args.object_type.upper(), args.alias)
+            if accession is None:
+                print(f"    No {args.object_type.upper()} accession for '{args.alias}'.")
+                sys.exit(1)
+            print(accession)
+    finally:
+        index.close()
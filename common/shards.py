@@ -0,0 +1,272 @@
+import glob
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from lxml import etree
+
+from common.xml_stream import INDENT
+from common.compression import open_input, open_output, split_compression
+from common.xsd_validation import ValidatingWriter
+
+"""
+Batch sharding of generated XML to fit submission size limits.
+
+The input TSV is cut into row chunks that are converted in parallel (one process per core). A
+worker serializes the elements of its chunk into a temporary part file per object type and
+returns the byte size of every row's elements. The main process then packs the rows, in input
+order, into shards: a shard is closed before the next row would push any of its files past
+`max_bytes` or `max_objects`. Every element is measured, so no shard file is larger than the
+limit (unless one row alone is), and a shard is carried over from one chunk to the next, so only
+the last shard is under-filled. Shards are numbered `sam.000.xml`, `sam.001.xml`, ... and each
+one gets its own submission XML (`sam.000.submission.xml`), so it can be submitted on its own.
+
+When several object types are written from the same rows (EXPERIMENT + RUN), they share shard
+boundaries: `exp.003.xml` and `run.003.xml` always come from the same TSV rows.
+"""
+
+DEFAULT_CHUNK_ROWS = 10000   # rows per worker task
+ELEMENT_PREFIX = ("\n" + INDENT).encode("UTF-8")
+
+
+def parse_size(value):
+    """
+    Parse a byte size such as "5000000", "500K", "5M" or "1G".
+    """
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def shard_path(xmlOutFile, index):
+    """
+    sam.xml, 3 -> sam.003.xml; sam.xml.gz, 3 -> sam.003.xml.gz
+    """
+    path, compression = split_compression(xmlOutFile)
+    base, ext = os.path.splitext(path)
+    return f"{base}.{index:03d}{ext}{compression}"
+
+
+class _PartWriter:
+    """
+    Writer handed to a converter in a worker; forwards elements to its ChunkPart.
+    """
+
+    def __init__(self, part, index):
+        self.part = part
+        self.index = index
+
+    def write(self, element, line=None):
+        self.part.write(self.index, element)
+
+
+class ChunkPart:
+    """
+    Serialized elements of one chunk, one part file per object type, with the byte size of
+    each row's elements: `rows` is a list of [size per object type (0 if none)].
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.rows = []
+        self.writers = [_PartWriter(self, i) for i in range(len(paths))]
+        self._files = None
+
+    def __enter__(self):
+        self._files = [open(path, 'wb') for path in self.paths]
+        return self
+
+    def write(self, index, element):
+        etree.indent(element, space=INDENT, level=1)
+        data = ELEMENT_PREFIX + etree.tostring(element, encoding="UTF-8")
+        self._files[index].write(data)
+        # the converters write the elements of a row in object type order: a new row starts
+        # when this type, or one after it, has already been written for the last row
+        if not self.rows or any(self.rows[-1][index:]):
+            self.rows.append([0] * len(self.paths))
+        self.rows[-1][index] = len(data)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for f in self._files:
+            f.close()
+        return False
+
+
+class _SetFile:
+    """
+    *_SET file assembled from serialized elements; the bytes are the same as StreamingSetWriter's.
+    """
+
+    def __init__(self, path, root_tag):
+        self.path = path
+        self.head = f"<?xml version='1.0' encoding='UTF-8'?>\n<{root_tag}>".encode("UTF-8")
+        self.tail = f"\n</{root_tag}>\n".encode("UTF-8")
+        self.size = len(self.head) + len(self.tail)
+        self.count = 0
+        self._file = None
+
+    def write(self, data):
+        if self._file is None:
+            self._file = open_output(self.path)
+            self._file.write(self.head)
+        self._file.write(data)
+        self.size += len(data)
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.write(self.tail)
+            self._file.close()
+
+
+class ShardPacker:
+    """
+    Packs the rows of consecutive chunks, in input order, into numbered shards.
+    """
+
+    def __init__(self, xmlOutFiles, root_tags, max_objects=None, max_bytes=None,
+                 submission_xml=None, submission_name=None):
+        self.xmlOutFiles = xmlOutFiles
+        self.root_tags = root_tags
+        self.max_objects = max_objects
+        self.max_bytes = max_bytes
+        self.submission_xml = submission_xml
+        self.submission_name = submission_name
+        self.shards = []   # [(path or None, count) per object type] per shard
+        self._open = None
+
+    def _start(self):
+        index = len(self.shards)
+        self._open = [_SetFile(shard_path(xmlOutFile, index), tag)
+                      for xmlOutFile, tag in zip(self.xmlOutFiles, self.root_tags)]
+        self.shards.append(None)
+
+    def _finish(self):
+        for set_file in self._open:
+            set_file.close()
+        self.shards[-1] = [(set_file.path if set_file.count else None, set_file.count) for set_file in self._open]
+        if self.submission_xml:
+            shutil.copyfile(self.submission_xml, f"{self.submission_name}.{len(self.shards) - 1:03d}.submission.xml")
+        self._open = None
+
+    def _full(self, sizes):
+        if not any(set_file.count for set_file in self._open):
+            return False  # a row too large for any shard gets one of its own
+        for set_file, size in zip(self._open, sizes):
+            if not size:
+                continue
+            if self.max_objects and set_file.count + 1 > self.max_objects:
+                return True
+            if self.max_bytes and set_file.size + size > self.max_bytes:
+                return True
+        return False
+
+    def add(self, part_paths, rows):
+        """
+        Append the rows of one chunk (see ChunkPart) and remove its part files.
+        """
+        files = [open(path, 'rb') for path in part_paths]
+        try:
+            for sizes in rows:
+                if self._open is None:
+                    self._start()
+                elif self._full(sizes):
+                    self._finish()
+                    self._start()
+                for set_file, f, size in zip(self._open, files, sizes):
+                    if size:
+                        set_file.write(f.read(size))
+        finally:
+            for f in files:
+                f.close()
+        for path in part_paths:
+            os.remove(path)
+
+    def close(self):
+        if self._open is not None:
+            self._finish()
+        return self.shards
+
+
+def _convert_chunk(convert, lines, first_line, part_paths, validate_source):
+    """
+    Worker task: convert one chunk of TSV lines into part files.
+    Returns (row sizes, number of elements that failed XSD validation).
+    """
+    with ChunkPart(part_paths) as part:
+        writers = part.writers
+        if validate_source:
+            writers = [ValidatingWriter(writer, validate_source) for writer in writers]
+        convert(lines, first_line, *writers)
+    invalid = sum(writer.invalid for writer in writers) if validate_source else 0
+    return part.rows, invalid
+
+
+def write_shards(tsvInFile, xmlOutFiles, root_tags, convert, max_objects=None, max_bytes=None,
+                 submission_xml=None, submission_name=None, workers=None, validate=False):
+    """
+    Convert `tsvInFile` into numbered shards of each file in `xmlOutFiles`.
+
+    `convert(lines, first_line, *writers)` is the converter's row loop (one writer per root tag);
+    it must be a picklable module-level function (or functools.partial of one).
+    If `submission_xml` is given, it is copied to `<submission_name>.NNN.submission.xml` for every shard.
+    If `validate` is set, every element is checked against the ENA XSD; if any fails,
+    SystemExit is raised after all shards are written.
+
+    Returns a list with, per shard, a list of (path, object count) per object type;
+    files for object types without any object in a shard are not kept (path None).
+    """
+    workers = workers or os.cpu_count()
+
+    # remove shards left over from a previous, larger run
+    for xmlOutFile in xmlOutFiles:
+        path, compression = split_compression(xmlOutFile)
+        base, ext = os.path.splitext(path)
+        for old_shard in glob.glob(f"{glob.escape(base)}.[0-9][0-9][0-9]{ext}{compression}"):
+            os.remove(old_shard)
+    if submission_name:
+        for old_submission in glob.glob(f"{glob.escape(submission_name)}.[0-9][0-9][0-9].submission.xml"):
+            os.remove(old_submission)
+
+    packer = ShardPacker(xmlOutFiles, root_tags, max_objects, max_bytes, submission_xml, submission_name)
+    invalid = 0
+    part_paths = []
+    try:
+        with open_input(tsvInFile) as f, ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            first_line = 1
+            while True:
+                lines = list(islice(f, DEFAULT_CHUNK_ROWS))
+                if not lines:
+                    break
+                paths = [f"{split_compression(xmlOutFile)[0]}.part{len(part_paths)}" for xmlOutFile in xmlOutFiles]
+                part_paths.append(paths)
+                pending.append((paths, executor.submit(_convert_chunk, convert, lines, first_line, paths,
+                                                       tsvInFile if validate else None)))
+                first_line += len(lines)
+
+                # bound the number of chunks held in memory; pack the finished ones in input order
+                while pending and (len(pending) >= 2 * workers or pending[0][1].done()):
+                    paths, future = pending.popleft()
+                    rows, chunk_invalid = future.result()
+                    packer.add(paths, rows)
+                    invalid += chunk_invalid
+            while pending:
+                paths, future = pending.popleft()
+                rows, chunk_invalid = future.result()
+                packer.add(paths, rows)
+                invalid += chunk_invalid
+        shards = packer.close()
+    finally:
+        for path in (path for paths in part_paths for path in paths):
+            if os.path.exists(path):
+                os.remove(path)
+
+    if invalid:
+        print(f"Error: {invalid} objects failed XSD validation.")
+        raise SystemExit(1)
+    return shards
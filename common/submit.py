@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+import argparse
+import base64
+import errno
+import glob
+import http.client
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.compression import COMPRESSION_EXTENSIONS, open_input, split_compression
+from common.journal import DEFAULT_JOURNAL, SubmissionJournal, already_submitted
+
+"""
+Usage: submit.py [-h] [-t | -s | --url URL] [--batch FIELD=FILE [FIELD=FILE ...]] [--shard-dir DIR]
+                 [--workers N] [--retries N] [--timeout SECONDS] [--log LOG] [--journal [JOURNAL]] [--resume]
+
+Submit generated XML files to the ENA dropbox as multipart posts (replaces the curl calls).
+
+Batches are posted concurrently with bounded parallelism. Each worker thread keeps its own
+keep-alive HTTP connection, so consecutive batches reuse the same connection. Server errors (5xx),
+timeouts and dropped connections are retried with exponential backoff.
+
+Examples:
+    python3 ../common/submit.py -t --batch SUBMISSION=add_submission.xml SAMPLE=sam.xml --log submit_samLog.txt
+    python3 ../common/submit.py -t --shard-dir . --workers 4 --log submit_samLog.txt
+    python3 ../common/submit.py -t --shard-dir . --journal ../submission.journal --resume --log submit_samLog.txt
+
+With --journal, every batch is recorded (fsync'd) before it is posted and with its receipt status;
+with --resume, batches already accepted are skipped (see common/journal.py).
+
+Credentials are read from the U_NAME and PASS_WORD environment variables.
+"""
+
+TEST_URL = "https://wwwdev.ebi.ac.uk/ena/submit/drop-box/submit/"
+SUBMIT_URL = "https://www.ebi.ac.uk/ena/submit/drop-box/submit/"
+
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class SubmissionError(Exception):
+    """
+    A batch could not be submitted (client error, or retries exhausted).
+    """
+
+
+def encode_multipart(files):
+    """
+    Encode {form field: file path} as a multipart/form-data body; .gz/.zst files are sent decompressed.
+    Returns (body bytes, content type).
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for field, path in files.items():
+        with open_input(path, 'rb') as f:
+            content = f.read()
+        filename = os.path.basename(split_compression(path)[0])
+        parts.append(
+            f"--{boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/xml\r\n\r\n".encode("UTF-8") + content + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode("UTF-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def receipt_success(receipt):
+    """
+    Return the success attribute of a RECEIPT document (None if it cannot be parsed).
+    """
+    try:
+        return etree.fromstring(receipt).get("success") == "true"
+    except etree.XMLSyntaxError:
+        return None
+
+
+class SubmissionClient:
+    """
+    Concurrent dropbox client with one pooled keep-alive connection per worker thread.
+    """
+
+    def __init__(self, url, username, password, workers=4, retries=5, timeout=300, backoff=1.0):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or "/"
+        if parts.query:
+            self.path += "?" + parts.query
+        token = base64.b64encode(f"{username}:{password}".encode("UTF-8")).decode("ascii")
+        self.auth_header = f"Basic {token}"
+        self.workers = workers
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self.scheme == "https":
+                connection = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _reset_connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+
+    def post(self, files):
+        """
+        Post one batch ({form field: file path}) and return the receipt bytes.
+        Retries 5xx responses, timeouts and connection errors with exponential backoff.
+        """
+        body, content_type = encode_multipart(files)
+        headers = {
+            "Authorization": self.auth_header,
+            "Content-Type": content_type,
+            "Connection": "keep-alive",
+        }
+
+        for attempt in range(self.retries + 1):
+            try:
+                connection = self._connection()
+                connection.request("POST", self.path, body=body, headers=headers)
+                response = connection.getresponse()
+                receipt = response.read()
+                if response.status < 400:
+                    return receipt
+                if response.status not in RETRY_STATUSES:
+                    raise SubmissionError(f"HTTP {response.status} {response.reason}: {receipt[:500]!r}")
+                error = f"HTTP {response.status} {response.reason}"
+            except (socket.timeout, ConnectionError, http.client.HTTPException, OSError) as e:
+                self._reset_connection()
+                error = f"{type(e).__name__}: {e}"
+
+            if attempt < self.retries:
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+                print(f"    Warning: {error} for {sorted(files.values())}, retrying in {delay:.1f}s "
+                      f"({attempt + 1}/{self.retries}).")
+                time.sleep(delay)
+
+        raise SubmissionError(f"{error} after {self.retries + 1} attempts")
+
+    def submit_all(self, batches):
+        """
+        Submit batches concurrently (at most `workers` in flight).
+        Returns a list of (batch, receipt or None, error or None) in batch order.
+        """
+        def submit_one(batch):
+            try:
+                return batch, self.post(batch), None
+            except (SubmissionError, ConnectionError, socket.timeout) as e:
+                return batch, None, str(e)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(submit_one, batches))
+        self.close()
+        return results
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+
+def submit_journaled(client, batches, journal, resume=False):
+    """
+    Submit batches like SubmissionClient.submit_all, recording each one in `journal` before it is
+    posted and with its outcome. With `resume`, batches the journal shows as accepted are not posted
+    again; their recorded receipt (None if it was lost) is returned instead.
+    Returns a list of (batch, receipt or None, error or None, status) in batch order, where status is
+    "skipped", "recovered" or "posted".
+    """
+    def submit_one(batch):
+        state = journal.state(batch) if resume else None
+        if state and state["status"] == "accepted":
+            receipt = state.get("receipt")
+            return batch, receipt.encode("UTF-8") if receipt is not None else None, None, "skipped"
+        in_doubt = state is not None and state["status"] in ("started", "failed")  # no receipt was received
+        journal.record(batch, "started")
+        try:
+            receipt = client.post(batch)
+        except (SubmissionError, ConnectionError, socket.timeout) as e:
+            journal.record(batch, "failed", error=str(e))
+            return batch, None, str(e), "posted"
+        if in_doubt and already_submitted(receipt):
+            # the interrupted post went through; its receipt (with the accessions) is lost
+            journal.record(batch, "accepted", recovered=True)
+            return batch, None, None, "recovered"
+        journal.record(batch, "accepted" if receipt_success(receipt) else "rejected", receipt)
+        return batch, receipt, None, "posted"
+
+    with ThreadPoolExecutor(max_workers=client.workers) as executor:
+        results = list(executor.map(submit_one, batches))
+    client.close()
+    journal.close()
+    return results
+
+
+def parse_batch(items):
+    """
+    ["SUBMISSION=add_submission.xml", "SAMPLE=sam.xml"] -> {"SUBMISSION": ..., "SAMPLE": ...}
+    Raises FileNotFoundError for a file that does not exist, before anything is posted.
+    """
+    batch = {}
+    for item in items:
+        field, sep, path = item.partition("=")
+        if not sep or not path:
+            raise argparse.ArgumentTypeError(f"Expected FIELD=FILE, got '{item}'")
+        if not os.path.isfile(path):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        batch[field.upper()] = path
+    return batch
+
+
+def discover_shard_batches(directory):
+    """
+    Build one batch per shard written by --shard-objects/--shard-bytes:
+    sam.NNN.submission.xml + sam.NNN.xml, or runExp.NNN.submission.xml + exp.NNN.xml + run.NNN.xml
+    (the XML shards may be compressed: sam.NNN.xml.gz, ...).
+    """
+    batches = []
+    pattern = re.compile(r"^(sam|runExp)\.(\d{3})\.submission\.xml$")
+    for submission in sorted(glob.glob(os.path.join(glob.escape(directory), "*.submission.xml"))):
+        match = pattern.match(os.path.basename(submission))
+        if not match:
+            continue
+        name, index = match.groups()
+        batch = {"SUBMISSION": submission}
+        objects = {"SAMPLE": "sam"} if name == "sam" else {"EXPERIMENT": "exp", "RUN": "run"}
+        for field, base in objects.items():
+            for compression in ("",) + COMPRESSION_EXTENSIONS:
+                path = os.path.join(directory, f"{base}.{index}.xml{compression}")
+                if os.path.exists(path):
+                    batch[field] = path
+                    break
+        batches.append(batch)
+    return batches
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Submit generated XML files to the ENA dropbox over pooled keep-alive connections."
+    )
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("-t", "--test", action="store_true", help="Use the test dropbox (default).")
+    target.add_argument("-s", "--submit", action="store_true", help="Use the production dropbox.")
+    target.add_argument("--url", help="Use another dropbox URL (e.g. a local stub server).")
+    parser.add_argument(
+        "--batch",
+        nargs="+",
+        action="append",
+        metavar="FIELD=FILE",
+        help="One submission: form fields and files, e.g. SUBMISSION=add_submission.xml SAMPLE=sam.xml. Repeatable.",
+        default=[]
+    )
+    parser.add_argument("--shard-dir", help="Submit every sam/runExp shard found in this directory.", default=None)
+    parser.add_argument("--workers", type=int, default=4, help="Maximum number of concurrent submissions.")
+    parser.add_argument("--retries", type=int, default=5, help="Retries on 5xx responses and timeouts.")
+    parser.add_argument("--timeout", type=float, default=300, help="Socket timeout in seconds.")
+    parser.add_argument("--log", help="Append every receipt to this file.", default=None)
+    parser.add_argument(
+        "--journal",
+        nargs="?",
+        const=DEFAULT_JOURNAL,
+        help="Record every batch and its receipt status in this append-only journal (default: submission.journal).",
+        default=None
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip batches the journal shows as accepted by the same URL (their receipts are logged again)."
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+    url = args.url or (SUBMIT_URL if args.submit else TEST_URL)
+    username = os.environ.get("U_NAME")
+    password = os.environ.get("PASS_WORD")
+    if not username or not password:
+        print("    Error: U_NAME and PASS_WORD must be set.")
+        sys.exit(1)
+
+    try:
+        batches = [parse_batch(items) for items in args.batch]
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    except FileNotFoundError as e:
+        print(f"    Error: The file '{e.filename}' does not exist.")
+        sys.exit(1)
+    if args.shard_dir:
+        batches.extend(discover_shard_batches(args.shard_dir))
+    if not batches:
+        parser.error("nothing to submit: use --batch and/or --shard-dir")
+    if args.resume and not args.journal:
+        parser.error("--resume needs --journal")
+
+    client = SubmissionClient(url, username, password, args.workers, args.retries, args.timeout)
+    try:
+        if args.journal:
+            results = submit_journaled(client, batches, SubmissionJournal(args.journal, url), args.resume)
+        else:
+            results = [result + ("posted",) for result in client.submit_all(batches)]
+    except FileNotFoundError as e:
+        print(f"    Error: The file '{e.filename}' does not exist.")
+        sys.exit(1)
+
+    failed = 0
+    skipped = 0
+    log = open(args.log, 'ab') if args.log else None
+    try:
+        for batch, receipt, error, status in results:
+            files = " ".join(f"{field}={path}" for field, path in batch.items())
+            if error:
+                failed += 1
+                print(f"    ❌ {files}: {error}")
+                continue
+            if status == "recovered":
+                print(f"    ✅ {files}: accepted by an interrupted earlier submission (receipt lost, "
+                      f"the accessions are in the duplicate errors of the dropbox)")
+                continue
+            if receipt is None:
+                skipped += 1
+                print(f"    ⏭️  {files}: accepted before (no receipt recorded)")
+                continue
+            if log:
+                log.write(receipt + b"\n")
+            if status == "skipped":
+                skipped += 1
+                print(f"    ⏭️  {files}: accepted before")
+            elif receipt_success(receipt):
+                print(f"    ✅ {files}")
+            else:
+                failed += 1
+                print(f"    ❌ {files}: submission not successful, see receipt")
+    finally:
+        if log:
+            log.close()
+
+    resumed = f", {skipped} skipped as already accepted" if skipped else ""
+    print(f"    {len(results) - failed} of {len(results)} submissions succeeded{resumed} ({url}).")
+    if failed:
+        sys.exit(1)
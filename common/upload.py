@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+import argparse
+import ftplib
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.checklist import DEFAULT_CHECKLIST, ChecklistError
+from common.compression import CompressionError
+from common.md5_checksums import DEFAULT_CACHE, Md5Cache, md5_file, read_fastq_rows
+
+"""
+Usage: upload.py [-h] [-i INPUT] [--fastq-dir FASTQ_DIR] [--host HOST] [--port PORT] [--tls]
+                 [--remote-dir DIR] [--workers N] [--retries N] [--timeout SECONDS]
+                 [--state STATE] [--md5-cache MD5_CACHE] [--checklist CHECKLIST]
+
+Upload the fastq files referenced in a run TSV to the Webin upload area, before the RUN XML is
+submitted (every FILE in run.xml must already be there).
+
+Files are uploaded concurrently, largest first. Each worker thread keeps its own logged-in FTP
+connection, so consecutive files reuse it. For every file:
+  - a file whose remote size matches and whose <file>.md5 matches the local MD5 (from the
+    checksum cache, otherwise hashed) is skipped,
+  - a partial upload of the same local file (same size and mtime, recorded in the state file
+    when the upload started) is resumed from its remote size (REST),
+  - otherwise the file is uploaded from the start.
+The file is hashed while it is sent, so it is read from disk once; after the transfer the remote
+size is checked and the MD5 is written next to it as <file>.md5 and into the checksum cache that
+create_run_xml.py --md5 uses. Dropped connections, timeouts and 4xx replies are retried with
+exponential backoff, resuming where the transfer stopped. A computed MD5 that differs from the
+TSV's md5 column is reported as an error.
+
+    python3 ../common/upload.py -i runExp.tsv --fastq-dir /path/to/fastq
+    python3 ../common/upload.py --host 127.0.0.1 --port 2121 ...   # local stand-in (bench/ftp_standin.py)
+
+Credentials are read from the U_NAME and PASS_WORD environment variables.
+"""
+
+FTP_HOST = "webin2.ebi.ac.uk"
+BLOCK_SIZE = 1024 ** 2        # bytes per FTP data block (and per hashed read while resuming)
+DEFAULT_STATE = ".upload_state.json"
+
+
+class UploadError(Exception):
+    """
+    A file could not be uploaded (permanent FTP error, or retries exhausted).
+    """
+
+
+class UploadState:
+    """
+    Persistent {path: (size, mtime_ns)} record of uploads in progress, stored as JSON.
+    A partial remote file is only resumed if the local file is still the one being uploaded.
+    """
+
+    def __init__(self, state_file=DEFAULT_STATE):
+        self.state_file = state_file
+        self.entries = {}
+        self._lock = threading.Lock()
+        if state_file and os.path.exists(state_file):
+            try:
+                with open(state_file, 'r') as f:
+                    self.entries = json.load(f)
+            except (ValueError, OSError):
+                print(f"Warning: Ignoring unreadable upload state '{state_file}'.")
+                self.entries = {}
+
+    def started(self, path, stat):
+        """
+        Return True if an upload of this version of the file was started before, then record it.
+        """
+        with self._lock:
+            entry = self.entries.get(path)
+            resumable = bool(entry) and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+            self.entries[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            self._save()
+        return resumable
+
+    def finished(self, path):
+        with self._lock:
+            if self.entries.pop(path, None) is not None:
+                self._save()
+
+    def _save(self):
+        # atomic (temporary file + rename), called with the lock held
+        if not self.state_file:
+            return
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.state_file)
+
+
+class FtpUploader:
+    """
+    Concurrent, resumable FTP uploader with one pooled connection per worker thread.
+    """
+
+    def __init__(self, host, username, password, port=21, remote_dir="", tls=False, workers=4, retries=5,
+                 timeout=300, backoff=1.0, state=None, cache=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.remote_dir = remote_dir
+        self.tls = tls
+        self.workers = workers
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.state = state if state is not None else UploadState(None)
+        self.cache = cache if cache is not None else Md5Cache(None)
+        self.sent_bytes = 0  # bytes sent by all transfers, including the failed ones
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        ftp = getattr(self._local, "ftp", None)
+        if ftp is None:
+            ftp = ftplib.FTP_TLS(timeout=self.timeout) if self.tls else ftplib.FTP(timeout=self.timeout)
+            ftp.connect(self.host, self.port)
+            ftp.login(self.username, self.password)
+            if self.tls:
+                ftp.prot_p()
+            ftp.voidcmd("TYPE I")  # SIZE and REST count bytes
+            if self.remote_dir:
+                try:
+                    ftp.cwd(self.remote_dir)
+                except ftplib.error_perm:
+                    ftp.mkd(self.remote_dir)
+                    ftp.cwd(self.remote_dir)
+            self._local.ftp = ftp
+            with self._lock:
+                self._connections.append(ftp)
+        return ftp
+
+    def _reset_connection(self):
+        ftp = getattr(self._local, "ftp", None)
+        if ftp is not None:
+            ftp.close()
+            self._local.ftp = None
+            with self._lock:
+                self._connections.remove(ftp)
+
+    @staticmethod
+    def _remote_size(ftp, name):
+        try:
+            return ftp.size(name)
+        except ftplib.error_perm:  # 550: no such file
+            return None
+
+    @staticmethod
+    def _remote_md5(ftp, name):
+        content = io.BytesIO()
+        try:
+            ftp.retrbinary(f"RETR {name}.md5", content.write)
+        except ftplib.error_perm:
+            return None
+        words = content.getvalue().decode("ascii", "replace").split()
+        return words[0].lower() if words else None
+
+    def _local_md5(self, path, stat):
+        key = os.path.abspath(path)
+        md5 = self.cache.get(key, stat)
+        if md5 is None:
+            md5 = md5_file(path)
+            self.cache.put(key, stat, md5)
+        return md5
+
+    def _store(self, ftp, path, name, offset):
+        """
+        Send the file from byte `offset` on, hashing the whole file on the way.
+        Returns (md5, bytes sent).
+        """
+        md5 = hashlib.md5()
+        sent = 0
+
+        def block_sent(block):
+            nonlocal sent
+            md5.update(block)
+            sent += len(block)
+            with self._lock:
+                self.sent_bytes += len(block)
+
+        with open(path, 'rb') as f:
+            remaining = offset  # the uploaded part is only hashed
+            while remaining:
+                block = f.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                md5.update(block)
+                remaining -= len(block)
+            ftp.storbinary(f"STOR {name}", f, BLOCK_SIZE, block_sent, rest=offset or None)
+        return md5.hexdigest(), sent
+
+    def upload(self, path):
+        """
+        Upload one file unless it is already there.
+        Returns (status, md5, bytes sent, resumed from) with status "uploaded", "resumed" or "skipped".
+        """
+        name = os.path.basename(path)
+        stat = os.stat(path)
+        error = None
+        for attempt in range(self.retries + 1):
+            try:
+                ftp = self._connection()
+                remote_size = self._remote_size(ftp, name)
+                if remote_size == stat.st_size:
+                    remote_md5 = self._remote_md5(ftp, name)
+                    if remote_md5 and remote_md5 == self._local_md5(path, stat):
+                        self.state.finished(os.path.abspath(path))
+                        return "skipped", remote_md5, 0, 0
+
+                resumable = self.state.started(os.path.abspath(path), stat)
+                offset = remote_size if resumable and remote_size and remote_size < stat.st_size else 0
+                md5, sent = self._store(ftp, path, name, offset)
+                remote_size = self._remote_size(ftp, name)
+                if remote_size != stat.st_size:
+                    raise EOFError(f"remote size {remote_size} after the transfer, expected {stat.st_size}")
+                ftp.storbinary(f"STOR {name}.md5", io.BytesIO(f"{md5}  {name}\n".encode("ascii")))
+
+                self.state.finished(os.path.abspath(path))
+                self.cache.put(os.path.abspath(path), stat, md5)
+                return ("resumed" if offset else "uploaded"), md5, sent, offset
+            except ftplib.error_perm as e:
+                self._reset_connection()
+                raise UploadError(f"{e}")
+            except (ftplib.error_temp, ftplib.error_reply, EOFError, OSError) as e:
+                self._reset_connection()
+                error = f"{type(e).__name__}: {e}"
+
+            if attempt < self.retries:
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+                print(f"    Warning: {error} for '{name}', retrying in {delay:.1f}s ({attempt + 1}/{self.retries}).")
+                time.sleep(delay)
+
+        raise UploadError(f"{error} after {self.retries + 1} attempts")
+
+    def upload_all(self, paths):
+        """
+        Upload files concurrently (at most `workers` at a time), largest first.
+        Returns a list of (path, result or None, error or None) in the order of `paths`.
+        """
+        def upload_one(path):
+            try:
+                return path, self.upload(path), None
+            except (UploadError, OSError) as e:
+                return path, None, str(e)
+
+        order = sorted(paths, key=lambda path: -os.path.getsize(path))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = dict((path, (result, error)) for path, result, error in executor.map(upload_one, order))
+        self.close()
+        return [(path,) + results[path] for path in paths]
+
+    def close(self):
+        with self._lock:
+            for ftp in self._connections:
+                try:
+                    ftp.quit()
+                except (ftplib.Error, EOFError, OSError):
+                    ftp.close()
+            self._connections = []
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Upload the fastq files referenced in a run TSV to the Webin upload area (concurrent, resumable)."
+    )
+    parser.add_argument("-i", "--input", help="Run TSV (run.tsv or runExp.tsv) with the fastq and md5 columns.",
+                        default="runExp.tsv")
+    parser.add_argument("--fastq-dir", help="Directory containing the fastq files (default: directory of the input TSV).",
+                        default=None)
+    parser.add_argument("--host", help=f"FTP server (default: {FTP_HOST}; e.g. 127.0.0.1 for a local stand-in).",
+                        default=FTP_HOST)
+    parser.add_argument("--port", type=int, default=21, help="FTP port.")
+    parser.add_argument("--tls", action="store_true", help="Use explicit FTPS (AUTH TLS, encrypted data connections).")
+    parser.add_argument("--remote-dir", help="Upload into this directory of the upload area (created if missing).",
+                        default="")
+    parser.add_argument("--workers", type=int, default=4, help="Maximum number of concurrent uploads (connections).")
+    parser.add_argument("--retries", type=int, default=5, help="Retries on dropped connections, timeouts and 4xx replies.")
+    parser.add_argument("--timeout", type=float, default=300, help="Socket timeout in seconds.")
+    parser.add_argument("--state", help="Record of uploads in progress, used to resume them.", default=DEFAULT_STATE)
+    parser.add_argument("--md5-cache", help="Persistent checksum cache keyed by (path, size, mtime).", default=DEFAULT_CACHE)
+    parser.add_argument("--checklist", help="Checklist config defining the run TSV columns.", default=DEFAULT_CHECKLIST)
+
+    # Parse arguments
+    args = parser.parse_args()
+    username = os.environ.get("U_NAME")
+    password = os.environ.get("PASS_WORD")
+    if not username or not password:
+        print("    Error: U_NAME and PASS_WORD must be set.")
+        sys.exit(1)
+
+    try:
+        rows = read_fastq_rows(args.input, args.checklist)
+    except FileNotFoundError:
+        print(f"    Error: The file '{args.input}' does not exist.")
+        sys.exit(1)
+    except (ChecklistError, CompressionError) as e:
+        print(f"    Error: {e}")
+        sys.exit(1)
+
+    # Every referenced file must exist before anything is uploaded
+    fastq_dir = args.fastq_dir or os.path.dirname(os.path.abspath(args.input))
+    paths = {gzFile: os.path.join(fastq_dir, gzFile) for _, gzFile, _ in rows}
+    missing = [f"Line {line_counter}: fastq file '{paths[gzFile]}' not found."
+               for line_counter, gzFile, _ in rows if not os.path.isfile(paths[gzFile])]
+    if missing:
+        for message in missing:
+            print(f"    Error: {message}")
+        sys.exit(1)
+    if not paths:
+        print(f"    No fastq files referenced in '{args.input}'.")
+        sys.exit(0)
+
+    cache = Md5Cache(args.md5_cache)
+    uploader = FtpUploader(args.host, username, password, args.port, args.remote_dir, args.tls, args.workers,
+                           args.retries, args.timeout, state=UploadState(args.state), cache=cache)
+    start = time.perf_counter()
+    results = uploader.upload_all(list(dict.fromkeys(paths.values())))
+    seconds = time.perf_counter() - start
+    cache.save()
+
+    counts = {"uploaded": 0, "resumed": 0, "skipped": 0}
+    failed = 0
+    mismatched = 0
+    checksums = {}
+    for path, result, error in results:
+        name = os.path.basename(path)
+        if error:
+            failed += 1
+            print(f"    ❌ {name}: {error}")
+            continue
+        status, md5, sent, offset = result
+        counts[status] += 1
+        checksums[name] = md5
+        if status == "skipped":
+            print(f"    ⏭️  {name}: already uploaded")
+        elif status == "resumed":
+            print(f"    ✅ {name}: resumed at byte {offset}, {sent} bytes sent")
+        else:
+            print(f"    ✅ {name}: {sent} bytes sent")
+
+    # The md5 column must describe the uploaded files
+    for line_counter, gzFile, md5 in rows:
+        if md5 and gzFile in checksums and md5 != checksums[gzFile]:
+            mismatched += 1
+            print(f"    Error: Line {line_counter}: md5 mismatch for '{gzFile}' (tsv {md5}, uploaded {checksums[gzFile]}).")
+
+    sent_mib = uploader.sent_bytes / 1024 ** 2
+    rate = sent_mib / seconds if seconds else 0.0
+    print(f"    {counts['uploaded']} uploaded, {counts['resumed']} resumed, {counts['skipped']} already uploaded, "
+          f"{failed} failed ({sent_mib:.1f} MiB in {seconds:.1f}s, {rate:.1f} MiB/s, {args.host}).")
+    if failed or mismatched:
+        sys.exit(1)
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from array import array
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.xml_stream import INDENT
+from common.compression import open_input
+from common.xsd_validation import validate_element
+from common.receipts import AccessionIndex, DEFAULT_INDEX
+from common.checklist import DEFAULT_CHECKLIST, ChecklistError, load_checklist, convert_rows
+
+"""
+Usage: watch.py [-h] [--sam SAM] [--runexp RUNEXP] [--checklist CHECKLIST] [--interval SECONDS]
+                [--accessions [INDEX]] [--no-validate]
+
+Watch mode for metadata curation: keep sam.xml, exp.xml and run.xml up to date while the TSVs are edited.
+
+The TSVs are polled (a stat() per interval, so it works for every editor and file system). On a change:
+  - every line is hashed and compared with the previous version of the file,
+  - only new or modified lines are converted (and validated against the ENA XSD),
+  - the XML file is patched: everything before the first changed line stays in place, and the
+    serialized elements of unchanged lines after it are copied from the old file as byte ranges
+    (in the kernel where possible) instead of being rebuilt.
+An edit near the end of a sheet (the usual case when rows are added) only writes the new rows.
+The output is byte-identical to the converters. A changed header or checklist rebuilds the file.
+
+    python3 common/watch.py           # samSubmit/sam.tsv and runExpSubmit/runExp.tsv, Ctrl-C to stop
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SAM = os.path.join(REPO_DIR, "samSubmit", "sam.tsv")
+DEFAULT_RUNEXP = os.path.join(REPO_DIR, "runExpSubmit", "runExp.tsv")
+
+DECLARATION = b"<?xml version='1.0' encoding='UTF-8'?>\n"
+COPY_CHUNK = 16 * 1024 ** 2
+
+
+def copy_range(src, dst, offset, length):
+    """
+    Append `length` bytes of file `src` starting at `offset` to file `dst` (both opened in binary mode).
+    """
+    dst.flush()
+    try:
+        while length > 0:
+            copied = os.copy_file_range(src.fileno(), dst.fileno(), length, offset)
+            if copied == 0:
+                break
+            offset += copied
+            length -= copied
+        dst.seek(0, os.SEEK_END)
+    except (AttributeError, OSError):
+        src.seek(offset)
+        while length > 0:
+            block = src.read(min(length, COPY_CHUNK))
+            if not block:
+                break
+            dst.write(block)
+            length -= len(block)
+
+
+class FragmentWriter:
+    """
+    Writer collecting the serialized element of every converted line: {line: bytes}.
+    The bytes are exactly what StreamingSetWriter writes for the element.
+    """
+
+    def __init__(self, validate=True):
+        self.validate = validate
+        self.fragments = {}  # line -> serialized element
+        self.errors = {}     # line -> XSD error messages
+
+    def write(self, element, line=None):
+        if self.validate:
+            errors = validate_element(element)
+            if errors:
+                self.errors[line] = [f"{element.tag} '{element.get('alias')}': {message}" for message in errors]
+        etree.indent(element, space=INDENT, level=1)
+        self.fragments[line] = ("\n" + INDENT).encode() + etree.tostring(element, encoding="UTF-8")
+
+
+class WatchedOutput:
+    """
+    One XML output of a watched TSV, with the byte range of every TSV line's element in the current file.
+    """
+
+    def __init__(self, object_type, xmlOutFile, root_tag):
+        self.object_type = object_type
+        self.xmlOutFile = xmlOutFile
+        self.head = DECLARATION + f"<{root_tag}>".encode()
+        self.tail = f"\n</{root_tag}>\n".encode()
+        self.empty = DECLARATION + f"<{root_tag}/>\n".encode()
+        self.starts = array('q')   # line index -> offset of its element
+        self.lengths = array('q')  # line index -> length of its element (0: no element)
+        self.errors = {}           # line hash -> XSD error messages
+        self.count = 0             # elements in the file
+
+    def reset(self):
+        """
+        Forget the current file: the next patch rebuilds it.
+        """
+        self.starts, self.lengths, self.errors, self.count = array('q'), array('q'), {}, 0
+
+    def patch(self, hashes, first_changed, changed, old_lines, fragments, errors):
+        """
+        Update the file for the new line `hashes`. Lines before `first_changed` are unchanged; `changed`
+        lists the converted lines, whose elements/XSD errors are in `fragments`/`errors` (by line index);
+        `old_lines` maps the hash of an old line after `first_changed` to its index.
+        Returns the number of invalid elements in the file.
+        """
+        # XSD errors of the lines still present, plus those of the converted lines
+        if self.errors:
+            current = set(hashes)
+            new_errors = {line_hash: messages for line_hash, messages in self.errors.items() if line_hash in current}
+        else:
+            new_errors = {}
+        new_errors.update((hashes[index], messages) for index, messages in errors.items())
+        invalid = sum(1 for line_hash in hashes if line_hash in new_errors) if new_errors else 0
+
+        # lines edited in place without changing the length of their element: overwrite only those bytes
+        if self.count and len(hashes) == len(self.lengths) and all(len(fragments.get(index, b"")) == self.lengths[index]
+                                                    for index in changed):
+            with open(self.xmlOutFile, 'r+b') as out:
+                for index in changed:
+                    if self.lengths[index]:
+                        out.seek(self.starts[index])
+                        out.write(fragments[index])
+            self.errors = new_errors
+            return invalid
+
+        if self.count == 0:
+            first_changed = 0  # no reusable prefix: rebuild from the head
+        prefix_end = self.starts[first_changed - 1] + self.lengths[first_changed - 1] if first_changed else len(self.head)
+        starts = self.starts[:first_changed]
+        lengths = self.lengths[:first_changed]
+        count = len(lengths) - lengths.count(0)
+
+        # Keep the prefix in place and rewrite only the rest (copied twice), unless the rest is the larger
+        # part: then write a new file (copying the prefix once) and replace the old one.
+        old_size = os.path.getsize(self.xmlOutFile) if self.count else 0
+        in_place = prefix_end > len(self.head) and prefix_end >= old_size - prefix_end
+        tmpFile = self.xmlOutFile + ".tmp"
+        with (tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.xmlOutFile))) if in_place
+              else open(tmpFile, 'w+b')) as rest, \
+                open(self.xmlOutFile if self.count else os.devnull, 'rb') as old:
+            if not in_place:
+                if first_changed:
+                    copy_range(old, rest, 0, prefix_end)
+                else:
+                    rest.write(self.head)
+
+            offset = prefix_end
+            pending = None  # (offset, length) of old bytes still to be copied, merged while contiguous
+            for index in range(first_changed, len(hashes)):
+                line_hash = hashes[index]
+                if index in fragments or line_hash not in old_lines:
+                    data = fragments.get(index, b"")
+                    if pending:
+                        copy_range(old, rest, *pending)
+                        pending = None
+                    rest.write(data)
+                    length = len(data)
+                else:
+                    old_index = old_lines[line_hash]
+                    start, length = self.starts[old_index], self.lengths[old_index]
+                    if length:
+                        if pending and pending[0] + pending[1] == start:
+                            pending = (pending[0], pending[1] + length)
+                        else:
+                            if pending:
+                                copy_range(old, rest, *pending)
+                            pending = (start, length)
+                starts.append(offset)
+                lengths.append(length)
+                offset += length
+                count += 1 if length else 0
+            if pending:
+                copy_range(old, rest, *pending)
+
+            if in_place:
+                rest.flush()
+                with open(self.xmlOutFile, 'r+b') as out:
+                    out.seek(prefix_end)
+                    rest.seek(0)
+                    shutil.copyfileobj(rest, out, COPY_CHUNK)
+                    out.write(self.tail)
+                    out.truncate()
+            elif count == 0:
+                rest.seek(0)
+                rest.write(self.empty)
+                rest.truncate()
+            else:
+                rest.write(self.tail)
+        if not in_place:
+            os.replace(tmpFile, self.xmlOutFile)
+
+        self.starts, self.lengths, self.errors, self.count = starts, lengths, new_errors, count
+        return invalid
+
+
+class WatchedTable:
+    """
+    A watched TSV and its XML outputs. Keeps the hash of every line of the last version of the file.
+    """
+
+    def __init__(self, tsvInFile, table, outputs, checklist=DEFAULT_CHECKLIST, accessions=None, validate=True):
+        self.tsvInFile = tsvInFile
+        self.table = table
+        self.outputs = outputs  # [WatchedOutput]
+        self.checklist = checklist
+        self.accessions = accessions
+        self.validate = validate
+        self.hashes = []        # line index -> hash of the line
+        self.layout = None
+        self.stat = None        # (mtime, size) of the last version processed
+
+    def changed(self):
+        """
+        True if the TSV was modified since the last refresh.
+        """
+        try:
+            st = os.stat(self.tsvInFile)
+        except FileNotFoundError:
+            return False
+        return (st.st_mtime_ns, st.st_size) != self.stat
+
+    def refresh(self):
+        """
+        Convert the new/modified lines and patch the XML outputs.
+        Returns (changed lines, invalid elements per output).
+        """
+        st = os.stat(self.tsvInFile)
+        self.stat = (st.st_mtime_ns, st.st_size)
+        with open_input(self.tsvInFile) as f:
+            lines = f.readlines()
+        hashes = list(map(hash, lines))
+
+        # a different header (or checklist) changes every element: start over
+        config = load_checklist(self.checklist)
+        first = next((line for line in lines if line.strip()), None)
+        layout = config.layout(self.table, first)
+        missing = not all(os.path.exists(output.xmlOutFile) for output in self.outputs)
+        if self.layout is None or vars(layout) != vars(self.layout) or missing:
+            self.layout = layout
+            self.hashes = []
+            for output in self.outputs:
+                output.reset()
+
+        first_changed = 0
+        for old_hash, new_hash in zip(self.hashes, hashes):
+            if old_hash != new_hash:
+                break
+            first_changed += 1
+        old_lines = {line_hash: index for index, line_hash in enumerate(self.hashes[first_changed:], first_changed)}
+        if len(hashes) == len(self.hashes):
+            # same number of lines: convert every line that differs, so it can be patched in place
+            changed = [index for index in range(first_changed, len(hashes)) if hashes[index] != self.hashes[index]]
+        else:
+            changed = [index for index in range(first_changed, len(hashes)) if hashes[index] not in old_lines]
+
+        # convert the changed lines, run by run of consecutive lines (for the warnings' line numbers)
+        writers = [FragmentWriter(self.validate) for _ in self.outputs]
+        targets = [(config.emitter(output.object_type, layout, self.accessions), writer,
+                    f"{output.object_type.lower()} " if len(self.outputs) > 1 else "")
+                   for output, writer in zip(self.outputs, writers)]
+        start = 0
+        while start < len(changed):
+            end = start
+            while end + 1 < len(changed) and changed[end + 1] == changed[end] + 1:
+                end += 1
+            convert_rows(lines[changed[start]:changed[end] + 1], changed[start] + 1, layout, targets)
+            start = end + 1
+
+        invalid = []
+        for output, writer in zip(self.outputs, writers):
+            fragments = {line - 1: data for line, data in writer.fragments.items()}
+            errors = {line - 1: messages for line, messages in writer.errors.items()}
+            for line, messages in sorted(writer.errors.items()):
+                for message in messages:
+                    print(f"Error: {os.path.basename(self.tsvInFile)} line {line} ({message})")
+            if first_changed < max(len(hashes), len(self.hashes)) or output.count == 0:
+                invalid.append(output.patch(hashes, first_changed, changed, old_lines, fragments, errors))
+            else:
+                invalid.append(sum(1 for line_hash in hashes if line_hash in output.errors))
+        self.hashes = hashes
+        return len(changed), invalid
+
+
+def watch(tables, interval=0.5):
+    """
+    Poll the watched TSVs and refresh the ones that changed, until interrupted.
+    """
+    first = True
+    while True:
+        for table in tables:
+            if not (first or table.changed()):
+                continue
+            start = time.perf_counter()
+            try:
+                changed, invalid = table.refresh()
+            except FileNotFoundError:
+                print(f"    Error: The file '{table.tsvInFile}' does not exist.")
+                continue
+            except ChecklistError as e:
+                print(f"    Error: {e}")
+                continue
+            seconds = time.perf_counter() - start
+            outputs = ", ".join(f"{os.path.basename(output.xmlOutFile)} ({output.count} objects, {bad} invalid)"
+                                for output, bad in zip(table.outputs, invalid))
+            print(f"    {time.strftime('%H:%M:%S')} {os.path.basename(table.tsvInFile)}: {changed} changed lines "
+                  f"-> {outputs} in {seconds:.2f} s")
+        first = False
+        time.sleep(interval)
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Regenerate sam.xml, exp.xml and run.xml incrementally while sam.tsv and runExp.tsv are edited."
+    )
+    parser.add_argument("--sam", help="Sample TSV.", default=DEFAULT_SAM)
+    parser.add_argument("--runexp", help="Shared experiment/run TSV.", default=DEFAULT_RUNEXP)
+    parser.add_argument("--checklist", help="Checklist config (JSON).", default=DEFAULT_CHECKLIST)
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between two polls of the TSVs.")
+    parser.add_argument(
+        "--accessions",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Alias -> accession index (default index: accessions.sqlite, see common/receipts.py).",
+        default=None
+    )
+    parser.add_argument("--no-validate", action="store_true", help="Do not validate the changed elements.")
+
+    # Parse arguments
+    args = parser.parse_args()
+    accessions = AccessionIndex(args.accessions) if args.accessions else None
+    samDir = os.path.dirname(os.path.abspath(args.sam))
+    runExpDir = os.path.dirname(os.path.abspath(args.runexp))
+    tables = [
+        WatchedTable(args.sam, "sam", [WatchedOutput("SAMPLE", os.path.join(samDir, "sam.xml"), "SAMPLE_SET")],
+                     args.checklist, accessions, not args.no_validate),
+        WatchedTable(args.runexp, "runExp", [WatchedOutput("EXPERIMENT", os.path.join(runExpDir, "exp.xml"), "EXPERIMENT_SET"),
+                                             WatchedOutput("RUN", os.path.join(runExpDir, "run.xml"), "RUN_SET")],
+                     args.checklist, accessions, not args.no_validate),
+    ]
+
+    print(f"    Watching '{args.sam}' and '{args.runexp}' (Ctrl-C to stop)...")
+    try:
+        watch(tables, args.interval)
+    except KeyboardInterrupt:
+        print("    Stopped.")
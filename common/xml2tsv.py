@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+import argparse
+import io
+import os
+import string
+import sys
+from collections import deque
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.checklist import DEFAULT_CHECKLIST, ChecklistError, load_checklist
+from common.compression import CompressionError, open_input, open_output, split_compression
+from common.receipts import AccessionIndex, DEFAULT_INDEX
+
+"""
+Usage: xml2tsv.py [-h] -o OUTPUT [--checklist CHECKLIST] [--accessions [INDEX]] [--no-header] XML [XML ...]
+
+Convert SAMPLE_SET/EXPERIMENT_SET/RUN_SET XML (ours or downloaded from ENA) back into the TSV the
+converters read, e.g. to prepare a MODIFY submission from the submitted state or to diff it against
+the curated sheet:
+    xml2tsv.py samSubmit/sam.xml -o sam.current.tsv
+    xml2tsv.py runExpSubmit/exp.xml runExpSubmit/run.xml -o runExp.current.tsv --no-header
+
+The reverse mapping is derived from the same checklist config as the converters: every template
+value that is a single {field} is read back from its element/attribute (repeated elements such as
+SAMPLE_ATTRIBUTE are told apart by their constant TAG), and derived values are inverted where they
+can be (an accession "given" in the TSV, a refname "unless" an accession, a checksum defaulting to
+the md5 column). Values the XML does not contain (left-out optional attributes) are written as the
+checklist's ignore value (IGNORE), so `TSV -> XML -> TSV -> XML` gives the same XML.
+
+XML files of one table (exp.xml + run.xml -> runExp.tsv) are read side by side and their objects
+paired by the fields both contain (sample and experiment alias). In files written by the converters
+the pairs are in the same order, so memory stays bounded; objects that only appear later are held
+until their partner is read. The files are iterparsed one object at a time and every processed
+element is cleared. Input and output may be compressed (.gz/.zst).
+
+An object that references another one by accession only (e.g. SAMPLE_DESCRIPTOR accession="ERS...")
+gets the alias from the accession index with --accessions, else the accession itself.
+"""
+
+
+def single_field(template, constants):
+    """
+    Name of the field if `template` is exactly "{field}" (and not a constant), else None.
+    """
+    parts = list(string.Formatter().parse(template))
+    if len(parts) == 1 and not parts[0][0] and parts[0][1] and parts[0][1] not in constants:
+        return parts[0][1]
+    return None
+
+
+def constant_text(template, constants):
+    """
+    Text of a template element like ["TAG", "host sex"] if it is constant, else None.
+    """
+    if not isinstance(template, list) or len(template) != 2 or not isinstance(template[1], str):
+        return None
+    parts = list(string.Formatter().parse(template[1]))
+    if any(field and field not in constants for _, field, _, _ in parts):
+        return None
+    return "".join(literal + (constants[field] if field else "") for literal, field, _, _ in parts)
+
+
+class _Node:
+    """
+    Compiled template element: where its single-field values are and how to match its children.
+    """
+
+    def __init__(self):
+        self.attributes = []  # (attribute, field)
+        self.text = None      # field read from the text
+        self.children = {}    # tag -> _Node
+        self.keyed = {}       # repeated tag -> (key child tag, {key text: _Node})
+        self.any = None       # _Node of a child whose tag is a {field}
+        self.tag_field = None  # field read from the tag
+
+
+class Extractor:
+    """
+    Inverse of an Emitter: reads the table fields of one object type back from its elements.
+    """
+
+    def __init__(self, checklist, object_type, accessions=None):
+        if object_type not in checklist.objects:
+            raise ChecklistError(f"{checklist.name}: no {object_type} objects in the checklist")
+        spec = checklist.objects[object_type]
+        self.object_type = object_type
+        self.table = spec["table"]
+        self.fields = list(checklist.tables[self.table])
+        self.ignore = checklist.ignore_value
+        self.accessions = accessions
+        self.constants = checklist.constants
+        self.root = self._compile(spec["template"])
+        self.derived = list(spec.get("derived", {}).items())
+
+        # the table fields an element of this type gives back
+        found = set(self._names(self.root))
+        for name, derivation in reversed(self.derived):
+            found.update(self._invert(name, derivation, dict.fromkeys(found, "x"), resolve=False))
+        self.produces = [field for field in self.fields if field in found]
+
+    def _compile(self, template):
+        node = _Node()
+        tag, children = template[0], template[1:]
+        attributes = children.pop(0) if children and isinstance(children[0], dict) else {}
+        node.tag_field = single_field(tag, self.constants)
+        for name, value in attributes.items():
+            field = single_field(value, self.constants) if name != "@optional" else None
+            if field:
+                node.attributes.append((name, field))
+
+        elements = [child for child in children if isinstance(child, list)]
+        for child in children:
+            if isinstance(child, str):
+                node.text = single_field(child, self.constants)
+
+        repeated = {}
+        for child in elements:
+            if single_field(child[0], self.constants):
+                node.any = self._compile(child)
+            else:
+                repeated.setdefault(child[0], []).append(child)
+        for tag, siblings in repeated.items():
+            if len(siblings) == 1:
+                node.children[tag] = self._compile(siblings[0])
+                continue
+            # repeated siblings (SAMPLE_ATTRIBUTE) are keyed by their first constant child text (TAG)
+            key_tag = None
+            by_key = {}
+            for sibling in siblings:
+                for grandchild in sibling[1:]:
+                    text = constant_text(grandchild, self.constants)
+                    if text is not None:
+                        key_tag = key_tag or grandchild[0]
+                        if grandchild[0] == key_tag:
+                            by_key[text] = self._compile(sibling)
+                        break
+            node.keyed[tag] = (key_tag, by_key)
+
+        # drop the subtrees without values (SAMPLE_NAME, LIBRARY_DESCRIPTOR, ...) so they are not walked
+        node.children = {tag: child for tag, child in node.children.items() if next(self._names(child), None)}
+        node.keyed = {tag: (key_tag, {key: child for key, child in by_key.items() if next(self._names(child), None)})
+                      for tag, (key_tag, by_key) in node.keyed.items()}
+        if node.any is not None and next(self._names(node.any), None) is None:
+            node.any = None
+        return node
+
+    def _names(self, node):
+        for _, field in node.attributes:
+            yield field
+        if node.text:
+            yield node.text
+        if node.tag_field:
+            yield node.tag_field
+        for child in node.children.values():
+            yield from self._names(child)
+        for _, by_key in node.keyed.values():
+            for child in by_key.values():
+                yield from self._names(child)
+        if node.any is not None:
+            yield from self._names(node.any)
+
+    def _invert(self, name, derivation, values, resolve=True):
+        """
+        Table/derived values recovered from the derived value `name`: {field: value}.
+        With resolve=False the accession index is not consulted.
+        """
+        value = values.get(name)
+        if not value:
+            return {}
+        if "accession" in derivation:
+            recovered = {}
+            if "given" in derivation:
+                recovered[derivation["given"]] = value
+            alias = derivation["alias"]
+            if not values.get(alias):
+                # referenced by accession only: find the alias in the index, else keep the accession
+                found = None
+                if resolve and self.accessions is not None:
+                    found = self.accessions.alias_of(derivation["accession"], value)
+                recovered[alias] = found or value
+            return recovered
+        if "unless" in derivation or "lookup" in derivation:
+            field = single_field(derivation.get("value", derivation.get("default", "")), self.constants)
+            return {field: value} if field else {}
+        return {}  # "contains"/"map" values are not invertible (their source field is in the XML itself)
+
+    def _walk(self, node, element, values):
+        for name, field in node.attributes:
+            value = element.get(name)
+            if value is not None:
+                values[field] = value
+        if node.text:
+            values[node.text] = element.text or ""
+        if node.tag_field:
+            values[node.tag_field] = element.tag
+        for child in element:
+            if not isinstance(child.tag, str):  # comments, processing instructions
+                continue
+            sub = node.children.get(child.tag)
+            if sub is None and child.tag in node.keyed:
+                key_tag, by_key = node.keyed[child.tag]
+                key = child.findtext(key_tag) if key_tag else None
+                sub = by_key.get(key)
+            elif sub is None and node.any is not None:
+                sub = node.any
+            if sub is not None:
+                self._walk(sub, child, values)
+
+    def extract(self, element):
+        """
+        Return {field: value} for the fields this object type produces (IGNORE when not in the XML).
+        """
+        values = {}
+        self._walk(self.root, element, values)
+        for name, derivation in reversed(self.derived):
+            for field, value in self._invert(name, derivation, values).items():
+                if not values.get(field):
+                    values[field] = value
+        row = {}
+        for field in self.produces:
+            value = values.get(field)
+            # a tab or line break would break the TSV row
+            row[field] = value.replace("\t", " ").replace("\r", " ").replace("\n", " ") if value else self.ignore
+        return row
+
+
+def set_object_type(xmlFile):
+    """
+    Object type of an XML file from its root element (SAMPLE_SET -> SAMPLE).
+    """
+    with open_input(xmlFile, 'rb') as f:
+        for _, element in etree.iterparse(f, events=("start",)):
+            tag = element.tag
+            return tag[:-len("_SET")] if tag.endswith("_SET") else tag
+    return None
+
+
+def iter_objects(xmlFile, object_type):
+    """
+    Iterparse the object elements of a *_SET file, clearing each one once the caller is done with it.
+    """
+    with open_input(xmlFile, 'rb') as f:
+        for _, element in etree.iterparse(f, events=("end",), tag=object_type):
+            parent = element.getparent()
+            if parent is None or not parent.tag.endswith("_SET"):
+                continue
+            yield element
+            # release the processed element and its preceding siblings
+            element.clear()
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def open_rows(xmlFiles, checklist=DEFAULT_CHECKLIST, accessions=None, unmatched=None):
+    """
+    Read one or two XML files of the same table. Returns (table, iterator of TSV rows), each row a list
+    of values in the table's column order. Objects of two files are paired by their shared fields;
+    `unmatched` (if given) counts the objects of each type that had no partner.
+    """
+    config = load_checklist(checklist)
+    extractors = [Extractor(config, set_object_type(xmlFile), accessions) for xmlFile in xmlFiles]
+    tables = {extractor.table for extractor in extractors}
+    if len(tables) != 1 or len(extractors) > 2 or len({e.object_type for e in extractors}) != len(extractors):
+        raise ChecklistError("Give one XML file, or two XML files of different objects of the same table "
+                             f"(got {', '.join(e.object_type for e in extractors)}).")
+    table = tables.pop()
+    streams = [_extracted(xmlFile, extractor) for xmlFile, extractor in zip(xmlFiles, extractors)]
+    if len(streams) == 1:
+        fields = list(config.tables[table])
+        return table, ([values.get(field, config.ignore_value) for field in fields] for values in streams[0])
+    return table, _paired_rows(config, table, extractors, streams, unmatched)
+
+
+def _extracted(xmlFile, extractor):
+    for element in iter_objects(xmlFile, extractor.object_type):
+        yield extractor.extract(element)
+
+
+def _paired_rows(config, table, extractors, streams, unmatched):
+    fields = list(config.tables[table])
+    first, second = extractors
+    keys = [field for field in first.produces if field in second.produces]
+
+    def row(values_first, values_second):
+        return [values_first[field] if field in values_first
+                else values_second[field] if field in values_second
+                else config.ignore_value for field in fields]
+
+    # read both files side by side; objects without a partner yet wait in `pending`
+    pending = ({}, {})
+    iterators = [iter(stream) for stream in streams]
+    while iterators[0] is not None or iterators[1] is not None:
+        for side in (0, 1):
+            if iterators[side] is None:
+                continue
+            values = next(iterators[side], None)
+            if values is None:
+                iterators[side] = None
+                continue
+            key = tuple(values[field] for field in keys)
+            waiting = pending[1 - side].get(key)
+            if waiting:
+                partner = waiting.popleft()
+                if not waiting:
+                    del pending[1 - side][key]
+                yield row(values, partner) if side == 0 else row(partner, values)
+            else:
+                pending[side].setdefault(key, deque()).append(values)
+
+    # objects that never found a partner
+    for side, extractor in enumerate(extractors):
+        for waiting in pending[side].values():
+            for values in waiting:
+                if unmatched is not None:
+                    unmatched[extractor.object_type] = unmatched.get(extractor.object_type, 0) + 1
+                yield row(values, {})
+
+
+def xml2tsv(xmlFiles, tsvOutFile, checklist=DEFAULT_CHECKLIST, accessions=None, header=True):
+    """
+    Write the TSV rows of one or two XML files (see open_rows) to tsvOutFile.
+    Returns (rows written, {object type: objects without a partner}).
+    """
+    unmatched = {}
+    table, rows = open_rows(xmlFiles, checklist, accessions, unmatched)
+    config = load_checklist(checklist)
+    count = 0
+    base, compression = split_compression(tsvOutFile)
+    tmpFile = base + ".tmp" + compression  # keep the extension that selects the compression
+    try:
+        with io.TextIOWrapper(open_output(tmpFile), encoding="UTF-8", newline="\n") as f:
+            if header:
+                f.write("\t".join(config.tables[table].values()) + "\n")
+            for values in rows:
+                f.write("\t".join(values) + "\n")
+                count += 1
+    except BaseException:
+        os.remove(tmpFile)
+        raise
+    os.replace(tmpFile, tsvOutFile)
+    return count, unmatched
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Convert SAMPLE/EXPERIMENT/RUN XML (ours or downloaded from ENA) back into the converters' TSV."
+    )
+    parser.add_argument("xml", nargs="+",
+                        help="sam.xml, or exp.xml and/or run.xml (written to one runExp TSV); .gz/.zst accepted.")
+    parser.add_argument("-o", "--output", required=True, help="TSV file to write (.gz/.zst to compress).")
+    parser.add_argument(
+        "--checklist",
+        help="Checklist config (JSON) defining the TSV columns and the XML structure.",
+        default=DEFAULT_CHECKLIST
+    )
+    parser.add_argument(
+        "--accessions",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Alias -> accession index used to turn accession-only references back into aliases "
+             "(default index: accessions.sqlite, see common/receipts.py).",
+        default=None
+    )
+    parser.add_argument("--no-header", action="store_true",
+                        help="Do not write the header line (runExp.tsv has none).")
+
+    # Parse arguments
+    args = parser.parse_args()
+    accessions = AccessionIndex(args.accessions) if args.accessions else None
+    try:
+        count, unmatched = xml2tsv(args.xml, args.output, args.checklist, accessions, not args.no_header)
+    except FileNotFoundError as e:
+        print(f"    Error: The file '{e.filename}' does not exist.")
+        sys.exit(1)
+    except etree.XMLSyntaxError as e:
+        print(f"    Error: {e}")
+        sys.exit(1)
+    except (ChecklistError, CompressionError) as e:
+        print(f"    Error: {e}")
+        sys.exit(1)
+
+    for object_type, objects in unmatched.items():
+        print(f"    Warning: {objects} {object_type} objects have no partner in the other file; "
+              f"their other columns are {load_checklist(args.checklist).ignore_value}.")
+    print(f"    {count} rows successfully written to '{args.output}'.")
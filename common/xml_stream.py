@@ -0,0 +1,81 @@
+import time
+
+from lxml import etree
+
+from common.compression import open_output
+from common.metrics import active_metrics
+
+"""
+Incremental XML writer shared by the TSV -> XML converters.
+
+Each SAMPLE/EXPERIMENT/RUN element is serialized to disk as soon as it is built,
+so memory stays flat regardless of the number of TSV rows. The bytes written are
+identical to `ElementTree.write(pretty_print=True, xml_declaration=True, encoding="UTF-8")`
+on the equivalent in-memory *_SET tree. Output files named *.gz/*.zst are compressed on the fly.
+"""
+
+INDENT = "  "
+
+
+class StreamingSetWriter:
+    """
+    Stream child elements of a *_SET root element (e.g. SAMPLE_SET) to a file.
+
+    Usage:
+        with StreamingSetWriter("sam.xml", "SAMPLE_SET") as writer:
+            writer.write(sample_element)
+    """
+
+    def __init__(self, xmlOutFile, root_tag):
+        self.xmlOutFile = xmlOutFile
+        self.root_tag = root_tag
+        self.count = 0  # Number of child elements written
+        self._file = None
+        self._xf_context = None
+        self._xf = None
+        self._root_context = None
+
+    def __enter__(self):
+        self._file = open_output(self.xmlOutFile)
+        self._xf_context = etree.xmlfile(self._file, encoding="UTF-8")
+        self._xf = self._xf_context.__enter__()
+        self._xf.write_declaration()
+        return self
+
+    def write(self, element, line=None):
+        """
+        Serialize one child element of the root and release it.
+        `line` (the TSV line the element came from) is only used by wrapping writers.
+        """
+        # open the root lazily: an empty set must be written as <ROOT/>
+        if self._root_context is None:
+            self._root_context = self._xf.element(self.root_tag)
+            self._root_context.__enter__()
+
+        metrics = active_metrics()
+        if metrics is None:
+            etree.indent(element, space=INDENT, level=1)
+            self._xf.write("\n" + INDENT, element)
+        else:
+            start = time.perf_counter()
+            etree.indent(element, space=INDENT, level=1)
+            indented = time.perf_counter()
+            self._xf.write("\n" + INDENT, element)
+            metrics.add("indent", indented - start)
+            metrics.add("write", time.perf_counter() - indented)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                if self._root_context is None:
+                    self._xf.write(etree.Element(self.root_tag))
+                else:
+                    self._xf.write("\n")
+                    self._root_context.__exit__(None, None, None)
+            self._xf_context.__exit__(exc_type, exc_value, traceback)
+            if exc_type is None:
+                self._file.write(b"\n")
+        finally:
+            self._file.close()
+        return False
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+from functools import lru_cache
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.compression import CompressionError, open_input
+from common.metrics import active_metrics
+
+"""
+Usage: xsd_validation.py [-h] XML [XML ...]
+
+Offline validation of SAMPLE/EXPERIMENT/RUN XML against the vendored ENA SRA schemas (common/xsd/).
+
+The converters validate each element as the streaming writer produces it (`--validate`), so huge
+files never have to be loaded; errors are reported with the TSV line the element came from.
+Existing XML files can be checked from the command line; they are iterparsed one object at a time.
+"""
+
+XSD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "xsd")
+
+SCHEMA_FILES = {
+    "SAMPLE": "SRA.sample.xsd",
+    "EXPERIMENT": "SRA.experiment.xsd",
+    "RUN": "SRA.run.xsd",
+}
+
+
+@lru_cache(maxsize=None)
+def get_schema(object_type):
+    """
+    Return the compiled XMLSchema for an object type (compiled once per process).
+    """
+    return etree.XMLSchema(etree.parse(os.path.join(XSD_DIR, SCHEMA_FILES[object_type])))
+
+
+def validate_element(element):
+    """
+    Validate one SAMPLE/EXPERIMENT/RUN element. Returns a list of error messages.
+    """
+    schema = get_schema(element.tag)
+    if schema.validate(element):
+        return []
+    return [error.message for error in schema.error_log]
+
+
+class ValidatingWriter:
+    """
+    Wrap a set writer and validate every element before it is written.
+
+    Errors are printed with the source TSV line passed by the converters
+    and counted in `invalid`; elements are written either way.
+    """
+
+    def __init__(self, writer, source=None):
+        self.writer = writer
+        self.source = source
+        self.invalid = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def write(self, element, line=None):
+        metrics = active_metrics()
+        if metrics is None:
+            errors = validate_element(element)
+        else:
+            start = time.perf_counter()
+            errors = validate_element(element)
+            metrics.add("validate", time.perf_counter() - start)
+        if errors:
+            self.invalid += 1
+            where = f"line {line}" if line else "unknown line"
+            if self.source:
+                where = f"{os.path.basename(self.source)} {where}"
+            for message in errors:
+                print(f"Error: {where} ({element.tag} '{element.get('alias')}'): {message}")
+        self.writer.write(element, line)
+
+
+def validate_file(xmlFile):
+    """
+    Iterparse an XML file (optionally .gz/.zst) and validate each object element with bounded memory.
+    Returns (objects checked, invalid objects).
+    """
+    checked = invalid = 0
+    with open_input(xmlFile, 'rb') as f:
+        for _, element in etree.iterparse(f, events=("end",), tag=tuple(SCHEMA_FILES)):
+            if element.getparent() is not None and element.getparent().tag.endswith("_SET"):
+                checked += 1
+                errors = validate_element(element)
+                if errors:
+                    invalid += 1
+                    for message in errors:
+                        print(f"Error: {xmlFile} line {element.sourceline} ({element.tag} '{element.get('alias')}'): {message}")
+                # release the processed element and its preceding siblings
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+    return checked, invalid
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Validate SAMPLE_SET/EXPERIMENT_SET/RUN_SET XML files against the vendored ENA SRA schemas."
+    )
+    parser.add_argument("xml", nargs="+", help="XML files to validate.")
+
+    # Parse arguments
+    args = parser.parse_args()
+    failed = False
+    for xmlFile in args.xml:
+        try:
+            checked, invalid = validate_file(xmlFile)
+        except (OSError, etree.XMLSyntaxError, CompressionError) as e:
+            print(f"    Error: Cannot read '{xmlFile}': {e}")
+            sys.exit(1)
+        print(f"    {xmlFile}: {checked - invalid} of {checked} objects valid.")
+        failed = failed or invalid > 0
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common.checklist import DEFAULT_CHECKLIST, ChecklistError, load_checklist
+from common.compression import COMPRESSION_EXTENSIONS, CompressionError, open_input
+from samSubmit.create_sam_xml import tsv2XML as sam2XML
+from runExpSubmit.create_runexp_xml import tsv2XML as runexp2XML
+from exp.create_exp_xml import tsv2XML as exp2XML
+from run.create_run_xml import tsv2XML as run2XML
+
+"""
+Usage: create_batches.py [-h] [-o OUTDIR] [--workers N] [--checklist CHECKLIST] [--compress {.gz,.zst}]
+                         [--validate] [--overwrite] INDIR
+
+Convert a directory tree of per-run TSV sets (one sequencing run / flow cell per folder) in parallel.
+
+Every folder below INDIR that contains a sam.tsv, runExp.tsv, exp.tsv or run.tsv (optionally .gz/.zst) is
+one batch. Its XML is written to the same relative folder below OUTDIR:
+    INDIR/FAW12345/sam.tsv      -> OUTDIR/FAW12345/sam.xml
+    INDIR/FAW12345/runExp.tsv   -> OUTDIR/FAW12345/exp.xml + run.xml
+    (exp.tsv -> exp.xml and run.tsv -> run.xml when there is no runExp.tsv)
+Each TSV is converted by its single-file converter (create_sam_xml.py, create_runexp_xml.py, ...), so the
+XML is the same as theirs. The converter messages of a batch go to OUTDIR/<batch>/batch.log. A batch whose
+output folder already contains XML is not touched (use --overwrite).
+
+Batches are converted in a process pool sized to the available cores, largest first, so one big batch
+does not end up running alone at the end. The objects written and rows skipped per batch are printed
+and saved to OUTDIR/batch_summary.json.
+"""
+
+# TSV name: (converter, [(object type, XML name)])
+BATCH_FILES = {
+    "sam.tsv": (sam2XML, [("SAMPLE", "sam.xml")]),
+    "runExp.tsv": (runexp2XML, [("EXPERIMENT", "exp.xml"), ("RUN", "run.xml")]),
+    "exp.tsv": (exp2XML, [("EXPERIMENT", "exp.xml")]),
+    "run.tsv": (run2XML, [("RUN", "run.xml")]),
+}
+
+
+def find_tsv(directory, name):
+    """
+    Path of `name` (or name.gz/name.zst) in `directory`, or None.
+    """
+    for compression in ("",) + COMPRESSION_EXTENSIONS:
+        path = os.path.join(directory, name + compression)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def find_batches(inDir):
+    """
+    Return {batch name (path relative to inDir): {TSV name: path}} for every folder with TSVs to convert.
+    """
+    batches = {}
+    for directory, subdirs, _ in os.walk(inDir):
+        subdirs.sort()
+        tsvs = {name: find_tsv(directory, name) for name in BATCH_FILES}
+        tsvs = {name: path for name, path in tsvs.items() if path}
+        if "runExp.tsv" in tsvs:
+            tsvs.pop("exp.tsv", None)
+            tsvs.pop("run.tsv", None)
+        if tsvs:
+            batches[os.path.relpath(directory, inDir)] = tsvs
+    return batches
+
+
+def convert_batch(name, tsvs, batchDir, checklist=DEFAULT_CHECKLIST, compress="", validate=False):
+    """
+    Worker task: convert the TSVs of one batch into batchDir. Messages go to batchDir/batch.log.
+    Returns the batch's summary record.
+    """
+    record = {"batch": name, "status": "ok", "objects": {}, "skipped_rows": {}}
+    start = time.perf_counter()
+    os.makedirs(batchDir, exist_ok=True)
+    with open(os.path.join(batchDir, "batch.log"), 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            for tsvName, tsvInFile in tsvs.items():
+                convert, outputs = BATCH_FILES[tsvName]
+                try:
+                    written = convert(tsvInFile, *(os.path.join(batchDir, xmlName + compress) for _, xmlName in outputs),
+                                      validate=validate, checklist=checklist)
+                except SystemExit:  # elements failed XSD validation, reported in batch.log; go on with the next TSV
+                    record["status"] = "invalid"
+                    continue
+                if len(outputs) == 1:
+                    written = (written,)
+                with open_input(tsvInFile) as f:
+                    lines = sum(1 for _ in f)   # every line yields an object or is skipped
+                for (object_type, _), count in zip(outputs, written):
+                    record["objects"][object_type] = count
+                    record["skipped_rows"][object_type] = lines - count
+        except (OSError, ChecklistError, CompressionError) as e:
+            print(f"    Error: {e}")
+            record["status"] = "error"
+            record["error"] = str(e)
+        except Exception as e:  # e.g. an lxml error: reported for this batch, the others go on
+            print(f"    Error: {type(e).__name__}: {e}")
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def available_cores():
+    """
+    Number of cores this process may run on.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def print_summary(records):
+    """
+    Print one line per batch: objects written and rows skipped per object type.
+    """
+    for record in records:
+        counts = ", ".join(f"{count} {object_type.lower()} ({record['skipped_rows'][object_type]} skipped)"
+                           for object_type, count in record["objects"].items())
+        status = "" if record["status"] == "ok" else f" [{record['status']}{': ' + record['error'] if 'error' in record else ''}]"
+        seconds = f" in {record['seconds']:.2f} s" if record["seconds"] is not None else ""
+        print(f"    {record['batch']}: {counts or 'no objects'}{seconds}{status}")
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Convert a directory tree of per-run TSV sets into per-batch XML folders in parallel."
+    )
+    parser.add_argument("indir", help="Directory tree with one folder of TSVs per batch.")
+    parser.add_argument("-o", "--outdir", help="Output directory (one folder per batch).", default="batches")
+    parser.add_argument("--workers", type=int, help="Number of processes (default: available cores).", default=None)
+    parser.add_argument(
+        "--checklist",
+        help="Checklist config (JSON) defining the TSV columns and the XML structure.",
+        default=DEFAULT_CHECKLIST
+    )
+    parser.add_argument("--compress", choices=[".gz", ".zst"], default="", help="Write compressed XML.")
+    parser.add_argument("--validate", action="store_true",
+                        help="Validate every element against the vendored ENA XSD as it is written.")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Convert batches whose output folder already contains XML.")
+
+    # Parse arguments
+    args = parser.parse_args()
+    if not os.path.isdir(args.indir):
+        print(f"    Error: The directory '{args.indir}' does not exist.")
+        sys.exit(1)
+    try:
+        load_checklist(args.checklist)
+    except (OSError, ChecklistError) as e:
+        print(f"    Error: {e}")
+        sys.exit(1)
+
+    batches = find_batches(args.indir)
+    if not batches:
+        print(f"    Error: No sam/runExp/exp/run TSVs found below '{args.indir}'.")
+        sys.exit(1)
+
+    # never clobber the output of an earlier run
+    pending = {}
+    for name, tsvs in batches.items():
+        batchDir = os.path.normpath(os.path.join(args.outdir, name))
+        existing = [entry for entry in os.listdir(batchDir) if ".xml" in entry] if os.path.isdir(batchDir) else []
+        if existing and not args.overwrite:
+            print(f"    Warning: Skipping batch '{name}': '{batchDir}' already contains XML (use --overwrite).")
+            continue
+        pending[name] = (tsvs, batchDir)
+    if not pending:
+        print("    Nothing to convert.")
+        sys.exit(0)
+
+    # largest batches first, so the pool stays busy until the end
+    order = sorted(pending, key=lambda name: -sum(os.path.getsize(path) for path in pending[name][0].values()))
+    workers = max(1, min(args.workers or available_cores(), len(order)))
+    print(f"    Converting {len(order)} batches with {workers} processes...")
+
+    start = time.perf_counter()
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(convert_batch, name, *pending[name], args.checklist, args.compress, args.validate): name
+                   for name in order}
+        for future in as_completed(futures):
+            try:
+                records.append(future.result())
+            except Exception as e:  # the worker process died, or its result could not be returned
+                records.append({"batch": futures[future], "status": "error", "objects": {}, "skipped_rows": {},
+                                "error": f"{type(e).__name__}: {e}", "seconds": None})
+    seconds = time.perf_counter() - start
+
+    records.sort(key=lambda record: record["batch"])
+    print_summary(records)
+    os.makedirs(args.outdir, exist_ok=True)
+    summaryFile = os.path.join(args.outdir, "batch_summary.json")
+    with open(summaryFile, 'w') as f:
+        json.dump({"seconds": round(seconds, 3), "workers": workers, "batches": records}, f, indent=2)
+        f.write("\n")
+
+    totals = {}
+    for record in records:
+        for object_type, count in record["objects"].items():
+            totals[object_type] = totals.get(object_type, 0) + count
+    failed = [record for record in records if record["status"] != "ok"]
+    print(f"    {len(records)} batches ({', '.join(f'{count} {object_type.lower()}' for object_type, count in totals.items())}) "
+          f"in {seconds:.2f} s, summary written to '{summaryFile}'.")
+    if failed:
+        print(f"    Error: {len(failed)} batches failed, see their batch.log.")
+        sys.exit(1)
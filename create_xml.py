@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common.manifest import Manifest
+from common.receipts import AccessionIndex, DEFAULT_INDEX
+from common.aliases import AliasHistory
+from common.checklist import DEFAULT_CHECKLIST, ChecklistError
+from common.compression import CompressionError
+from common.metrics import start_metrics, stage
+from common.output_cache import OutputCache
+from samSubmit.create_sam_xml import tsv2XML as sam2XML
+from runExpSubmit.create_runexp_xml import tsv2XML as runexp2XML
+from run.create_run_xml import check_md5_column
+from common.column_checks import check_sam_tsv, print_report
+
+"""
+Usage: create_xml.py [-h] [--sam SAM] [--runexp RUNEXP] [--checklist CHECKLIST] [--md5 {off,fill,check}]
+                     [--check-values] [--compress {.gz,.zst}] [--delta] [--accessions [INDEX]] [--check-aliases [INDEX]] [--validate]
+                     [--metrics FILE] [--profile FILE] [--no-cache]
+
+Generate all submission XML in one process: samSubmit/sam.xml from sam.tsv, and runExpSubmit/exp.xml and
+runExpSubmit/run.xml from runExp.tsv. Every XML file is written next to its TSV.
+
+The checklist config is loaded and compiled once and shared by the SAMPLE, EXPERIMENT and RUN emitters.
+With --delta, the manifests samSubmit/sam.manifest.json and runExpSubmit/runExp.manifest.json are used
+and only new/changed objects are written (see common/manifest.py).
+
+Full runs are cached by content (see common/output_cache.py): if a TSV, the converter code, the
+checklist config and the options are unchanged, its XML is linked back from `.xml_cache/` next to
+it instead of being regenerated. --delta, --accessions and --check-aliases depend on state outside
+the TSV and always convert.
+
+Options:
+  --sam SAM               Sample TSV (default: samSubmit/sam.tsv).
+  --runexp RUNEXP         Shared experiment/run TSV (default: runExpSubmit/runExp.tsv).
+  --checklist CHECKLIST   Checklist config (default: common/checklists/usutu_ont.json).
+  --md5 {off,fill,check}  Hash the referenced fastq files before any XML is written (see create_runexp_xml.py).
+  --check-values          Check dates, coordinates and host sex of sam.tsv before any XML is written.
+  --compress {.gz,.zst}   Write compressed XML (sam.xml.gz, ...); compressed TSVs are read as well.
+  --delta                 Incremental mode.
+  --accessions [INDEX]    Fill in/reference accessions from the alias -> accession index.
+  --check-aliases [INDEX] Fail if an alias was submitted before (accession index + Bloom filter) or repeats.
+  --validate              Validate every element against the vendored ENA XSD as it is written.
+  --metrics FILE          Write per-stage timings, rows/sec, skipped rows and peak memory (JSON, or *.prom).
+  --profile FILE          Dump cProfile stats of the row loop.
+  --no-cache              Always convert, do not use or update the output cache.
+"""
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SAM = os.path.join(REPO_DIR, "samSubmit", "sam.tsv")
+DEFAULT_RUNEXP = os.path.join(REPO_DIR, "runExpSubmit", "runExp.tsv")
+
+
+def convert_cached(cache, inputs, outputs, checklist, options, convert):
+    """
+    Run `convert()`, which writes `outputs` and returns the object counts, unless `cache` holds the
+    outputs of the same inputs, code, checklist and options; those are linked into place instead.
+    Returns (counts, True if they came from the cache).
+    """
+    if cache is None:
+        return convert(), False
+    with stage("output_cache"):
+        key = cache.fingerprint(inputs, checklist, options)
+        counts = cache.lookup(key, outputs)
+        cache.save()
+    if counts is not None:
+        return counts, True
+    cache.detach(outputs)
+    counts = convert()
+    with stage("output_cache"):
+        cache.store(key, outputs, counts)
+    return counts, False
+
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Generate sam.xml, exp.xml and run.xml in one process from sam.tsv and runExp.tsv."
+    )
+    parser.add_argument("--sam", help="Sample TSV.", default=DEFAULT_SAM)
+    parser.add_argument("--runexp", help="Shared experiment/run TSV.", default=DEFAULT_RUNEXP)
+    parser.add_argument(
+        "--checklist",
+        help="Checklist config (JSON) defining the TSV columns and the SAMPLE/EXPERIMENT/RUN XML structure.",
+        default=DEFAULT_CHECKLIST
+    )
+    parser.add_argument(
+        "--md5",
+        choices=["off", "fill", "check"],
+        default="off",
+        help="Hash the referenced fastq files (in the directory of the runExp TSV) before any XML is written."
+    )
+    parser.add_argument(
+        "--check-values",
+        action="store_true",
+        help="Check the collection dates, coordinates and host sex of the sample TSV before any XML is written "
+             "(see common/column_checks.py)."
+    )
+    parser.add_argument(
+        "--compress",
+        choices=[".gz", ".zst"],
+        default="",
+        help="Write compressed XML (sam.xml.gz, exp.xml.gz, run.xml.gz or .zst), compressed in background threads."
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Incremental mode: write only new/changed objects to *.add.xml/*.modify.xml, compared with the "
+             "manifests of the last successful submission."
+    )
+    parser.add_argument(
+        "--accessions",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Alias -> accession index (default index: accessions.sqlite, see common/receipts.py).",
+        default=None
+    )
+    parser.add_argument(
+        "--check-aliases",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Report aliases that were already submitted (per the accession index, default: accessions.sqlite, "
+             "behind a Bloom filter) or appear twice, and fail after writing (see common/aliases.py).",
+        default=None
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Validate every element against the vendored ENA XSD as it is written."
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Write per-stage wall time, rows/sec, skipped rows by reason and peak memory to this file "
+             "when the run ends (JSON, or Prometheus text format for *.prom; see common/metrics.py).",
+        default=None
+    )
+    parser.add_argument(
+        "--profile",
+        help="Run the row loop under cProfile and dump the stats to this file (python3 -m pstats FILE).",
+        default=None
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always convert, without using or updating the output cache (.xml_cache/ next to each TSV)."
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    # Record per-stage timings and counters (written when the process exits)
+    if args.metrics or args.profile:
+        start_metrics(args.metrics, args.profile)
+
+    samDir = os.path.dirname(os.path.abspath(args.sam))
+    runExpDir = os.path.dirname(os.path.abspath(args.runexp))
+    samOutFile = os.path.join(samDir, "sam.xml" + args.compress)  # Output file names
+    expOutFile = os.path.join(runExpDir, "exp.xml" + args.compress)
+    runOutFile = os.path.join(runExpDir, "run.xml" + args.compress)
+
+    # Open the alias -> accession index built from earlier receipts
+    accessions = AccessionIndex(args.accessions) if args.accessions else None
+    history = AliasHistory(args.check_aliases) if args.check_aliases else None
+
+    # Load the manifests of the last successful submission for incremental mode
+    sam_manifest = Manifest(os.path.join(samDir, "sam.manifest.json")) if args.delta else None
+    runexp_manifest = Manifest(os.path.join(runExpDir, "runExp.manifest.json")) if args.delta else None
+
+    # Reuse the XML of unchanged TSVs, unless the output depends on state outside them
+    caches = {}
+    if not (args.no_cache or args.delta or accessions or history):
+        caches = {directory: OutputCache(directory) for directory in (samDir, runExpDir)}
+
+    try:
+        # Check the sample values before any XML is written
+        if args.check_values:
+            checked, problems = check_sam_tsv(args.sam, checklist=args.checklist)
+            if problems:
+                print_report(args.sam, problems)
+                print(f"    {checked} sample rows checked, {len(problems)} with invalid values. No XML written.")
+                sys.exit(1)
+
+        # Verify or fill in the fastq checksums before any XML is written
+        checksums = None
+        if args.md5 != "off":
+            problems, checksums = check_md5_column(args.runexp, runExpDir, args.md5, checklist=args.checklist)
+            if problems:
+                for problem in problems:
+                    print(f"    Error: {problem}")
+                print(f"    {len(problems)} checksum problem(s) found. No XML written.")
+                sys.exit(1)
+
+        options = {"compress": args.compress, "validate": args.validate}
+        sam_count, sam_cached = convert_cached(
+            caches.get(samDir), [args.sam], [samOutFile], args.checklist, dict(options, table="sam"),
+            lambda: sam2XML(args.sam, samOutFile, sam_manifest, accessions, args.validate, args.checklist, history))
+        (exp_count, run_count), runexp_cached = convert_cached(
+            caches.get(runExpDir), [args.runexp], [expOutFile, runOutFile], args.checklist,
+            dict(options, table="runExp", checksums=checksums),
+            lambda: runexp2XML(args.runexp, expOutFile, runOutFile, checksums, runexp_manifest,
+                               accessions, args.validate, args.checklist, history))
+    except FileNotFoundError as e:
+        print(f"    Error: The input file '{e.filename}' was not found.")
+        sys.exit(1)
+    except (ChecklistError, CompressionError) as e:
+        print(f"    Error: {e}")
+        sys.exit(1)
+
+    if args.delta:
+        sam_manifest.save_pending()
+        runexp_manifest.save_pending()
+        print(f"    {sam_count} sample_objects, {exp_count} experiment_objects and {run_count} run_objects "
+              f"checked against the manifests.")
+    else:
+        written = {False: "successfully written to", True: "unchanged, linked from the cache to"}
+        print(f"    {sam_count} sample_objects {written[sam_cached]} '{samOutFile}'.")
+        print(f"    {exp_count} experiment_objects {written[runexp_cached]} '{expOutFile}'.")
+        print(f"    {run_count} run_objects {written[runexp_cached]} '{runOutFile}'.")
@@ -1,10 +1,19 @@
 #!/usr/bin/env python3
+import os
 import sys
 import argparse
-from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.manifest import Manifest, open_set_writer
+from common.receipts import AccessionIndex, DEFAULT_INDEX
+from common.xsd_validation import ValidatingWriter
+from common.aliases import AliasCheckingWriter, AliasHistory
+from common.compression import CompressionError, open_input
+from common.checklist import DEFAULT_CHECKLIST, ChecklistError, load_checklist, resolve_layout, convert_rows
+from common.metrics import stage, start_metrics
 
 """
-Usage: create_exp_lxml.py [-h] -i INPUT
+Usage: create_exp_lxml.py [-h] -i INPUT [--checklist CHECKLIST] [--compress {.gz,.zst}]
 
 Convert an `exp.tsv` file into an `exp.xml` file with the required structure for submitting an experiment metadata object to ENA.
 Note: The sample metadata object must be submitted before running this script.
@@ -14,117 +23,68 @@ Options:
   -i INPUT, --input INPUT
                         Specify the path to the input TSV file containing experimental data.
                         The file must include all required fields for generating the experiment metadata XML.
+  --checklist CHECKLIST Checklist config defining the columns and the EXPERIMENT structure
+                        (default: common/checklists/usutu_ont.json).
+  --compress {.gz,.zst}  Write exp.xml.gz/exp.xml.zst; a .tsv.gz/.tsv.zst input is decompressed on the fly.
 
-# CHECK LIST: fill these fields
+# CHECK LIST: fill these fields in the checklist config
 
-    # center_name
-    # study_ref.attrib["accession"] = "PRJxxxxxx"
-    # (experiment, "TITLE").text = ""
-    # "LIBRARY_STRATEGY".text : "AMPLICON"
-    # "LIBRARY_SOURCE".text : "VIRAL RNA"
-    # "LIBRARY_SELECTION".text : "PCR"
-    # "LIBRARY_LAYOUT": "SINGLE"
-    # "PLATFORM" : "OXFORD_NANOPORE" / "ILLUMINA"
-    # "INSTRUMENT_MODEL" : "MinION" / "GridION"
+    # center_name, study_accession (constants)
+    # TITLE (derived "title")
+    # LIBRARY_STRATEGY / LIBRARY_SOURCE / LIBRARY_SELECTION / LIBRARY_LAYOUT (template)
+    # PLATFORM : "OXFORD_NANOPORE" / "ILLUMINA" (derived "platform", from the instrument model)
+    # INSTRUMENT_MODEL : "MinION" / "GridION" / "Illumina MiSeq" / ... (TSV column)
 
 """
 
-# Helper function to create an EXPERIMENT_ATTRIBUTE
-def create_experiment_attribute(parent, tag, value):
+def convert_lines(lines, first_line, writer, accessions=None, layout=None, checklist=DEFAULT_CHECKLIST):
     """
-    Create an EXPERIMENT_ATTRIBUTE XML element.
+    Convert TSV lines (starting at line number `first_line`) into EXPERIMENT elements
+    and pass each one to the writer as soon as it is built.
+    The columns are found with `layout` (resolved from the first line if not given),
+    the EXPERIMENT structure comes from the `checklist` config.
+    Returns (lines processed, lines skipped).
     """
-    experiment_attr = etree.SubElement(parent, "EXPERIMENT_ATTRIBUTE")
-    etree.SubElement(experiment_attr, "TAG").text = tag
-    etree.SubElement(experiment_attr, "VALUE").text = value
-
-def tsv2XML(tsvInFile, xmlOutFile):
+    config = load_checklist(checklist)
+    if layout is None:
+        layout, lines = resolve_layout(config, "runExp", lines)
+    emitter = config.emitter("EXPERIMENT", layout, accessions)
+    line_counter, (skipped_lines,) = convert_rows(lines, first_line, layout, [(emitter, writer, "")])
+    return line_counter, skipped_lines
+
+@stage("experiments")
+def tsv2XML(tsvInFile, xmlOutFile, manifest=None, accessions=None, validate=False, checklist=DEFAULT_CHECKLIST,
+            history=None):
     """
-    Convert a TSV file into an XML file with the required structure.
+    Convert a TSV file into an XML file with the structure defined by the `checklist` config.
+    If a `manifest` is given, only new/changed experiments are written (to exp.add.xml/exp.modify.xml).
+    If `validate` is set, every element is checked against the ENA XSD as it is written.
+    If an `accessions` index is given, submitted samples are referenced by accession.
+    If an alias `history` (common/aliases.py) is given, aliases submitted before or repeated in the
+    file are reported.
     """
-    root = etree.Element("EXPERIMENT_SET")
-    line_counter = 0  # Total lines processed
-    skipped_lines= 0   # Number of skipped lines (header, errors, or incomplete data)
-
     try:
-        with open(tsvInFile, 'r') as f:
-            for line in f:
-                line_counter += 1
-                line = line.strip()
-
-                # skip empty or malformed lines (not exactly 5 tab-separated values)
-                if not line or len(line.split('\t')) != 5:
-                    print(f"Warning: Skipping malformed or incomplete line {line_counter}.")
-                    skipped_lines+= 1
-                    continue
-
-                # skip lines containing "alias" (header or irrelevant)
-                if "alias" in line:
-                    skipped_lines+=1
-                    continue
-
-                try:
-                    # Extract required values from TSV (expecting exactly 5 tab-separated fields)
-                    samAlias, expAlias, _, _, platform_name = line.split('\t')
-
-                    # Check if any of the unpacked values is an empty string
-                    # Ensure no empty values in required fields
-                    if not all([samAlias, expAlias, platform_name]):
-                    #if any(value == "" for value in [samAlias, expAlias, platform_name]):
-                        print(f"Warning: Line {line_counter} contains empty values. Skipping.")
-                        skipped_lines+= 1
-                        continue
-
-                except ValueError:
-                    print(f"Warning: Line {line_counter} does not have the expected 5 tab-separated values. Skipping.")
-                    skipped_lines+= 1
-                    continue
-
-                # Create EXPERIMENT element
-                experiment = etree.SubElement(root, "EXPERIMENT", {
-                    "alias": expAlias,
-                    "center_name": "One Health Pact Consortium (2020–2022), EcoAlert Collaborative Team (2016–2019)"})
-
-                # Add TITLE element: short title for each experiment
-                etree.SubElement(experiment, "TITLE").text = (f"Host-derived Usutu virus sequencing on Oxford Nanopore {platform_name} platform.")
-
-                # Add STUDY_REF element: accession to the ENA study
-                study_ref = etree.SubElement(experiment, "STUDY_REF")
-                study_ref.attrib["accession"] = "PRJEB83966"
-
-                # Add DESIGN element: alias to the sample metadata
-                design = etree.SubElement(experiment, "DESIGN")
-                etree.SubElement(design, "DESIGN_DESCRIPTION").text = ""
-                sample_descriptor = etree.SubElement(design, "SAMPLE_DESCRIPTOR")
-                sample_descriptor.attrib["refname"] = samAlias
-
-                # Add LIBRARY_DESCRIPTOR element: describe the library
-                library_descriptor = etree.SubElement(design, "LIBRARY_DESCRIPTOR")
-                etree.SubElement(library_descriptor, "LIBRARY_NAME").text = ""
-                etree.SubElement(library_descriptor, "LIBRARY_STRATEGY").text = "AMPLICON"
-                etree.SubElement(library_descriptor, "LIBRARY_SOURCE").text = "VIRAL RNA"
-                etree.SubElement(library_descriptor, "LIBRARY_SELECTION").text = "PCR"
-                library_layout = etree.SubElement(library_descriptor, "LIBRARY_LAYOUT")
-                etree.SubElement(library_layout, "SINGLE")
-
-                # Add PLATFORM and INSTRUMENT_MODEL elements
-                platform_element = etree.SubElement(experiment, "PLATFORM")
-                oxford_nanopore = etree.SubElement(platform_element, "OXFORD_NANOPORE")
-                etree.SubElement(oxford_nanopore, "INSTRUMENT_MODEL").text = platform_name
-
-                # Add other EXPERIMENT_ATTRIBUTES
-                experiment_attributes = etree.SubElement(experiment, "EXPERIMENT_ATTRIBUTES")
-                create_experiment_attribute(experiment_attributes, "library preparation date", "not collected")
-
+        layout = load_checklist(checklist).layout_of_file("runExp", tsvInFile)
+        with open_input(tsvInFile) as f, open_set_writer(xmlOutFile, "EXPERIMENT_SET", manifest) as writer:
+            validator = ValidatingWriter(writer, tsvInFile) if validate else None
+            checker = AliasCheckingWriter(validator or writer, history, tsvInFile,
+                                          manifest.objects("EXPERIMENT") if manifest else None) if history else None
+            line_counter, skipped_lines = convert_lines(f, 1, checker or validator or writer, accessions, layout,
+                                                        checklist)
 
     except FileNotFoundError:
         print(f"Error: The file '{tsvInFile}' does not exist.")
         sys.exit(1)
 
-    # Format and write the XML to file using lxml
-    tree = etree.ElementTree(root)
-    with open(xmlOutFile, 'wb') as file:
-        tree.write(file, pretty_print=True, xml_declaration=True, encoding="UTF-8")
+    failed = False
+    if validator is not None and validator.invalid:
+        print(f"Error: {validator.invalid} experiments failed XSD validation.")
+        failed = True
+    if checker is not None and checker.duplicates:
+        print(f"Error: {checker.duplicates} experiments have an alias that was already submitted or is repeated.")
+        failed = True
+    if failed:
+        sys.exit(1)
 
     written = line_counter - skipped_lines
     return written
@@ -140,21 +100,97 @@ if __name__ == '__main__':
         "-i", "--input",
         help="Specify the path to the input TSV file containing experiment metadata. "
              "The file must include all required fields for generating the experiment metadata XML.",
-        default="exp.tsv"
+        default="../runExpSubmit/runExp.tsv"
+    )
+    parser.add_argument(
+        "--checklist",
+        help="Checklist config (JSON) defining the TSV columns and the EXPERIMENT XML structure.",
+        default=DEFAULT_CHECKLIST
+    )
+    parser.add_argument(
+        "--compress",
+        choices=[".gz", ".zst"],
+        default="",
+        help="Write compressed XML (exp.xml.gz or exp.xml.zst, compressed in a background thread). "
+             "The input TSV may also be compressed (.tsv.gz/.tsv.zst)."
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Incremental mode: write only new aliases to exp.add.xml and changed aliases to "
+             "exp.modify.xml, compared with the manifest of the last successful submission."
+    )
+    parser.add_argument(
+        "--manifest",
+        help="Row-hash manifest of the last successful submission (used with --delta).",
+        default="exp.manifest.json"
+    )
+
+    parser.add_argument(
+        "--accessions",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Reference submitted samples by accession instead of refname (default index: accessions.sqlite, see common/receipts.py).",
+        default=None
+    )
+    parser.add_argument(
+        "--check-aliases",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Report aliases that were already submitted (per the accession index, default: accessions.sqlite, "
+             "behind a Bloom filter) or appear twice, and fail after writing (see common/aliases.py).",
+        default=None
+    )
+
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Validate every EXPERIMENT element against the vendored ENA XSD as it is written; "
+             "errors are reported with their TSV line."
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Write per-stage wall time, rows/sec, skipped rows by reason and peak memory to this file "
+             "when the run ends (JSON, or Prometheus text format for *.prom; see common/metrics.py).",
+        default=None
+    )
+    parser.add_argument(
+        "--profile",
+        help="Run the row loop under cProfile and dump the stats to this file (python3 -m pstats FILE).",
+        default=None
     )
 
     # Parse arguments
     args = parser.parse_args()
+
+    # Record per-stage timings and counters (written when the process exits)
+    if args.metrics or args.profile:
+        start_metrics(args.metrics, args.profile)
+
     inFile = args.input  # Input file name
-    outFile = 'exp.xml'  # Output file name
+    outFile = 'exp.xml' + args.compress  # Output file name
+
+    # Open the alias -> accession index built from earlier receipts
+    accessions = AccessionIndex(args.accessions) if args.accessions else None
+    history = AliasHistory(args.check_aliases) if args.check_aliases else None
+
+    # Load the manifest of the last successful submission for incremental mode
+    manifest = Manifest(args.manifest) if args.delta else None
 
     # Execute the TSV to XML conversion
     try:
-        written_lines = tsv2XML(inFile, outFile)
-        print(f"    {written_lines} experiment_objects successfully written to '{outFile}'.")
+        written_lines = tsv2XML(inFile, outFile, manifest, accessions, args.validate, args.checklist, history)
+        if manifest is not None:
+            manifest.save_pending()
+            print(f"    {written_lines} experiment_objects checked against '{args.manifest}'.")
+        else:
+            print(f"    {written_lines} experiment_objects successfully written to '{outFile}'.")
     except FileNotFoundError:
         print(f"    Error: The input file '{inFile}' was not found.")
         sys.exit(1)
+    except (ChecklistError, CompressionError) as e:
+        print(f"    Error: {e}")
+        sys.exit(1)
     except Exception as e:
         print(f"    An unexpected error occurred: {e}")
         sys.exit(1)
@@ -14,6 +14,14 @@ Usage: $0 [OPTIONS]
 Options:
   -t    Run in test mode (default)
   -s    Run in submission mode
+  -d    Incremental mode: only submit new (ADD) and changed (MODIFY) objects
+  -w    Watch mode: keep the XML up to date while the TSVs are edited (no submission)
+  -m FILE  Write per-stage timings, rows/sec, skipped rows and peak memory of the XML generation
+           to FILE (JSON, or Prometheus text format for *.prom)
+  -f DIR   Upload the fastq files referenced in runExp.tsv from DIR to the Webin upload area
+           before the runs are submitted (concurrent, resumable, skips files already uploaded)
+  -u URL   Submit to another dropbox URL, e.g. the local mock server (bench/mock_dropbox.py)
+  -r    Resume an interrupted run: skip the submissions that submission.journal shows as accepted
   -h    Display this help message
 
 This script generates and submits XML files to ENA.
@@ -21,11 +29,23 @@ Use -t for testing and -s for actual submission.
 EOF
 }
 
-# Ensure only valid options (-t, -s, -h) are accepted
-while getopts ":tsh" opt; do
+# Ensure only valid options (-t, -s, -d, -w, -m, -f, -u, -r, -h) are accepted
+delta_flag=""
+metrics_flag=""
+fastq_dir=""
+url_override=""
+watch=""
+journal_flags="--journal ../submission.journal" # every submission is recorded (see common/journal.py)
+while getopts ":tsdwm:f:u:rh" opt; do
   case $opt in
     t) mode="test" ;;      # Test mode
     s) mode="submission" ;; # Submission mode
+    d) delta_flag="--delta" ;; # Incremental mode
+    w) watch="yes" ;;       # Watch mode
+    m) metrics_flag="--metrics $OPTARG" ;; # Metrics file
+    f) fastq_dir="$(realpath "$OPTARG")" ;; # Fastq upload directory (absolute, the script changes directories)
+    u) url_override="$OPTARG" ;; # Other dropbox (mock server)
+    r) journal_flags="$journal_flags --resume" ;; # Skip submissions accepted before
     h) usage; exit 0 ;;     # Help flag
     \?) usage; exit 1 ;;    # Invalid flag
   esac
@@ -34,6 +54,11 @@ done
 # Exit immediately if a command fails
 set -e
 
+# Watch mode only regenerates and validates XML, no credentials needed
+if [ -n "$watch" ]; then
+  exec python3 common/watch.py
+fi
+
 # Check if credentials are set, otherwise ask the user
 if [ -z "$U_NAME" ]; then
     read -p "Enter Username: " U_NAME
@@ -44,6 +69,9 @@ if [ -z "$PASS_WORD" ]; then
     echo ""  # Move to a new line after password input
 fi
 
+# Credentials are read by the submission client (common/submit.py)
+export U_NAME PASS_WORD
+
 # Define URLs for submission
 test_url="https://wwwdev.ebi.ac.uk/ena/submit/drop-box/submit/"
 submit_url="https://www.ebi.ac.uk/ena/submit/drop-box/submit/"
@@ -65,65 +93,102 @@ fi
 # Set URL based on mode
 url="$test_url"
 [[ "$mode" == "submit" ]] && url="$submit_url"
+[[ -n "$url_override" ]] && url="$url_override"
 
 echo "----------------------------------------------------------------------------------"
 echo "  📂 Running in $mode mode"
 echo "  📤 Using submission URL: $url"
 echo "----------------------------------------------------------------------------------"
 
-### PROCESS SAMPLE SUBMISSION ###
-cd samSubmit
+### CHECK REFERENCES BETWEEN THE TSV FILES ###
+echo ""
+date
+echo "  🔎 Checking sample/experiment/run references..."
+python3 common/integrity.py
+echo "  ✅ References are consistent"
+
+### GENERATE ALL XML IN ONE PROCESS ###
 echo ""
 date
-echo "  🔄 Generating sample XML..."
-python3 create_sam_xml.py
-echo "  ✅ Created sam.xml"
+echo "  🔄 Checking sample values and generating sample, experiment and run XML..."
+python3 create_xml.py --check-values $delta_flag $metrics_flag
+echo "  ✅ Created sam.xml, exp.xml and run.xml"
 echo ""
 date
 
+### PROCESS SAMPLE SUBMISSION ###
+cd samSubmit
+
 echo "  🚀 Submitting sample XML..."
 rm -f *samLog.txt
 
 # Uncomment based on requirement:
 # Submit new metadata objects:
-# curl -u "$U_NAME:$PASS_WORD" -F "SUBMISSION=@add_submission.xml" -F "SAMPLE=@sam.xml" "$url" >> submit_samLog.txt 2>&1
+# python3 ../common/submit.py --url "$url" --batch SUBMISSION=add_submission.xml SAMPLE=sam.xml $journal_flags --log submit_samLog.txt
 
 # Update existing metadata objects:
-# curl -u "$U_NAME:$PASS_WORD" -F "SUBMISSION=@modify_submission.xml" -F "SAMPLE=@sam.xml" "$url" >> modify_samLog.txt 2>&1
+# python3 ../common/submit.py --url "$url" --batch SUBMISSION=modify_submission.xml SAMPLE=sam.xml $journal_flags --log modify_samLog.txt
+
+# Sharded output (create_sam_xml.py --shard-objects/--shard-bytes): submit all shards concurrently
+# python3 ../common/submit.py --url "$url" --shard-dir . --workers 4 $journal_flags --log submit_samLog.txt
+
+# Incremental mode (-d): new objects are added, changed objects are modified
+# python3 ../common/submit.py --url "$url" --batch SUBMISSION=add_submission.xml SAMPLE=sam.add.xml $journal_flags --log submit_samLog.txt
+# python3 ../common/submit.py --url "$url" --batch SUBMISSION=modify_submission.xml SAMPLE=sam.modify.xml $journal_flags --log modify_samLog.txt
+
+# Store the accessions from the receipts in the alias -> accession index (production only)
+if [ "$mode" == "submit" ] && [ -f submit_samLog.txt ]; then
+  python3 ../common/receipts.py index submit_samLog.txt
+fi
+
+# Record the submitted state once ENA accepted the incremental submission
+if [ -n "$delta_flag" ] && [ -f submit_samLog.txt ] && ! grep -q 'success="false"' *samLog.txt; then
+  python3 ../common/manifest.py commit sam.manifest.json
+fi
 
 echo "  ✅ Submitted sam.xml"
 echo ""
 date
 
-### PROCESS EXPERIMENT SUBMISSION ###
-cd ../exp
-echo "  🔄 Generating experiment XML..."
-python3 create_exp_xml.py
-cp exp.xml ../runExpSubmit/
-echo "  ✅ Created exp.xml"
-echo ""
-date
+### UPLOAD FASTQ FILES ###
+cd ../runExpSubmit
 
-### PROCESS RUN SUBMISSION ###
-cd ../run
-echo "  🔄 Generating run XML..."
-python3 create_run_xml.py
-cp run.xml ../runExpSubmit/
-echo "  ✅ Created run.xml"
-echo ""
-date
+# Every FILE in run.xml must be in the Webin upload area before the runs are submitted
+if [ -n "$fastq_dir" ]; then
+  echo "  📤 Uploading fastq files from $fastq_dir..."
+  python3 ../common/upload.py -i runExp.tsv --fastq-dir "$fastq_dir"
+  echo "  ✅ Uploaded fastq files"
+  echo ""
+  date
+fi
 
 ### SUBMIT EXPERIMENT AND RUN DATA ###
-cd ../runExpSubmit/
 echo "  🚀 Submitting experiment and run XML..."
 rm -f *runExpLog.txt
 
 # Uncomment based on requirement:
 # Submit new metadata objects:
-# curl -u "$U_NAME:$PASS_WORD" -F "SUBMISSION=@add_submission.xml" -F "RUN=@run.xml" -F "EXPERIMENT=@exp.xml" "$url" >> submit_runExpLog.txt 2>&1
+# python3 ../common/submit.py --url "$url" --batch SUBMISSION=add_submission.xml RUN=run.xml EXPERIMENT=exp.xml $journal_flags --log submit_runExpLog.txt
 
 # Update existing metadata objects:
-# curl -u "$U_NAME:$PASS_WORD" -F "SUBMISSION=@modify_submission.xml" -F "RUN=@run.xml" -F "EXPERIMENT=@exp.xml" "$url" >> modify_runExpLog.txt 2>&1
+# python3 ../common/submit.py --url "$url" --batch SUBMISSION=modify_submission.xml RUN=run.xml EXPERIMENT=exp.xml $journal_flags --log modify_runExpLog.txt
+
+# Sharded output (create_runexp_xml.py --shard-objects/--shard-bytes): submit all shards concurrently
+# python3 ../common/submit.py --url "$url" --shard-dir . --workers 4 $journal_flags --log submit_runExpLog.txt
+
+# Incremental mode (-d): new objects are added, changed objects are modified
+# python3 ../common/submit.py --url "$url" --batch SUBMISSION=add_submission.xml RUN=run.add.xml EXPERIMENT=exp.add.xml $journal_flags --log submit_runExpLog.txt
+# python3 ../common/submit.py --url "$url" --batch SUBMISSION=modify_submission.xml RUN=run.modify.xml EXPERIMENT=exp.modify.xml $journal_flags --log modify_runExpLog.txt
+
+# Store the accessions from the receipts in the alias -> accession index (production only)
+if [ "$mode" == "submit" ] && [ -f submit_runExpLog.txt ]; then
+  python3 ../common/receipts.py index submit_runExpLog.txt
+fi
+
+# Record the submitted state once ENA accepted the incremental submission
+if [ -n "$delta_flag" ] && [ -f submit_runExpLog.txt ] && ! grep -q 'success="false"' *runExpLog.txt; then
+  python3 ../common/manifest.py commit runExp.manifest.json
+fi
 
 echo "  ✅ Submitted run.xml and exp.xml"
 echo ""
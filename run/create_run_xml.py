@@ -1,10 +1,21 @@
 #!/usr/bin/env python3
+import os
 import sys
 import argparse
-from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.manifest import Manifest, open_set_writer
+from common.receipts import AccessionIndex, DEFAULT_INDEX
+from common.xsd_validation import ValidatingWriter
+from common.aliases import AliasCheckingWriter, AliasHistory
+from common.md5_checksums import md5_files, read_fastq_rows, DEFAULT_CACHE
+from common.compression import CompressionError, open_input
+from common.checklist import DEFAULT_CHECKLIST, ChecklistError, load_checklist, resolve_layout, convert_rows
+from common.metrics import stage, start_metrics
 
 """
-Usage: create_run_lxml.py [-h] [-i INPUT]
+Usage: create_run_lxml.py [-h] [-i INPUT] [--md5 {off,fill,check}] [--fastq-dir FASTQ_DIR]
+                          [--md5-cache MD5_CACHE] [--md5-workers MD5_WORKERS] [--checklist CHECKLIST] [--compress {.gz,.zst}]
 
 Convert a `run.tsv` file into a `run.xml` file with the required structure for submitting a run metadata object to ENA.
 Note: The sample metadata object must be submitted before running this script.
@@ -14,99 +25,104 @@ Options:
   -i INPUT, --input INPUT
                         Specify the path to the input TSV file containing experimental data.
                         The file must include all required fields for generating the experiment metadata XML.
+  --md5 {off,fill,check}
+                        off (default): copy the `md5` column as-is.
+                        fill: hash the fastq files, fill in empty `md5` values and check the others.
+                        check: hash the fastq files and require every `md5` value to match.
+  --fastq-dir FASTQ_DIR Directory containing the fastq files (default: directory of the input TSV).
+  --md5-cache MD5_CACHE Persistent checksum cache keyed by (path, size, mtime).
+  --md5-workers MD5_WORKERS
+                        Number of hashing processes (default: number of cores).
+  --checklist CHECKLIST Checklist config defining the columns and the RUN structure
+                        (default: common/checklists/usutu_ont.json).
+  --compress {.gz,.zst}  Write run.xml.gz/run.xml.zst; a .tsv.gz/.tsv.zst input is decompressed on the fly.
 
-# CHECK LIST: fill these fields
+# CHECK LIST: fill these fields in the checklist config
 
-    # "center_name"
-    # "filetype": "fastq"
-    # "checksum_method": "MD5"
+    # center_name (constants)
+    # "filetype": "fastq", "checksum_method": "MD5" (template)
 
 """
 
-# Helper function to create an RUN_ATTRIBUTE
-def create_run_attribute(parent, tag, value):
+@stage("md5")
+def check_md5_column(tsvInFile, fastq_dir, mode, cache_file=DEFAULT_CACHE, workers=None, checklist=DEFAULT_CHECKLIST):
     """
-    Create a RUN_ATTRIBUTE XML element.
+    Hash the fastq files referenced in a run TSV and compare them with its `md5` column.
+
+    Returns (problems, checksums): a list of messages for missing or unreadable files, missing checksums
+    (in "check" mode) and mismatches, and a {fastq filename: md5} dict to use in the XML.
     """
-    run_attr = etree.SubElement(parent, "RUN_ATTRIBUTE")
-    etree.SubElement(run_attr, "TAG").text = tag
-    etree.SubElement(run_attr, "VALUE").text = value
+    rows = read_fastq_rows(tsvInFile, checklist)  # (line number, fastq filename, md5 from the TSV)
+    paths = {gzFile: os.path.join(fastq_dir, gzFile) for _, gzFile, _ in rows}
+    computed, unreadable = md5_files(list(paths.values()), cache_file, workers)
+
+    problems = []
+    checksums = {}
+    for line_counter, gzFile, md5 in rows:
+        path = paths[gzFile]
+        if path in unreadable:
+            problems.append(f"Line {line_counter}: fastq file '{path}' cannot be read ({unreadable[path]}).")
+            continue
+        checksums[gzFile] = computed[path]
+        if not md5:
+            if mode == "check":
+                problems.append(f"Line {line_counter}: missing md5 for '{gzFile}' (computed {computed[path]}).")
+        elif md5 != computed[path]:
+            problems.append(f"Line {line_counter}: md5 mismatch for '{gzFile}' (tsv {md5}, computed {computed[path]}).")
 
-def tsv2XML(tsvInFile, xmlOutFile):
+    return problems, checksums
+
+def convert_lines(lines, first_line, writer, checksums=None, accessions=None, layout=None, checklist=DEFAULT_CHECKLIST):
     """
-    Convert a TSV file into an XML file with the required structure.
+    Convert TSV lines (starting at line number `first_line`) into RUN elements
+    and pass each one to the writer as soon as it is built.
+    The columns are found with `layout` (resolved from the first line if not given),
+    the RUN structure comes from the `checklist` config.
+    Returns (lines processed, lines skipped).
     """
-    root = etree.Element("RUN_SET")
-    line_counter = 0  # Total lines processed
-    skipped_lines= 0   # Number of skipped lines (header, errors, or incomplete data)
+    config = load_checklist(checklist)
+    if layout is None:
+        layout, lines = resolve_layout(config, "runExp", lines)
+    emitter = config.emitter("RUN", layout, accessions, {"checksums": checksums})
+    line_counter, (skipped_lines,) = convert_rows(lines, first_line, layout, [(emitter, writer, "")])
+    return line_counter, skipped_lines
 
+@stage("runs")
+def tsv2XML(tsvInFile, xmlOutFile, checksums=None, manifest=None, accessions=None, validate=False,
+            checklist=DEFAULT_CHECKLIST,
+            history=None):
+    """
+    Convert a TSV file into an XML file with the structure defined by the `checklist` config.
+    If `checksums` ({fastq filename: md5}) is given, it provides the FILE checksums
+    and an empty `md5` column is allowed.
+    If a `manifest` is given, only new/changed runs are written (to run.add.xml/run.modify.xml).
+    If `validate` is set, every element is checked against the ENA XSD as it is written.
+    If an `accessions` index is given, submitted experiments are referenced by accession.
+    If an alias `history` (common/aliases.py) is given, aliases submitted before or repeated in the
+    file are reported.
+    """
     try:
-        with open(tsvInFile, 'r') as f:
-            for line in f:
-                line_counter += 1
-                line = line.strip()
-
-                # skip empty or malformed lines (not exactly 5 tab-separated values)
-                if not line or len(line.split('\t')) != 5:
-                    print(f"Warning: Skipping malformed or incomplete line {line_counter}.")
-                    skipped_lines+= 1
-                    continue
-
-                # skip lines containing "alias" (header or irrelevant)
-                if "alias" in line:
-                    skipped_lines+= 1
-                    continue
-
-                try:
-                    # Extract required values from TSV (expecting exactly 5 tab-separated fields)
-                    samAlias, expAlias, gzFile, md5, _ = line.split('\t')
-
-                    # Ensure no empty values in required fields
-                    if not all([samAlias, expAlias, gzFile, md5]):
-                        print(f"Warning: Line {line_counter} contains empty values. Skipping.")
-                        skipped_lines+= 1
-                        continue
-
-                except ValueError:
-                    print(f"Warning: Line {line_counter} does not contain exactly 5 tab-separated values. Skipping.")
-                    skipped_lines+= 1
-                    continue
-
-                # Create RUN element
-                run = etree.SubElement(root, "RUN", {
-                    "alias": samAlias,
-                    "center_name": "One Health Pact Consortium (2020–2022), EcoAlert Collaborative Team (2016–2019)"
-                })
-
-                # Add EXPERIMENT_REF
-                experiment_ref = etree.SubElement(run, "EXPERIMENT_REF")
-                experiment_ref.attrib["refname"] = expAlias
-
-                # Add DATA_BLOCK
-                data_block = etree.SubElement(run, "DATA_BLOCK")
-                files = etree.SubElement(data_block, "FILES")
-
-                file_elem = etree.SubElement(files, "FILE", {
-                    "filename": gzFile,
-                    "filetype": "fastq",
-                    "checksum_method": "MD5",
-                    "checksum": md5
-                })
-
-                # # Add RUN_ATTRIBUTES
-                # run_attributes = etree.SubElement(run, "RUN_ATTRIBUTES")
-                # create_run_attribute(run_attributes, "processing center", "Dutch Genomics Institute")
-                # create_run_attribute(run_attributes, "sequencing platform", "Oxford Nanopore GridION")
-
+        layout = load_checklist(checklist).layout_of_file("runExp", tsvInFile)
+        with open_input(tsvInFile) as f, open_set_writer(xmlOutFile, "RUN_SET", manifest) as writer:
+            validator = ValidatingWriter(writer, tsvInFile) if validate else None
+            checker = AliasCheckingWriter(validator or writer, history, tsvInFile,
+                                          manifest.objects("RUN") if manifest else None) if history else None
+            line_counter, skipped_lines = convert_lines(f, 1, checker or validator or writer, checksums, accessions,
+                                                        layout, checklist)
 
     except FileNotFoundError:
         print(f"Error: The file '{tsvInFile}' does not exist.")
         sys.exit(1)
 
-    # Format and write the XML to file using lxml
-    tree = etree.ElementTree(root)
-    with open(xmlOutFile, 'wb') as file:
-        tree.write(file, pretty_print=True, xml_declaration=True, encoding="UTF-8")
+    failed = False
+    if validator is not None and validator.invalid:
+        print(f"Error: {validator.invalid} runs failed XSD validation.")
+        failed = True
+    if checker is not None and checker.duplicates:
+        print(f"Error: {checker.duplicates} runs have an alias that was already submitted or is repeated.")
+        failed = True
+    if failed:
+        sys.exit(1)
 
     written = line_counter - skipped_lines
     return written
@@ -123,21 +139,140 @@ if __name__ == '__main__':
         "-i", "--input",
         help="Specify the path to the input TSV file containing run metadata. "
              "The file must include all required fields for generating the run metadata XML.",
-        default="run.tsv"
+        default="../runExpSubmit/runExp.tsv"
+    )
+    parser.add_argument(
+        "--checklist",
+        help="Checklist config (JSON) defining the TSV columns and the RUN XML structure.",
+        default=DEFAULT_CHECKLIST
+    )
+    parser.add_argument(
+        "--compress",
+        choices=[".gz", ".zst"],
+        default="",
+        help="Write compressed XML (run.xml.gz or run.xml.zst, compressed in a background thread). "
+             "The input TSV may also be compressed (.tsv.gz/.tsv.zst)."
+    )
+    parser.add_argument(
+        "--md5",
+        choices=["off", "fill", "check"],
+        default="off",
+        help="Hash the referenced fastq files: 'fill' fills in empty md5 values and checks the others, "
+             "'check' requires every md5 value to match. All problems are reported before any XML is written."
+    )
+    parser.add_argument(
+        "--fastq-dir",
+        help="Directory containing the fastq files (default: directory of the input TSV).",
+        default=None
+    )
+    parser.add_argument(
+        "--md5-cache",
+        help="Persistent checksum cache keyed by (path, size, mtime).",
+        default=DEFAULT_CACHE
+    )
+    parser.add_argument(
+        "--md5-workers",
+        help="Number of hashing processes (default: number of cores).",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Incremental mode: write only new aliases to run.add.xml and changed aliases to "
+             "run.modify.xml, compared with the manifest of the last successful submission."
+    )
+    parser.add_argument(
+        "--manifest",
+        help="Row-hash manifest of the last successful submission (used with --delta).",
+        default="run.manifest.json"
+    )
+
+    parser.add_argument(
+        "--accessions",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Reference submitted experiments by accession instead of refname (default index: accessions.sqlite, see common/receipts.py).",
+        default=None
+    )
+    parser.add_argument(
+        "--check-aliases",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Report aliases that were already submitted (per the accession index, default: accessions.sqlite, "
+             "behind a Bloom filter) or appear twice, and fail after writing (see common/aliases.py).",
+        default=None
+    )
+
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Validate every RUN element against the vendored ENA XSD as it is written; "
+             "errors are reported with their TSV line."
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Write per-stage wall time, rows/sec, skipped rows by reason and peak memory to this file "
+             "when the run ends (JSON, or Prometheus text format for *.prom; see common/metrics.py).",
+        default=None
+    )
+    parser.add_argument(
+        "--profile",
+        help="Run the row loop under cProfile and dump the stats to this file (python3 -m pstats FILE).",
+        default=None
     )
 
     # Parse arguments
     args = parser.parse_args()
+
+    # Record per-stage timings and counters (written when the process exits)
+    if args.metrics or args.profile:
+        start_metrics(args.metrics, args.profile)
+
     inFile = args.input  # Input file name
-    outFile = "run.xml"  # Output file name
+    outFile = "run.xml" + args.compress  # Output file name
+
+    # Open the alias -> accession index built from earlier receipts
+    accessions = AccessionIndex(args.accessions) if args.accessions else None
+    history = AliasHistory(args.check_aliases) if args.check_aliases else None
+
+    # Load the manifest of the last successful submission for incremental mode
+    manifest = Manifest(args.manifest) if args.delta else None
+
+    # Verify or fill in the fastq checksums before any XML is written
+    checksums = None
+    if args.md5 != "off":
+        fastq_dir = args.fastq_dir or os.path.dirname(os.path.abspath(inFile))
+        try:
+            problems, checksums = check_md5_column(inFile, fastq_dir, args.md5, args.md5_cache, args.md5_workers,
+                                                   args.checklist)
+        except FileNotFoundError:
+            print(f"    Error: The input file '{inFile}' was not found.")
+            sys.exit(1)
+        except (ChecklistError, CompressionError) as e:
+            print(f"    Error: {e}")
+            sys.exit(1)
+        if problems:
+            for problem in problems:
+                print(f"    Error: {problem}")
+            print(f"    {len(problems)} checksum problem(s) found. No XML written.")
+            sys.exit(1)
 
     # Execute the TSV to XML conversion
     try:
-        written_lines = tsv2XML(inFile, outFile)
-        print(f"    {written_lines} run_objects successfully written to '{outFile}'.")
+        written_lines = tsv2XML(inFile, outFile, checksums, manifest, accessions, args.validate, args.checklist,
+                                history)
+        if manifest is not None:
+            manifest.save_pending()
+            print(f"    {written_lines} run_objects checked against '{args.manifest}'.")
+        else:
+            print(f"    {written_lines} run_objects successfully written to '{outFile}'.")
     except FileNotFoundError:
         print(f"    Error: The input file '{inFile}' was not found.")
         sys.exit(1)
+    except (ChecklistError, CompressionError) as e:
+        print(f"    Error: {e}")
+        sys.exit(1)
     except Exception as e:
         print(f"    An unexpected error occurred: {e}")
         sys.exit(1)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+import os
+import sys
+import argparse
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.manifest import Manifest, open_set_writer
+from common.md5_checksums import DEFAULT_CACHE
+from common.shards import write_shards, parse_size
+from common.receipts import AccessionIndex, DEFAULT_INDEX
+from common.xsd_validation import ValidatingWriter
+from common.aliases import AliasCheckingWriter, AliasHistory
+from common.compression import CompressionError, open_input
+from common.checklist import DEFAULT_CHECKLIST, ChecklistError, load_checklist, resolve_layout, convert_rows
+from common.metrics import stage, start_metrics
+from run.create_run_xml import check_md5_column
+
+"""
+Usage: create_runexp_xml.py [-h] [-i INPUT] [-o OUTDIR] [--md5 {off,fill,check}] [--fastq-dir FASTQ_DIR]
+                            [--md5-cache MD5_CACHE] [--md5-workers MD5_WORKERS] [--delta] [--manifest MANIFEST]
+                            [--shard-objects N] [--shard-bytes N] [--shard-workers N] [--submission SUBMISSION]
+                            [--accessions [INDEX]] [--check-aliases [INDEX]] [--validate] [--checklist CHECKLIST] [--compress {.gz,.zst}]
+                            [--metrics FILE] [--profile FILE]
+
+Convert the shared `runExp.tsv` file into both `exp.xml` and `run.xml` in a single pass,
+writing them directly into the experiment/run submission directory.
+Note: The sample metadata object must be submitted before running this script.
+
+Options:
+  -h, --help            Help message.
+  -i INPUT, --input INPUT
+                        Specify the path to the shared TSV file (sample alias, experiment alias, fastq, md5, platform).
+  --checklist CHECKLIST Checklist config defining the columns and the EXPERIMENT/RUN structure
+                        (default: common/checklists/usutu_ont.json).
+  --compress {.gz,.zst}  Write exp.xml.gz + run.xml.gz (or .zst); a .tsv.gz/.tsv.zst input is decompressed on the fly.
+  -o OUTDIR, --outdir OUTDIR
+                        Directory to write `exp.xml` and `run.xml` to (default: this script's directory).
+  --md5 {off,fill,check}
+                        Verify or fill in the fastq checksums before writing (see create_run_xml.py).
+  --delta               Write only new objects to exp.add.xml/run.add.xml and changed objects to
+                        exp.modify.xml/run.modify.xml (see common/manifest.py).
+  --validate            Validate each EXPERIMENT/RUN against the vendored ENA XSDs while writing.
+  --metrics FILE        Write per-stage timings, rows/sec, skipped rows and peak memory (JSON, or *.prom).
+  --profile FILE        Dump cProfile stats of the row loop.
+  --accessions [INDEX]  Reference already submitted samples/experiments by accession instead of refname.
+  --check-aliases [INDEX]
+                        Fail if an experiment/run alias was submitted before or repeats (see common/aliases.py).
+  --shard-objects N, --shard-bytes N
+                        Split the output into paired exp.NNN.xml/run.NNN.xml shards of at most N objects/bytes,
+                        generated in parallel from the same TSV rows, each with runExp.NNN.submission.xml.
+
+"""
+
+def convert_lines(lines, first_line, exp_writer, run_writer, checksums=None, accessions=None, layout=None,
+                  checklist=DEFAULT_CHECKLIST):
+    """
+    Convert TSV lines (starting at line number `first_line`) into EXPERIMENT and RUN elements
+    and pass each one to the writer as soon as it is built (each line is split once).
+    The columns are found with `layout` (resolved from the first line if not given),
+    the EXPERIMENT/RUN structure comes from the `checklist` config.
+    Returns (lines processed, lines without EXPERIMENT, lines without RUN).
+    """
+    config = load_checklist(checklist)
+    if layout is None:
+        layout, lines = resolve_layout(config, "runExp", lines)
+    targets = [
+        (config.emitter("EXPERIMENT", layout, accessions), exp_writer, "experiment "),
+        (config.emitter("RUN", layout, accessions, {"checksums": checksums}), run_writer, "run "),
+    ]
+    line_counter, (skipped_exp, skipped_run) = convert_rows(lines, first_line, layout, targets)
+    return line_counter, skipped_exp, skipped_run
+
+@stage("experiments_runs")
+def tsv2XML(tsvInFile, expOutFile, runOutFile, checksums=None, manifest=None, accessions=None, validate=False,
+            checklist=DEFAULT_CHECKLIST, history=None):
+    """
+    Convert the shared TSV file into the experiment and run XML files in one pass.
+    If a `manifest` is given, only new/changed objects are written (to *.add.xml/*.modify.xml).
+    If an `accessions` index is given, submitted samples/experiments are referenced by accession.
+    If `validate` is set, every element is checked against the ENA XSD as it is written.
+    If an alias `history` (common/aliases.py) is given, aliases submitted before or repeated in the
+    file are reported.
+    Returns the number of (experiment, run) objects processed.
+    """
+    validators = checkers = None
+    try:
+        layout = load_checklist(checklist).layout_of_file("runExp", tsvInFile)
+        with open_input(tsvInFile) as f, \
+                open_set_writer(expOutFile, "EXPERIMENT_SET", manifest) as exp_writer, \
+                open_set_writer(runOutFile, "RUN_SET", manifest) as run_writer:
+            if validate:
+                exp_writer = ValidatingWriter(exp_writer, tsvInFile)
+                run_writer = ValidatingWriter(run_writer, tsvInFile)
+                validators = exp_writer, run_writer
+            if history:
+                exp_writer = AliasCheckingWriter(exp_writer, history, tsvInFile,
+                                                 manifest.objects("EXPERIMENT") if manifest else None)
+                run_writer = AliasCheckingWriter(run_writer, history, tsvInFile,
+                                                 manifest.objects("RUN") if manifest else None)
+                checkers = exp_writer, run_writer
+            line_counter, skipped_exp, skipped_run = convert_lines(f, 1, exp_writer, run_writer, checksums, accessions,
+                                                                   layout, checklist)
+
+    except FileNotFoundError:
+        print(f"Error: The file '{tsvInFile}' does not exist.")
+        sys.exit(1)
+
+    failed = False
+    if validators and (validators[0].invalid or validators[1].invalid):
+        print(f"Error: {validators[0].invalid} experiments and {validators[1].invalid} runs failed XSD validation.")
+        failed = True
+    if checkers and (checkers[0].duplicates or checkers[1].duplicates):
+        print(f"Error: {checkers[0].duplicates} experiments and {checkers[1].duplicates} runs have an alias that was "
+              f"already submitted or is repeated.")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+    return line_counter - skipped_exp, line_counter - skipped_run
+
+# Main execution
+if __name__ == '__main__':
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Convert the shared `runExp.tsv` file into `exp.xml` and `run.xml` in a single pass. "
+                    "Note: The sample metadata object must be submitted before running this script."
+    )
+    parser.add_argument(
+        "-i", "--input",
+        help="Specify the path to the shared TSV file containing experiment and run metadata.",
+        default="runExp.tsv"
+    )
+    parser.add_argument(
+        "-o", "--outdir",
+        help="Directory to write exp.xml and run.xml to (default: the submission directory).",
+        default=os.path.dirname(os.path.abspath(__file__))
+    )
+    parser.add_argument(
+        "--checklist",
+        help="Checklist config (JSON) defining the TSV columns and the EXPERIMENT/RUN XML structure.",
+        default=DEFAULT_CHECKLIST
+    )
+    parser.add_argument(
+        "--compress",
+        choices=[".gz", ".zst"],
+        default="",
+        help="Write compressed XML (exp.xml.gz/run.xml.gz or .zst, compressed in a background thread). "
+             "The input TSV may also be compressed (.tsv.gz/.tsv.zst)."
+    )
+    parser.add_argument(
+        "--md5",
+        choices=["off", "fill", "check"],
+        default="off",
+        help="Hash the referenced fastq files: 'fill' fills in empty md5 values and checks the others, "
+             "'check' requires every md5 value to match. All problems are reported before any XML is written."
+    )
+    parser.add_argument(
+        "--fastq-dir",
+        help="Directory containing the fastq files (default: directory of the input TSV).",
+        default=None
+    )
+    parser.add_argument(
+        "--md5-cache",
+        help="Persistent checksum cache keyed by (path, size, mtime).",
+        default=DEFAULT_CACHE
+    )
+    parser.add_argument(
+        "--md5-workers",
+        help="Number of hashing processes (default: number of cores).",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Incremental mode: write only new aliases to exp.add.xml/run.add.xml and changed aliases to "
+             "exp.modify.xml/run.modify.xml, compared with the manifest of the last successful submission."
+    )
+    parser.add_argument(
+        "--manifest",
+        help="Row-hash manifest of the last successful submission (used with --delta).",
+        default="runExp.manifest.json"
+    )
+
+    parser.add_argument(
+        "--shard-objects",
+        type=int,
+        help="Split the output into shards of at most N objects (exp.000.xml + run.000.xml, ...), each with its own submission XML.",
+        default=None
+    )
+    parser.add_argument(
+        "--shard-bytes",
+        type=parse_size,
+        help="Split the output into shards of at most N bytes (e.g. 5M), each with its own submission XML.",
+        default=None
+    )
+    parser.add_argument(
+        "--shard-workers",
+        type=int,
+        help="Number of processes generating shards (default: number of cores).",
+        default=None
+    )
+    parser.add_argument(
+        "--submission",
+        help="Submission XML paired with every shard.",
+        default="add_submission.xml"
+    )
+
+    parser.add_argument(
+        "--accessions",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Reference submitted samples/experiments by accession instead of refname (default index: accessions.sqlite, see common/receipts.py).",
+        default=None
+    )
+    parser.add_argument(
+        "--check-aliases",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Report aliases that were already submitted (per the accession index, default: accessions.sqlite, "
+             "behind a Bloom filter) or appear twice, and fail after writing (see common/aliases.py).",
+        default=None
+    )
+
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Validate every EXPERIMENT/RUN element against the vendored ENA XSD as it is written; "
+             "errors are reported with their TSV line."
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Write per-stage wall time, rows/sec, skipped rows by reason and peak memory to this file "
+             "when the run ends (JSON, or Prometheus text format for *.prom; see common/metrics.py).",
+        default=None
+    )
+    parser.add_argument(
+        "--profile",
+        help="Run the row loop under cProfile and dump the stats to this file (python3 -m pstats FILE).",
+        default=None
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    # Record per-stage timings and counters (written when the process exits)
+    if args.metrics or args.profile:
+        start_metrics(args.metrics, args.profile)
+
+    inFile = args.input  # Input file name
+    expOutFile = os.path.join(args.outdir, "exp.xml" + args.compress)  # Output file names
+    runOutFile = os.path.join(args.outdir, "run.xml" + args.compress)
+
+    sharded = bool(args.shard_objects or args.shard_bytes)
+    if sharded and args.delta:
+        parser.error("--delta cannot be combined with --shard-objects/--shard-bytes")
+    if sharded and args.check_aliases:
+        parser.error("--check-aliases cannot be combined with --shard-objects/--shard-bytes")
+
+    # Open the alias -> accession index built from earlier receipts
+    accessions = AccessionIndex(args.accessions) if args.accessions else None
+    history = AliasHistory(args.check_aliases) if args.check_aliases else None
+
+    # Load the manifest of the last successful submission for incremental mode
+    manifest = Manifest(args.manifest) if args.delta else None
+
+    # Verify or fill in the fastq checksums before any XML is written
+    checksums = None
+    if args.md5 != "off":
+        fastq_dir = args.fastq_dir or os.path.dirname(os.path.abspath(inFile))
+        try:
+            problems, checksums = check_md5_column(inFile, fastq_dir, args.md5, args.md5_cache, args.md5_workers,
+                                                   args.checklist)
+        except FileNotFoundError:
+            print(f"    Error: The input file '{inFile}' was not found.")
+            sys.exit(1)
+        except (ChecklistError, CompressionError) as e:
+            print(f"    Error: {e}")
+            sys.exit(1)
+        if problems:
+            for problem in problems:
+                print(f"    Error: {problem}")
+            print(f"    {len(problems)} checksum problem(s) found. No XML written.")
+            sys.exit(1)
+
+    # Execute the TSV to XML conversion
+    try:
+        if sharded:
+            shards = write_shards(inFile, [expOutFile, runOutFile], ["EXPERIMENT_SET", "RUN_SET"],
+                                  partial(convert_lines, checksums=checksums, accessions=accessions,
+                                          layout=load_checklist(args.checklist).layout_of_file("runExp", inFile),
+                                          checklist=args.checklist),
+                                  args.shard_objects, args.shard_bytes, args.submission,
+                                  os.path.join(args.outdir, "runExp"), args.shard_workers, args.validate)
+            exp_count = sum(shard[0][1] for shard in shards)
+            run_count = sum(shard[1][1] for shard in shards)
+            print(f"    {exp_count} experiment_objects and {run_count} run_objects successfully written to "
+                  f"{len(shards)} paired shards (exp.NNN.xml/run.NNN.xml).")
+            sys.exit(0)
+
+        exp_count, run_count = tsv2XML(inFile, expOutFile, runOutFile, checksums, manifest, accessions, args.validate,
+                                       args.checklist, history)
+        if manifest is not None:
+            manifest.save_pending()
+            print(f"    {exp_count} experiment_objects and {run_count} run_objects checked against '{args.manifest}'.")
+        else:
+            print(f"    {exp_count} experiment_objects successfully written to '{expOutFile}'.")
+            print(f"    {run_count} run_objects successfully written to '{runOutFile}'.")
+    except FileNotFoundError:
+        print(f"    Error: The input file '{inFile}' was not found.")
+        sys.exit(1)
+    except (ChecklistError, CompressionError) as e:
+        print(f"    Error: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"    An unexpected error occurred: {e}")
+        sys.exit(1)
@@ -1,10 +1,25 @@
-from lxml import etree
+import os
 import sys
 import argparse
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.manifest import Manifest, open_set_writer
+from common.shards import write_shards, parse_size
+from common.receipts import AccessionIndex, DEFAULT_INDEX
+from common.xsd_validation import ValidatingWriter
+from common.aliases import AliasCheckingWriter, AliasHistory
+from common.column_checks import check_sam_tsv, print_report
+from common.compression import CompressionError, open_input
+from common.checklist import DEFAULT_CHECKLIST, ChecklistError, load_checklist, resolve_layout, convert_rows
+from common.metrics import stage, start_metrics
 
 
 """
-Usage: create_sam_lxml.py [-h] -i INPUT
+Usage: create_sam_lxml.py [-h] [-i INPUT] [--checklist CHECKLIST] [--compress {.gz,.zst}] [--delta] [--manifest MANIFEST] [--shard-objects N] [--shard-bytes N]
+                          [--shard-workers N] [--submission SUBMISSION]
+                          [--accessions [INDEX]] [--check-aliases [INDEX]] [--validate] [--check-values]
+                          [--metrics FILE] [--profile FILE]
 
 Convert a `sam.tsv` file into a `sam.xml` file with the required structure for submitting a sample metadata object to ENA.
 
@@ -13,6 +28,21 @@ Options:
   -i INPUT, --input INPUT
                         Specify the path to the input TSV file containing sample metadata.
                         The file must include all required fields for generating the sample metadata XML.
+                        Columns are found by their header names (see the checklist config).
+  --checklist CHECKLIST Checklist config defining the columns and the SAMPLE structure
+                        (default: common/checklists/usutu_ont.json).
+  --compress {.gz,.zst}  Write sam.xml.gz/sam.xml.zst; a .tsv.gz/.tsv.zst input is decompressed on the fly.
+  --accessions [INDEX]  Fill in IGNORE'd 'INSDC accession' values from the alias -> accession index.
+  --check-aliases [INDEX]
+                        Fail if a sample alias was submitted before (accession index + Bloom filter) or repeats.
+  --validate            Validate each SAMPLE against the vendored ENA XSD while writing.
+  --metrics FILE        Write per-stage timings, rows/sec, skipped rows and peak memory (JSON, or *.prom).
+  --profile FILE        Dump cProfile stats of the row loop.
+  --check-values        Check collection dates, coordinates and host sex of all rows before any XML is built.
+  --delta               Write only new samples to sam.add.xml and changed samples to sam.modify.xml.
+  --shard-objects N, --shard-bytes N
+                        Split the output into sam.000.xml, sam.001.xml, ... of at most N objects/bytes,
+                        generated in parallel, each paired with sam.NNN.submission.xml.
 
 # CHECK LIST
 
@@ -24,141 +54,54 @@ Options:
 
 
 
-# Helper function to create a SAMPLE_ATTRIBUTE
-def create_sample_attribute(parent, tag, value, units=None):
+def convert_lines(lines, first_line, writer, accessions=None, layout=None, checklist=DEFAULT_CHECKLIST):
     """
-    Create a SAMPLE_ATTRIBUTE XML element.
+    Convert TSV lines (starting at line number `first_line`) into SAMPLE elements
+    and pass each one to the writer as soon as it is built.
+    The columns are found with `layout` (resolved from the first line if not given),
+    the SAMPLE structure comes from the `checklist` config.
+    Returns (lines processed, lines skipped).
     """
-    sample_attr = etree.SubElement(parent, "SAMPLE_ATTRIBUTE")
-    etree.SubElement(sample_attr, "TAG").text = tag
-    etree.SubElement(sample_attr, "VALUE").text = value
-    if units:
-        etree.SubElement(sample_attr, "UNITS").text = units
-
-def tsv2XML(tsvInFile, xmlOutFile):
+    config = load_checklist(checklist)
+    if layout is None:
+        layout, lines = resolve_layout(config, "sam", lines)
+    emitter = config.emitter("SAMPLE", layout, accessions)
+    line_counter, (skipped_lines,) = convert_rows(lines, first_line, layout, [(emitter, writer, "")])
+    return line_counter, skipped_lines
+
+@stage("samples")
+def tsv2XML(tsvInFile, xmlOutFile, manifest=None, accessions=None, validate=False, checklist=DEFAULT_CHECKLIST,
+            history=None):
     """
-    Convert a TSV file into an XML file with the required structure.
+    Convert a TSV file into an XML file with the structure defined by the `checklist` config.
+    If a `manifest` is given, only new/changed samples are written (to sam.add.xml/sam.modify.xml).
+    If `validate` is set, every element is checked against the ENA XSD as it is written.
+    If an `accessions` index is given, an IGNORE'd INSDC accession is filled in from it.
+    If an alias `history` (common/aliases.py) is given, aliases submitted before or repeated in the
+    file are reported.
     """
-    root = etree.Element("SAMPLE_SET")
-    line_counter = 0  # Total lines processed
-    skipped_lines= 0   # Number of skipped lines (header, errors, or incomplete data)
-
     try:
-        with open(tsvInFile, 'r') as f:
-            for line in f:
-                line_counter += 1
-                line = line.strip()
-
-                # skip empty or malformed lines (not exactly 16 tab-separated values)
-                if not line or len(line.split('\t')) != 16:
-                    print(f"Warning: Skipping malformed or incomplete line {line_counter}.")
-                    skipped_lines+= 1
-                    continue
-
-                # skip lines containing "alias" (header or irrelevant)
-                if "alias" in line:
-                    skipped_lines+= 1
-                    print("Skipping header")
-                    continue
-
-                try:
-                    # Extract required values from TSV (expecting exactly 16 tab-separated fields)
-                    (
-                        insdc_acc, sam_title, isolate, date,
-                        alias, region, host_sex, host_sc,
-                        host_comm, iso_host, lat, long,
-                        host_disease_out, host_health_stat, host_sub_id, pub
-                    ) = line.split('\t')
-
-                    # Ensure required fields are not empty
-                    required_fields = [
-                        insdc_acc, sam_title, isolate, date, alias, region, host_sex, host_sc,
-                        host_comm, iso_host, lat, long, host_disease_out, host_health_stat, host_sub_id, pub
-                    ]
-                    if not all(required_fields):
-                        print(f"Warning: Line {line_counter} contains empty values. Skipping.")
-                        skipped_lines += 1
-                        continue
-
-                except ValueError:
-                    print(f"Warning: Line {line_counter} does not have the expected 16 tab-separated values. Skipping.")
-                    skipped_lines +=1
-                    continue
-
-                # Create SAMPLE element
-                sample = etree.SubElement(root, "SAMPLE", {"alias": alias, "center_name": "One Health Pact Consortium (2020–2022), EcoAlert Collaborative Team (2016–2019)"})
-
-                # Add TITLE
-                etree.SubElement(sample, "TITLE").text = sam_title
-
-                # Add SAMPLE_NAME
-                sample_name = etree.SubElement(sample, "SAMPLE_NAME")
-                etree.SubElement(sample_name, "TAXON_ID").text = "64286"
-                etree.SubElement(sample_name, "SCIENTIFIC_NAME").text = "Usutu virus"
-                etree.SubElement(sample_name, "COMMON_NAME").text = "Usutu virus"
-
-                # Mapping keywords to specific descriptions
-                description_mapping = {
-                    "blood": "Human blood donor samples testing RT-PCR positive for Usutu virus (CT values below 32) "
-                             "were subjected to whole-genome sequencing using an amplicon-based Oxford Nanopore approach.",
-                    "mosquitoes": "Mosquito samples testing RT-PCR positive for Usutu virus (CT values below 32) "
-                                  "were subjected to whole-genome sequencing using an amplicon-based Oxford Nanopore approach.",
-                    "free-ranging": "Samples from free-ranging birds testing RT-PCR positive for Usutu virus (CT values below 32) "
-                                    "were subjected to whole-genome sequencing using an amplicon-based Oxford Nanopore approach.",
-                    "captivity": "Samples from birds in captivity testing RT-PCR positive for Usutu virus (CT values below 32) "
-                                 "were subjected to whole-genome sequencing using an amplicon-based Oxford Nanopore approach."
-                }
-
-                # Default description
-                default_description = (
-                    "Samples collected from humans (blood donors), wildlife (birds and mosquitoes), and captive birds in the Netherlands "
-                    "that tested RT-PCR positive for Usutu virus (CT values below 32) were subjected to whole-genome sequencing using an "
-                    "amplicon-based Oxford Nanopore approach."
-                )
-
-                # Determine the description based on sam_title
-                description = next(
-                    (desc for keyword, desc in description_mapping.items() if keyword in sam_title),
-                    default_description
-                )
-
-                # Add DESCRIPTION
-                etree.SubElement(sample, "DESCRIPTION").text = description
-
-                # Add SAMPLE_ATTRIBUTES
-                sample_attributes = etree.SubElement(sample, "SAMPLE_ATTRIBUTES")
-                create_sample_attribute(sample_attributes, "collecting institution", "One Health Pact Consortium (2020–2022), EcoAlert Collaborative Team (2016–2019)") #One Health PACT Usutu virus workgroup
-                create_sample_attribute(sample_attributes, "collection date", date)
-                create_sample_attribute(sample_attributes, "collector name", "One Health Pact Consortium (2020–2022), EcoAlert Collaborative Team (2016–2019)")
-                create_sample_attribute(sample_attributes, "geographic location (country and/or sea)", "Netherlands")
-                if region != "IGNORE": # Add optional attributes if applicable
-                    create_sample_attribute(sample_attributes, "geographic location (region and locality)", region)
-                create_sample_attribute(sample_attributes, "geographic location (latitude)", lat, "DD")
-                create_sample_attribute(sample_attributes, "geographic location (longitude)", long, "DD")
-                create_sample_attribute(sample_attributes, "sample capture status", "active surveillance not initiated by an outbreak")
-                if iso_host != "IGNORE": # Add optional attributes if applicable
-                    create_sample_attribute(sample_attributes, "isolation source host-associated", iso_host)
-                create_sample_attribute(sample_attributes, "host scientific name", host_sc)
-                create_sample_attribute(sample_attributes, "host common name", host_comm)
-                create_sample_attribute(sample_attributes, "host health state", host_health_stat)
-                if host_disease_out != "IGNORE": # Add optional attributes if applicable
-                    create_sample_attribute(sample_attributes, "host disease outcome", host_disease_out)
-                create_sample_attribute(sample_attributes, "host sex", host_sex)
-                create_sample_attribute(sample_attributes, "host subject id", host_sub_id)
-                create_sample_attribute(sample_attributes, "isolate", isolate)
-                create_sample_attribute(sample_attributes, "publication", pub)
-                if insdc_acc != "IGNORE": # Add optional attributes if applicable
-                    create_sample_attribute(sample_attributes, "INSDC accession", insdc_acc)
-                create_sample_attribute(sample_attributes, "ENA-CHECKLIST", "ERC000033")
+        layout = load_checklist(checklist).layout_of_file("sam", tsvInFile)
+        with open_input(tsvInFile) as f, open_set_writer(xmlOutFile, "SAMPLE_SET", manifest) as writer:
+            validator = ValidatingWriter(writer, tsvInFile) if validate else None
+            checker = AliasCheckingWriter(validator or writer, history, tsvInFile,
+                                          manifest.objects("SAMPLE") if manifest else None) if history else None
+            line_counter, skipped_lines = convert_lines(f, 1, checker or validator or writer, accessions, layout,
+                                                        checklist)
 
     except FileNotFoundError:
         print(f"Error: The file '{tsvInFile}' does not exist.")
         sys.exit(1)
 
-    # Format and write the XML to file using lxml
-    tree = etree.ElementTree(root)
-    with open(xmlOutFile, 'wb') as file:
-        tree.write(file, pretty_print=True, xml_declaration=True, encoding="UTF-8")
+    failed = False
+    if validator is not None and validator.invalid:
+        print(f"Error: {validator.invalid} samples failed XSD validation.")
+        failed = True
+    if checker is not None and checker.duplicates:
+        print(f"Error: {checker.duplicates} samples have an alias that was already submitted or is repeated.")
+        failed = True
+    if failed:
+        sys.exit(1)
 
     written = line_counter - skipped_lines
     return written
@@ -176,19 +119,157 @@ if __name__ == '__main__':
              "The file must include all required fields for generating the sam metadata XML.",
         default="sam.tsv"
     )
+    parser.add_argument(
+        "--checklist",
+        help="Checklist config (JSON) defining the sam.tsv columns and the SAMPLE XML structure.",
+        default=DEFAULT_CHECKLIST
+    )
+    parser.add_argument(
+        "--compress",
+        choices=[".gz", ".zst"],
+        default="",
+        help="Write compressed XML (sam.xml.gz or sam.xml.zst, compressed in a background thread). "
+             "The input TSV may also be compressed (.tsv.gz/.tsv.zst)."
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Incremental mode: write only new aliases to sam.add.xml and changed aliases to "
+             "sam.modify.xml, compared with the manifest of the last successful submission."
+    )
+    parser.add_argument(
+        "--manifest",
+        help="Row-hash manifest of the last successful submission (used with --delta).",
+        default="sam.manifest.json"
+    )
+
+    parser.add_argument(
+        "--shard-objects",
+        type=int,
+        help="Split the output into shards of at most N objects (sam.000.xml, sam.001.xml, ...), each with its own submission XML.",
+        default=None
+    )
+    parser.add_argument(
+        "--shard-bytes",
+        type=parse_size,
+        help="Split the output into shards of at most N bytes (e.g. 5M), each with its own submission XML.",
+        default=None
+    )
+    parser.add_argument(
+        "--shard-workers",
+        type=int,
+        help="Number of processes generating shards (default: number of cores).",
+        default=None
+    )
+    parser.add_argument(
+        "--submission",
+        help="Submission XML paired with every shard.",
+        default="add_submission.xml"
+    )
+
+    parser.add_argument(
+        "--accessions",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Fill in IGNORE'd 'INSDC accession' values from the accession index (default index: accessions.sqlite, see common/receipts.py).",
+        default=None
+    )
+    parser.add_argument(
+        "--check-aliases",
+        nargs="?",
+        const=DEFAULT_INDEX,
+        help="Report aliases that were already submitted (per the accession index, default: accessions.sqlite, "
+             "behind a Bloom filter) or appear twice, and fail after writing (see common/aliases.py).",
+        default=None
+    )
+
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Validate every SAMPLE element against the vendored ENA XSD as it is written; "
+             "errors are reported with their TSV line."
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Write per-stage wall time, rows/sec, skipped rows by reason and peak memory to this file "
+             "when the run ends (JSON, or Prometheus text format for *.prom; see common/metrics.py).",
+        default=None
+    )
+    parser.add_argument(
+        "--profile",
+        help="Run the row loop under cProfile and dump the stats to this file (python3 -m pstats FILE).",
+        default=None
+    )
+
+    parser.add_argument(
+        "--check-values",
+        action="store_true",
+        help="Check collection dates, latitude/longitude and host sex of all rows (column-wise, "
+             "see common/column_checks.py) and stop before any XML is built if a value is invalid."
+    )
 
     # Parse arguments
     args = parser.parse_args()
+
+    # Record per-stage timings and counters (written when the process exits)
+    if args.metrics or args.profile:
+        start_metrics(args.metrics, args.profile)
+
     inFile = args.input  # Input file name
-    outFile ="sam.xml"   # Input file name
+    outFile = "sam.xml" + args.compress  # Output file name
+
+    sharded = bool(args.shard_objects or args.shard_bytes)
+    if sharded and args.delta:
+        parser.error("--delta cannot be combined with --shard-objects/--shard-bytes")
+    if sharded and args.check_aliases:
+        parser.error("--check-aliases cannot be combined with --shard-objects/--shard-bytes")
+
+    # Check the metadata values of all rows before building any XML
+    if args.check_values:
+        try:
+            checked, problems = check_sam_tsv(inFile, checklist=args.checklist)
+        except FileNotFoundError:
+            print(f"    Error: The file '{inFile}' does not exist.")
+            sys.exit(1)
+        except (ChecklistError, CompressionError) as e:
+            print(f"    Error: {e}")
+            sys.exit(1)
+        if problems:
+            print_report(inFile, problems)
+            print(f"    Error: {len(problems)} of {checked} sample rows have invalid values, no XML written.")
+            sys.exit(1)
+
+    # Open the alias -> accession index built from earlier receipts
+    accessions = AccessionIndex(args.accessions) if args.accessions else None
+    history = AliasHistory(args.check_aliases) if args.check_aliases else None
+
+    # Load the manifest of the last successful submission for incremental mode
+    manifest = Manifest(args.manifest) if args.delta else None
 
     # Execute the TSV to XML conversion
     try:
-        COUNT=tsv2XML(inFile, outFile)
-        print(f"    {COUNT} sample_objects successfully written to '{outFile}'.")
+        if sharded:
+            layout = load_checklist(args.checklist).layout_of_file("sam", inFile)
+            shards = write_shards(inFile, [outFile], ["SAMPLE_SET"],
+                                  partial(convert_lines, accessions=accessions, layout=layout, checklist=args.checklist),
+                                  args.shard_objects, args.shard_bytes, args.submission, "sam", args.shard_workers,
+                                  args.validate)
+            COUNT = sum(count for shard in shards for _, count in shard)
+            print(f"    {COUNT} sample_objects successfully written to {len(shards)} shards (sam.NNN.xml).")
+            sys.exit(0)
+
+        COUNT=tsv2XML(inFile, outFile, manifest, accessions, args.validate, args.checklist, history)
+        if manifest is not None:
+            manifest.save_pending()
+            print(f"    {COUNT} sample_objects checked against '{args.manifest}'.")
+        else:
+            print(f"    {COUNT} sample_objects successfully written to '{outFile}'.")
     except FileNotFoundError:
         print(f"    Error: The file '{inFile}' does not exist.")
         sys.exit(1)
+    except (ChecklistError, CompressionError) as e:
+        print(f"    Error: {e}")
+        sys.exit(1)
     except Exception as e:
         print(f"    An unexpected error occurred: {e}")
         sys.exit(1)
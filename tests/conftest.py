@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench.ftp_standin import FtpStandin
+from bench.mock_dropbox import Dropbox, MockDropbox
+
+"""
+Shared fixtures: the mock dropbox and the FTP stand-in, served in-process on free ports.
+"""
+
+DROPBOX_PATH = "/ena/submit/drop-box/submit/"
+
+
+class ScriptedRandom:
+    """
+    Stand-in for the servers' random.Random: `random()` returns the scripted rolls in turn,
+    then `default`, so injected errors and drops happen on exactly the requests a test chooses.
+    """
+
+    def __init__(self, rolls=(), default=0.99):
+        self.rolls = list(rolls)
+        self.default = default
+
+    def random(self):
+        return self.rolls.pop(0) if self.rolls else self.default
+
+    def uniform(self, a, b):
+        return 0.0
+
+    def choice(self, sequence):
+        return sequence[0]
+
+
+class CountingDropbox(MockDropbox):
+    """
+    MockDropbox that counts the TCP connections it accepts.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+
+    def get_request(self):
+        request = super().get_request()
+        self.connections += 1
+        return request
+
+
+def _serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def dropbox():
+    """
+    Mock dropbox on 127.0.0.1; `dropbox.url` is its submission URL, `dropbox.random` a ScriptedRandom.
+    Injected 5xx errors need a roll below drop_rate + error_rate, drops a roll below drop_rate.
+    """
+    server = CountingDropbox(("127.0.0.1", 0), Dropbox(), drop_rate=0.1, error_rate=0.1)
+    server.random = ScriptedRandom()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}{DROPBOX_PATH}"
+    thread = _serve(server)
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def ftp_server(tmp_path):
+    """
+    FTP stand-in on 127.0.0.1 storing the uploads in `ftp_server.root`.
+    """
+    root = tmp_path / "upload_area"
+    root.mkdir()
+    server = FtpStandin(("127.0.0.1", 0), str(root))
+    thread = _serve(server)
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
@@ -0,0 +1,56 @@
+import os
+import shutil
+import sys
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+from create_batches import convert_batch, find_batches
+
+"""
+create_batches.py: batch discovery and per-batch conversion with the single-file converters.
+"""
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def make_tree(inDir):
+    runExp = os.path.join(REPO_DIR, "runExpSubmit", "runExp.tsv")
+    os.makedirs(inDir / "FAW1")
+    os.makedirs(inDir / "runs" / "FAW2")
+    shutil.copy(os.path.join(REPO_DIR, "samSubmit", "sam.tsv"), inDir / "FAW1" / "sam.tsv")
+    shutil.copy(runExp, inDir / "FAW1" / "runExp.tsv")
+    shutil.copy(runExp, inDir / "FAW1" / "exp.tsv")   # ignored next to runExp.tsv
+    shutil.copy(runExp, inDir / "runs" / "FAW2" / "run.tsv")
+
+
+def test_find_batches(tmp_path):
+    make_tree(tmp_path)
+    batches = find_batches(str(tmp_path))
+    assert {name: sorted(tsvs) for name, tsvs in batches.items()} == \
+        {"FAW1": ["runExp.tsv", "sam.tsv"], os.path.join("runs", "FAW2"): ["run.tsv"]}
+
+
+def test_batch_output_matches_the_converters(tmp_path):
+    make_tree(tmp_path / "in")
+    batches = find_batches(str(tmp_path / "in"))
+    records = {name: convert_batch(name, tsvs, str(tmp_path / "out" / name)) for name, tsvs in batches.items()}
+
+    assert records["FAW1"]["status"] == "ok"
+    assert records["FAW1"]["objects"] == {"SAMPLE": 6, "EXPERIMENT": 6, "RUN": 6}
+    assert records["FAW1"]["skipped_rows"] == {"SAMPLE": 1, "EXPERIMENT": 0, "RUN": 0}
+    for xmlName, submitDir in (("sam.xml", "samSubmit"), ("exp.xml", "runExpSubmit"), ("run.xml", "runExpSubmit")):
+        assert read(tmp_path / "out" / "FAW1" / xmlName) == read(os.path.join(REPO_DIR, submitDir, xmlName))
+    assert sorted(os.listdir(tmp_path / "out" / "runs" / "FAW2")) == ["batch.log", "run.xml"]
+
+
+def test_invalid_batch_converts_its_other_tsvs(tmp_path):
+    make_tree(tmp_path / "in")
+    tsvs = find_batches(str(tmp_path / "in"))["FAW1"]
+    record = convert_batch("FAW1", tsvs, str(tmp_path / "out"), validate=True)
+    assert record["status"] == "invalid"   # the instrument models of runExp.tsv are not in the ENA vocabulary
+    assert record["objects"] == {"SAMPLE": 6}
+    with open(tmp_path / "out" / "batch.log") as f:
+        assert "6 experiments and 0 runs failed XSD validation" in f.read()
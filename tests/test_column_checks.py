@@ -0,0 +1,69 @@
+import datetime
+import gzip
+import os
+import sys
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+from common.column_checks import check_coordinate, check_date, check_sam_tsv
+
+"""
+check_sam_tsv: dates, coordinates and host sex checked per column, reported with line numbers.
+"""
+
+
+def write_sam_tsv(path, rows):
+    """
+    sam.tsv with the repo's header; every row is the first sample of samSubmit/sam.tsv with another
+    collection date, host_sex, latitude and longitude.
+    """
+    with open(os.path.join(REPO_DIR, "samSubmit", "sam.tsv"), 'r', encoding="UTF-8") as f:
+        header, first = f.readline(), f.readline().rstrip("\n").split("\t")
+    lines = [header]
+    for index, (date, host_sex, latitude, longitude) in enumerate(rows):
+        fields = first[:3] + [date, f"s{index}", first[5], host_sex] + first[7:10] + [latitude, longitude] + first[12:]
+        lines.append("\t".join(fields) + "\n")
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, 'wt', encoding="UTF-8") as f:
+        f.writelines(lines)
+    return str(path)
+
+
+def test_check_date_and_coordinate():
+    assert check_date("2020") is None and check_date("2020-02-29") is None and check_date("2019/2020-01") is None
+    assert check_date("not collected") is None
+    assert check_date("2019-02-29") == "not a calendar date"
+    assert check_date("19-02-2019") == "not a date (YYYY, YYYY-MM or YYYY-MM-DD)"
+    assert check_date(str(datetime.date.today().year + 1)) == "in the future"
+    assert check_coordinate("-90", 90) is None and check_coordinate("180.0", 180) is None
+    assert check_coordinate("90.5", 90) == "outside [-90, 90]"
+    assert check_coordinate("north", 90) == "not a number in decimal degrees"
+
+
+def test_invalid_values_are_reported_by_line(tmp_path):
+    sam_tsv = write_sam_tsv(tmp_path / "sam.tsv", [
+        ("2020-01-01", "female", "52.1", "5.2"),
+        ("2020-13-01", "female", "52.1", "5.2"),
+        ("2020-01-01", "unknown sex", "95", "5.2"),
+        ("2020-13-01", "male", "52.1", "east"),
+        ("not collected", "not collected", "not collected", "not collected"),
+    ])
+    checked, problems = check_sam_tsv(sam_tsv, chunk_bytes=1024)
+    assert checked == 5
+    assert sorted(problems) == [3, 4, 5]
+    assert problems[3] == ["collection date '2020-13-01' not a calendar date"]
+    assert any(message.startswith("host sex 'unknown sex'") for message in problems[4])
+    assert any(message.startswith("geographic location (latitude) '95'") for message in problems[4])
+    assert len(problems[5]) == 2
+
+
+def test_small_chunks_and_compressed_input(tmp_path):
+    rows = [("2020-01-01", "female", "52.1", "5.2")] * 50 + [("2020-02-30", "female", "52.1", "5.2")]
+    plain = check_sam_tsv(write_sam_tsv(tmp_path / "sam.tsv", rows), chunk_bytes=512)
+    compressed = check_sam_tsv(write_sam_tsv(tmp_path / "sam.tsv.gz", rows))
+    assert plain == compressed == (51, {52: ["collection date '2020-02-30' not a calendar date"]})
+
+
+def test_repo_tsv():
+    checked, problems = check_sam_tsv(os.path.join(REPO_DIR, "samSubmit", "sam.tsv"))
+    assert (checked, problems) == (6, {5: ["geographic location (latitude) '94.2156' outside [-90, 90]"]})
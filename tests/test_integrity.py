@@ -0,0 +1,71 @@
+import os
+import sys
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+from common.integrity import check_integrity
+
+"""
+check_integrity: dangling references, duplicate aliases and orphaned samples, with line numbers.
+"""
+
+
+def write_sam_tsv(path, rows):
+    """
+    sam.tsv with the repo's header; every row is the first sample of samSubmit/sam.tsv with another
+    alias and host_sex.
+    """
+    with open(os.path.join(REPO_DIR, "samSubmit", "sam.tsv"), 'r', encoding="UTF-8") as f:
+        header, first = f.readline(), f.readline().rstrip("\n").split("\t")
+    with open(path, 'w', encoding="UTF-8") as f:
+        f.write(header)
+        for alias, host_sex in rows:
+            f.write("\t".join(first[:4] + [alias, first[5], host_sex] + first[7:]) + "\n")
+    return str(path)
+
+
+def write_runexp_tsv(path, rows):
+    with open(path, 'w', encoding="UTF-8") as f:
+        for sample, experiment, instrument in rows:
+            f.write(f"{sample}\t{experiment}\t{sample}.fastq.gz\t7430f488a40100e3b7f259316e911c18\t{instrument}\n")
+    return str(path)
+
+
+def problems(found):
+    return sorted((os.path.basename(path), line, message) for path, line, message in found)
+
+
+def test_references_duplicates_and_orphans(tmp_path):
+    sam_tsv = write_sam_tsv(tmp_path / "sam.tsv", [
+        ("s1", "female"), ("s2", "male"), ("s3", "male"), ("s2", "male"),
+        ("s4", "  "),       # blank after normalization: not a sample
+    ])
+    runexp_tsv = write_runexp_tsv(tmp_path / "runExp.tsv", [
+        ("s1", "e1", "RealION"),
+        ("s2", "e2", "RealION"),
+        ("s4", "e3", "RealION"),
+        ("s1", "e1", "RealION"),
+    ])
+    errors, warnings = check_integrity(sam_tsv, runexp_tsv, runexp_tsv)
+    assert problems(errors) == [
+        ("runExp.tsv", 3, "experiment references unknown sample 's4'"),
+        ("runExp.tsv", 4, "duplicate experiment alias 'e1' (first on line 1)"),
+        ("runExp.tsv", 4, "duplicate run alias 's1' (first on line 1)"),
+        ("sam.tsv", 5, "duplicate sample alias 's2' (first on line 3)"),
+    ]
+    assert problems(warnings) == [("sam.tsv", 4, "sample 's3' is not referenced by any experiment")]
+
+
+def test_runs_in_their_own_tsv(tmp_path):
+    sam_tsv = write_sam_tsv(tmp_path / "sam.tsv", [("s1", "female"), ("s2", "male")])
+    exp_tsv = write_runexp_tsv(tmp_path / "exp.tsv", [("s1", "e1", "RealION"), ("s2", "e2", "RealION")])
+    run_tsv = write_runexp_tsv(tmp_path / "run.tsv", [("s1", "e1", "RealION"), ("s2", "e9", "RealION")])
+    errors, warnings = check_integrity(sam_tsv, exp_tsv, run_tsv)
+    assert problems(errors) == [("run.tsv", 2, "run references unknown experiment 'e9'")]
+    assert warnings == []
+
+
+def test_clean_tsvs():
+    sam_tsv = os.path.join(REPO_DIR, "samSubmit", "sam.tsv")
+    runexp_tsv = os.path.join(REPO_DIR, "runExpSubmit", "runExp.tsv")
+    assert check_integrity(sam_tsv, runexp_tsv, runexp_tsv) == ([], [])
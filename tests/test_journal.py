@@ -0,0 +1,100 @@
+import gzip
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.journal import SubmissionJournal, already_submitted, payload_digest
+
+"""
+SubmissionJournal: state per (URL, payload), torn-tail recovery, payload hashing.
+"""
+
+URL = "http://127.0.0.1:8089/ena/submit/drop-box/submit/"
+
+
+def write_batch(directory, content=b"<SAMPLE_SET><SAMPLE alias=\"a\"/></SAMPLE_SET>\n"):
+    (directory / "add_submission.xml").write_bytes(b"<SUBMISSION/>\n")
+    (directory / "sam.000.xml").write_bytes(content)
+    return {"SUBMISSION": str(directory / "add_submission.xml"), "SAMPLE": str(directory / "sam.000.xml")}
+
+
+def read_records(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_latest_record_is_the_state(tmp_path):
+    batch = write_batch(tmp_path)
+    path = str(tmp_path / "submission.journal")
+    journal = SubmissionJournal(path, URL)
+    assert journal.state(batch) is None
+    journal.record(batch, "started")
+    journal.record(batch, "accepted", b"<RECEIPT success=\"true\"/>")
+    journal.close()
+
+    state = SubmissionJournal(path, URL).state(batch)
+    assert state["status"] == "accepted"
+    assert state["receipt"] == "<RECEIPT success=\"true\"/>"
+    assert state["objects"] == ["SAMPLE"] and state["shard"] == 0
+    assert SubmissionJournal(path, "https://www.ebi.ac.uk/ena/submit/drop-box/submit/").state(batch) is None
+
+
+def test_changed_payload_is_a_new_unit(tmp_path):
+    batch = write_batch(tmp_path)
+    path = str(tmp_path / "submission.journal")
+    journal = SubmissionJournal(path, URL)
+    journal.record(batch, "accepted", b"<RECEIPT/>")
+    journal.close()
+    write_batch(tmp_path, b"<SAMPLE_SET><SAMPLE alias=\"b\"/></SAMPLE_SET>\n")
+    assert SubmissionJournal(path, URL).state(batch) is None
+
+
+def test_torn_tail_is_cut_off(tmp_path):
+    batch = write_batch(tmp_path)
+    path = str(tmp_path / "submission.journal")
+    journal = SubmissionJournal(path, URL)
+    journal.record(batch, "started")
+    journal.close()
+    with open(path, 'ab') as f:
+        f.write(b'{"time": "2026-01-01T00:00:00+00:00", "url": "http://')   # crash during a write
+
+    journal = SubmissionJournal(path, URL)
+    assert journal.state(batch)["status"] == "started"
+    journal.record(batch, "accepted", b"<RECEIPT/>")
+    journal.close()
+    assert [record["status"] for record in read_records(path)] == ["started", "accepted"]
+    assert SubmissionJournal(path, URL).state(batch)["status"] == "accepted"
+
+
+def test_torn_tail_without_any_complete_line(tmp_path):
+    batch = write_batch(tmp_path)
+    path = str(tmp_path / "submission.journal")
+    with open(path, 'wb') as f:
+        f.write(b'{"time": ')
+    journal = SubmissionJournal(path, URL)
+    assert journal.units == {}
+    journal.record(batch, "started")
+    journal.close()
+    assert [record["status"] for record in read_records(path)] == ["started"]
+
+
+def test_payload_digest_of_compressed_files(tmp_path):
+    batch = write_batch(tmp_path)
+    with open(batch["SAMPLE"], 'rb') as f, gzip.open(str(tmp_path / "sam.000.xml.gz"), 'wb') as g:
+        g.write(f.read())
+    compressed = dict(batch, SAMPLE=str(tmp_path / "sam.000.xml.gz"))
+    assert payload_digest(compressed) == payload_digest(batch)
+    assert payload_digest({"SAMPLE": batch["SAMPLE"]}) != payload_digest({"RUN": batch["SAMPLE"]})
+
+
+def test_already_submitted():
+    duplicate = ('<RECEIPT success="false"><MESSAGES><ERROR>In sample, alias: "a". The object being added already '
+                 'exists in the submission account with accession: "ERS1".</ERROR></MESSAGES></RECEIPT>')
+    other = ('<RECEIPT success="false"><MESSAGES><ERROR>In sample, alias: "a". The object being added already '
+             'exists in the submission account with accession: "ERS1".</ERROR><ERROR>Invalid taxon.</ERROR>'
+             '</MESSAGES></RECEIPT>')
+    assert already_submitted(duplicate.encode())
+    assert not already_submitted(other.encode())
+    assert not already_submitted(b'<RECEIPT success="true"><MESSAGES/></RECEIPT>')
+    assert not already_submitted(b"<html>502</html")
@@ -0,0 +1,82 @@
+import os
+import sys
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.manifest import DeltaSetWriter, Manifest, commit, delta_paths, open_set_writer
+from common.xml_stream import StreamingSetWriter
+
+"""
+DeltaSetWriter routing and the pending/commit cycle of the manifest.
+"""
+
+
+def sample(alias, title):
+    element = etree.Element("SAMPLE", alias=alias)
+    etree.SubElement(element, "TITLE").text = title
+    return element
+
+
+def aliases(path):
+    return [element.get("alias") for element in etree.parse(path).getroot()]
+
+
+def write_delta(xmlOutFile, manifest, samples):
+    with open_set_writer(xmlOutFile, "SAMPLE_SET", manifest) as writer:
+        for alias, title in samples:
+            writer.write(sample(alias, title))
+    return writer
+
+
+def test_delta_paths():
+    assert delta_paths("sam.xml") == ("sam.add.xml", "sam.modify.xml")
+    assert delta_paths("out/sam.xml.gz") == ("out/sam.add.xml.gz", "out/sam.modify.xml.gz")
+
+
+def test_routes_new_changed_and_unchanged(tmp_path):
+    xmlOutFile = str(tmp_path / "sam.xml")
+    manifest_file = str(tmp_path / "sam.manifest.json")
+
+    manifest = Manifest(manifest_file)
+    writer = write_delta(xmlOutFile, manifest, [("a", "A"), ("b", "B")])
+    assert isinstance(writer, DeltaSetWriter)
+    assert aliases(writer.add_file) == ["a", "b"] and aliases(writer.modify_file) == []
+    manifest.save_pending()
+    assert not os.path.exists(manifest_file)
+    assert commit(manifest_file)
+
+    writer = write_delta(xmlOutFile, Manifest(manifest_file), [("a", "A"), ("b", "B changed"), ("c", "C")])
+    assert aliases(writer.add_file) == ["c"]
+    assert aliases(writer.modify_file) == ["b"]
+    assert writer.unchanged == 1
+
+
+def test_pending_manifest_only_replaces_the_manifest_on_commit(tmp_path):
+    xmlOutFile = str(tmp_path / "sam.xml")
+    manifest_file = str(tmp_path / "sam.manifest.json")
+    manifest = Manifest(manifest_file)
+    write_delta(xmlOutFile, manifest, [("a", "A")])
+    manifest.save_pending()
+
+    # not committed (e.g. the submission failed): the next delta still sees "a" as new
+    manifest = Manifest(manifest_file)
+    writer = write_delta(xmlOutFile, manifest, [("a", "A")])
+    assert aliases(writer.add_file) == ["a"]
+    manifest.save_pending()
+    assert commit(manifest_file)
+    assert not commit(manifest_file)   # nothing pending any more
+
+    writer = write_delta(xmlOutFile, Manifest(manifest_file), [("a", "A")])
+    assert aliases(writer.add_file) == [] and writer.unchanged == 1
+
+
+def test_delta_files_match_the_full_writer(tmp_path):
+    samples = [("a", "A"), ("b", "B")]
+    full = str(tmp_path / "full.xml")
+    with StreamingSetWriter(full, "SAMPLE_SET") as writer:
+        for alias, title in samples:
+            writer.write(sample(alias, title))
+    delta = write_delta(str(tmp_path / "sam.xml"), Manifest(str(tmp_path / "sam.manifest.json")), samples)
+    with open(full, 'rb') as f, open(delta.add_file, 'rb') as g:
+        assert f.read() == g.read()
@@ -0,0 +1,43 @@
+import hashlib
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.md5_checksums import md5_files
+
+"""
+md5_files: cached digests, and missing or unreadable files reported instead of raised.
+"""
+
+
+def write_fastq(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def test_digests_are_cached(tmp_path):
+    cache_file = str(tmp_path / "md5_cache.json")
+    paths = [write_fastq(tmp_path / f"{name}.fastq.gz", name.encode() * 1000) for name in ("a", "b")]
+    checksums, unreadable = md5_files(paths, cache_file, workers=2)
+    assert checksums == {path: hashlib.md5(name.encode() * 1000).hexdigest() for path, name in zip(paths, "ab")}
+    assert unreadable == {}
+
+    # an unchanged file is answered from the cache, not read again
+    with open(cache_file, 'r') as f:
+        entries = json.load(f)
+    entries[os.path.abspath(paths[0])]["md5"] = "0" * 32
+    with open(cache_file, 'w') as f:
+        json.dump(entries, f)
+    assert md5_files(paths, cache_file)[0][paths[0]] == "0" * 32
+
+
+def test_unreadable_files_are_reported(tmp_path):
+    good = write_fastq(tmp_path / "a.fastq.gz", b"reads")
+    directory = tmp_path / "b.fastq.gz"
+    directory.mkdir()
+    missing = str(tmp_path / "c.fastq.gz")
+    checksums, unreadable = md5_files([good, str(directory), missing], None, workers=2)
+    assert list(checksums) == [good]
+    assert unreadable == {str(directory): "Is a directory", missing: "No such file or directory"}
@@ -0,0 +1,99 @@
+import os
+import sys
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+from common.output_cache import CACHE_DIR, KEEP_ENTRIES, OutputCache
+from create_xml import convert_cached
+
+"""
+OutputCache through convert_cached: hits, misses on changed inputs, and entries overwritten in place.
+"""
+
+
+def read(path):
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    return str(path)
+
+
+class Converter:
+    """
+    Stand-in converter: writes the upper-cased TSV to the output and counts its calls.
+    """
+
+    def __init__(self, tsvInFile, xmlOutFile):
+        self.tsvInFile = tsvInFile
+        self.xmlOutFile = xmlOutFile
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        text = read(self.tsvInFile).upper()
+        write(self.xmlOutFile, text)
+        return len(text)
+
+
+def run(tmp_path, converter, options=None):
+    cache = OutputCache(str(tmp_path))
+    config = str(tmp_path / "checklist.json")
+    if not os.path.exists(config):
+        write(config, "{}")
+    return convert_cached(cache, [converter.tsvInFile], [converter.xmlOutFile], config, options or {}, converter)
+
+
+def test_hit_after_store(tmp_path):
+    converter = Converter(write(tmp_path / "sam.tsv", "a\tb\n"), str(tmp_path / "sam.xml"))
+    assert run(tmp_path, converter) == (4, False)
+    assert run(tmp_path, converter) == (4, True)
+    assert converter.calls == 1
+    assert read(converter.xmlOutFile) == "A\tB\n"
+
+    # a touched but identical TSV is hashed again, and still hits
+    os.utime(converter.tsvInFile, ns=(0, 0))
+    assert run(tmp_path, converter) == (4, True)
+
+    # other options are another entry
+    assert run(tmp_path, converter, {"compress": ".gz"}) == (4, False)
+    assert converter.calls == 2
+
+
+def test_miss_on_changed_input(tmp_path):
+    converter = Converter(write(tmp_path / "sam.tsv", "a\n"), str(tmp_path / "sam.xml"))
+    run(tmp_path, converter)
+    write(converter.tsvInFile, "b\n")
+    assert run(tmp_path, converter) == (2, False)
+    assert read(converter.xmlOutFile) == "B\n"
+
+    # the entry of the first version was left intact: changing back links it into place
+    write(converter.tsvInFile, "a\n")
+    assert run(tmp_path, converter) == (2, True)
+    assert read(converter.xmlOutFile) == "A\n"
+    assert converter.calls == 2
+
+
+def test_entry_overwritten_in_place(tmp_path):
+    converter = Converter(write(tmp_path / "sam.tsv", "a\n"), str(tmp_path / "sam.xml"))
+    run(tmp_path, converter)
+    assert os.stat(converter.xmlOutFile).st_nlink == 2   # linked to the cache entry
+
+    # e.g. a standalone converter rewriting sam.xml through the link: the entry is not used any more
+    write(converter.xmlOutFile, "something else\n")
+    assert run(tmp_path, converter) == (2, False)
+    assert read(converter.xmlOutFile) == "A\n"
+    assert run(tmp_path, converter) == (2, True)
+    assert converter.calls == 2
+
+
+def test_prune(tmp_path):
+    converter = Converter(str(tmp_path / "sam.tsv"), str(tmp_path / "sam.xml"))
+    for i in range(KEEP_ENTRIES + 2):
+        write(converter.tsvInFile, f"{i}\n")
+        run(tmp_path, converter)
+    entries = [name for name in os.listdir(tmp_path / CACHE_DIR) if os.path.isdir(tmp_path / CACHE_DIR / name)]
+    assert len(entries) == KEEP_ENTRIES
@@ -0,0 +1,169 @@
+import glob
+import gzip
+import os
+import sys
+
+import pytest
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import shards
+from common.shards import parse_size, shard_path, write_shards
+from common.xml_stream import StreamingSetWriter
+
+"""
+write_shards: object and byte limits, packing across chunks, shared boundaries and renumbering.
+The converters below are module-level so that the worker processes can unpickle them.
+"""
+
+SUBMISSION_XML = b"<SUBMISSION><ACTIONS><ACTION><ADD/></ACTION></ACTIONS></SUBMISSION>\n"
+
+
+def convert_samples(lines, first_line, writer):
+    # "<alias>\t<title length>" per line
+    for line in lines:
+        alias, length = line.rstrip("\n").split("\t")
+        element = etree.Element("SAMPLE", alias=alias)
+        etree.SubElement(element, "TITLE").text = "x" * int(length)
+        writer.write(element)
+    return len(lines), 0
+
+
+def convert_experiments(lines, first_line, exp_writer, run_writer):
+    # "<alias>\t<number of runs (0 or 1)>" per line
+    for line in lines:
+        alias, runs = line.rstrip("\n").split("\t")
+        exp_writer.write(etree.Element("EXPERIMENT", alias=alias))
+        if int(runs):
+            run_writer.write(etree.Element("RUN", alias=alias + "_run"))
+    return len(lines), 0
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(shards, "DEFAULT_CHUNK_ROWS", 7)   # shards span several chunks
+
+
+def write_tsv(path, rows):
+    with open(path, 'w') as f:
+        for row in rows:
+            f.write("\t".join(str(value) for value in row) + "\n")
+    return str(path)
+
+
+def write_submission(directory):
+    path = str(directory / "add_submission.xml")
+    with open(path, 'wb') as f:
+        f.write(SUBMISSION_XML)
+    return path
+
+
+def aliases(path):
+    with open(path, 'rb') as f:
+        return [element.get("alias") for element in etree.fromstring(f.read())]
+
+
+def set_bytes(tmp_path, root_tag, alias_lengths):
+    """
+    The bytes StreamingSetWriter writes for these samples.
+    """
+    path = str(tmp_path / "expected.xml")
+    with StreamingSetWriter(path, root_tag) as writer:
+        for alias, length in alias_lengths:
+            element = etree.Element("SAMPLE", alias=alias)
+            etree.SubElement(element, "TITLE").text = "x" * length
+            writer.write(element)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_parse_size_and_shard_path():
+    assert parse_size("500K") == 500 * 1024 and parse_size("5MB") == 5 * 1024 ** 2 and parse_size("123") == 123
+    assert shard_path("sam.xml", 3) == "sam.003.xml"
+    assert shard_path("out/sam.xml.gz", 12) == "out/sam.012.xml.gz"
+
+
+def test_object_limit(tmp_path):
+    rows = [(f"s{i}", i % 5) for i in range(25)]
+    tsvInFile = write_tsv(tmp_path / "sam.tsv", rows)
+    xmlOutFile = str(tmp_path / "sam.xml")
+    result = write_shards(tsvInFile, [xmlOutFile], ["SAMPLE_SET"], convert_samples, max_objects=4, workers=2,
+                          submission_xml=write_submission(tmp_path),
+                          submission_name=str(tmp_path / "sam"))
+    assert [counts for ((path, counts),) in result] == [4, 4, 4, 4, 4, 4, 1]
+    assert [path for ((path, counts),) in result] == [shard_path(xmlOutFile, i) for i in range(7)]
+    assert len(glob.glob(str(tmp_path / "sam.[0-9][0-9][0-9].submission.xml"))) == 7
+    assert not glob.glob(str(tmp_path / "*.part*"))
+
+    # each shard is exactly what the streaming writer writes for its rows
+    for index, ((path, count),) in enumerate(result):
+        with open(path, 'rb') as f:
+            assert f.read() == set_bytes(tmp_path, "SAMPLE_SET", rows[4 * index:4 * index + count])
+
+
+def test_byte_limit(tmp_path):
+    rows = [(f"s{i}", (i * 37) % 300) for i in range(60)]
+    tsvInFile = write_tsv(tmp_path / "sam.tsv", rows)
+    xmlOutFile = str(tmp_path / "sam.xml")
+    max_bytes = 2000
+    result = write_shards(tsvInFile, [xmlOutFile], ["SAMPLE_SET"], convert_samples, max_bytes=max_bytes, workers=2)
+
+    element_sizes = {alias: len(set_bytes(tmp_path, "SAMPLE_SET", [(alias, length)] * 2))
+                     - len(set_bytes(tmp_path, "SAMPLE_SET", [(alias, length)])) for alias, length in rows}
+    written = []
+    for index, ((path, count),) in enumerate(result):
+        size = os.path.getsize(path)
+        assert size <= max_bytes
+        written.extend(aliases(path))
+        if index + 1 < len(result):
+            # the shard was closed only because the next row did not fit
+            next_alias = aliases(result[index + 1][0][0])[0]
+            assert size + element_sizes[next_alias] > max_bytes
+    assert written == [alias for alias, length in rows]
+
+
+def test_oversized_row_gets_its_own_shard(tmp_path):
+    tsvInFile = write_tsv(tmp_path / "sam.tsv", [("a", 10), ("big", 5000), ("b", 10), ("c", 10)])
+    result = write_shards(tsvInFile, [str(tmp_path / "sam.xml")], ["SAMPLE_SET"], convert_samples,
+                          max_bytes=1000, workers=1)
+    assert [aliases(path) for ((path, count),) in result] == [["a"], ["big"], ["b", "c"]]
+
+
+def test_object_types_share_boundaries(tmp_path):
+    rows = [(f"e{i}", int(i < 5)) for i in range(20)]
+    tsvInFile = write_tsv(tmp_path / "runExp.tsv", rows)
+    expOutFile, runOutFile = str(tmp_path / "exp.xml"), str(tmp_path / "run.xml")
+    result = write_shards(tsvInFile, [expOutFile, runOutFile], ["EXPERIMENT_SET", "RUN_SET"], convert_experiments,
+                          max_objects=3, workers=2)
+    assert [aliases(exp_path) for (exp_path, exp_count), run in result] == \
+        [[f"e{i}" for i in range(start, min(start + 3, 20))] for start in range(0, 20, 3)]
+    assert [aliases(run_path) for exp, (run_path, run_count) in result[:2]] == \
+        [["e0_run", "e1_run", "e2_run"], ["e3_run", "e4_run"]]
+    assert all(run == (None, 0) for exp, run in result[2:])   # no runs: no run.NNN.xml
+    assert not os.path.exists(shard_path(runOutFile, 2))
+
+
+def test_rerun_renumbers_shards(tmp_path):
+    tsvInFile = write_tsv(tmp_path / "sam.tsv", [(f"s{i}", 1) for i in range(20)])
+    xmlOutFile = str(tmp_path / "sam.xml")
+    options = dict(submission_xml=write_submission(tmp_path), submission_name=str(tmp_path / "sam"), workers=2)
+    assert len(write_shards(tsvInFile, [xmlOutFile], ["SAMPLE_SET"], convert_samples, max_objects=2, **options)) == 10
+
+    # a rerun with fewer shards leaves none of the old ones behind
+    result = write_shards(tsvInFile, [xmlOutFile], ["SAMPLE_SET"], convert_samples, max_objects=8, **options)
+    assert sorted(glob.glob(str(tmp_path / "sam.[0-9][0-9][0-9].xml"))) == [path for ((path, count),) in result]
+    assert len(glob.glob(str(tmp_path / "sam.[0-9][0-9][0-9].submission.xml"))) == 3
+    assert [aliases(path) for ((path, count),) in result][-1] == [f"s{i}" for i in range(16, 20)]
+
+
+def test_compressed_shards(tmp_path):
+    rows = [(f"s{i}", 3) for i in range(10)]
+    tsvInFile = write_tsv(tmp_path / "sam.tsv", rows)
+    plain = write_shards(tsvInFile, [str(tmp_path / "sam.xml")], ["SAMPLE_SET"], convert_samples,
+                         max_objects=4, workers=1)
+    compressed = write_shards(tsvInFile, [str(tmp_path / "sam.xml.gz")], ["SAMPLE_SET"], convert_samples,
+                              max_objects=4, workers=1)
+    assert [path + ".gz" for ((path, count),) in plain] == [path for ((path, count),) in compressed]
+    for ((plain_path, count),), ((compressed_path, compressed_count),) in zip(plain, compressed):
+        with open(plain_path, 'rb') as f, gzip.open(compressed_path, 'rb') as g:
+            assert f.read() == g.read()
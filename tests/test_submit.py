@@ -0,0 +1,170 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.journal import SubmissionJournal
+from common.submit import SubmissionClient, SubmissionError, parse_batch, receipt_success, submit_journaled
+
+"""
+SubmissionClient and submit_journaled against the in-process mock dropbox (tests/conftest.py).
+"""
+
+SUBMISSION_XML = b"<SUBMISSION><ACTIONS><ACTION><ADD/></ACTION></ACTIONS></SUBMISSION>\n"
+DROP, ERROR, OK = 0.05, 0.15, 0.99   # rolls of the dropbox fixture (drop_rate = error_rate = 0.1)
+
+
+def sample_batch(directory, name, aliases):
+    """
+    Write a SAMPLE_SET with the given aliases and return its batch {form field: file path}.
+    """
+    submission = directory / "add_submission.xml"
+    submission.write_bytes(SUBMISSION_XML)
+    samples = directory / f"{name}.xml"
+    samples.write_text("<SAMPLE_SET>" + "".join(f'<SAMPLE alias="{alias}"/>' for alias in aliases) + "</SAMPLE_SET>\n")
+    return {"SUBMISSION": str(submission), "SAMPLE": str(samples)}
+
+
+def client_for(dropbox, workers=1, retries=3):
+    return SubmissionClient(dropbox.url, "user", "password", workers=workers, retries=retries, timeout=10, backoff=0)
+
+
+def test_post_returns_receipt(dropbox, tmp_path):
+    client = client_for(dropbox)
+    receipt = client.post(sample_batch(tmp_path, "sam", ["a", "b"]))
+    client.close()
+    assert receipt_success(receipt)
+    assert dropbox.dropbox.objects == 2
+
+
+def test_server_errors_are_retried(dropbox, tmp_path, capsys):
+    dropbox.random.rolls = [ERROR, ERROR, OK]
+    client = client_for(dropbox)
+    receipt = client.post(sample_batch(tmp_path, "sam", ["a"]))
+    client.close()
+    assert receipt_success(receipt)
+    assert dropbox.dropbox.requests == 1   # the 5xx answers never reached the dropbox state
+    assert capsys.readouterr().out.count("HTTP 500") == 2
+
+
+def test_dropped_connections_are_retried(dropbox, tmp_path):
+    dropbox.random.rolls = [DROP, DROP, OK]
+    client = client_for(dropbox)
+    receipt = client.post(sample_batch(tmp_path, "sam", ["a"]))
+    client.close()
+    assert receipt_success(receipt)
+    assert dropbox.connections == 3   # a new connection after every drop
+
+
+def test_retries_exhausted(dropbox, tmp_path):
+    dropbox.random.rolls = [ERROR] * 3
+    client = client_for(dropbox, retries=2)
+    with pytest.raises(SubmissionError, match="after 3 attempts"):
+        client.post(sample_batch(tmp_path, "sam", ["a"]))
+    client.close()
+
+
+def test_client_errors_are_not_retried(dropbox, tmp_path):
+    client = client_for(dropbox)
+    client.auth_header = "Bearer nothing"
+    with pytest.raises(SubmissionError, match="HTTP 401"):
+        client.post(sample_batch(tmp_path, "sam", ["a"]))
+    client.close()
+    assert dropbox.connections == 1
+
+
+def test_keep_alive_connection_is_reused(dropbox, tmp_path):
+    batches = [sample_batch(tmp_path, f"sam{i}", [f"s{i}"]) for i in range(5)]
+    client = client_for(dropbox, workers=1)
+    results = client.submit_all(batches)
+    assert [receipt_success(receipt) for batch, receipt, error in results] == [True] * 5
+    assert dropbox.connections == 1
+
+
+def test_submit_all_keeps_batch_order(dropbox, tmp_path):
+    batches = [sample_batch(tmp_path, f"sam{i}", [f"s{i}"]) for i in range(8)]
+    client = client_for(dropbox, workers=4)
+    results = client.submit_all(batches)
+    assert [batch for batch, receipt, error in results] == batches
+    assert all(receipt_success(receipt) for batch, receipt, error in results)
+    assert dropbox.connections <= 4
+
+
+def test_missing_batch_file(dropbox, tmp_path):
+    batch = sample_batch(tmp_path, "sam", ["a"])
+    with pytest.raises(FileNotFoundError):
+        parse_batch([f"SUBMISSION={batch['SUBMISSION']}", f"SAMPLE={batch['SAMPLE']}l"])
+    assert parse_batch([f"SUBMISSION={batch['SUBMISSION']}", f"sample={batch['SAMPLE']}"]) == batch
+
+    # a file removed after the batches were built is an error, not a failed submission
+    os.remove(batch["SAMPLE"])
+    with pytest.raises(FileNotFoundError):
+        client_for(dropbox).submit_all([batch])
+    assert dropbox.dropbox.requests == 0
+
+
+def test_resume_skips_accepted_units(dropbox, tmp_path):
+    batches = [sample_batch(tmp_path, f"sam{i}", [f"s{i}"]) for i in range(3)]
+    journal_file = str(tmp_path / "submission.journal")
+    first = submit_journaled(client_for(dropbox), batches[:2], SubmissionJournal(journal_file, dropbox.url))
+    assert [status for *_, status in first] == ["posted", "posted"]
+
+    results = submit_journaled(client_for(dropbox), batches, SubmissionJournal(journal_file, dropbox.url), resume=True)
+    assert [status for *_, status in results] == ["skipped", "skipped", "posted"]
+    assert results[0][1] == first[0][1]   # the recorded receipt
+    assert dropbox.dropbox.requests == 3
+
+
+def test_resume_is_per_url(dropbox, tmp_path):
+    batch = sample_batch(tmp_path, "sam", ["a"])
+    journal_file = str(tmp_path / "submission.journal")
+    other = SubmissionJournal(journal_file, "https://elsewhere.example/submit/")
+    other.record(batch, "accepted", b"<RECEIPT/>")
+    other.close()
+    results = submit_journaled(client_for(dropbox), [batch], SubmissionJournal(journal_file, dropbox.url), resume=True)
+    assert results[0][3] == "posted"
+
+
+def test_resume_recovers_in_doubt_unit(dropbox, tmp_path):
+    # the process died after the dropbox accepted the post, before the receipt was recorded
+    batch = sample_batch(tmp_path, "sam", ["a", "b"])
+    journal_file = str(tmp_path / "submission.journal")
+    journal = SubmissionJournal(journal_file, dropbox.url)
+    journal.record(batch, "started")
+    journal.close()
+    client = client_for(dropbox)
+    client.post(batch)
+    client.close()
+
+    journal = SubmissionJournal(journal_file, dropbox.url)
+    batch_, receipt, error, status = submit_journaled(client_for(dropbox), [batch], journal, resume=True)[0]
+    assert (receipt, error, status) == (None, None, "recovered")
+    state = SubmissionJournal(journal_file, dropbox.url).state(batch)
+    assert state["status"] == "accepted" and state["recovered"]
+
+
+def test_resume_retries_failed_unit(dropbox, tmp_path):
+    batch = sample_batch(tmp_path, "sam", ["a"])
+    journal_file = str(tmp_path / "submission.journal")
+    dropbox.random.rolls = [ERROR, ERROR]
+    failed = submit_journaled(client_for(dropbox, retries=1), [batch], SubmissionJournal(journal_file, dropbox.url))
+    assert failed[0][2] and failed[0][3] == "posted"
+
+    results = submit_journaled(client_for(dropbox), [batch], SubmissionJournal(journal_file, dropbox.url), resume=True)
+    assert receipt_success(results[0][1]) and results[0][3] == "posted"
+    assert SubmissionJournal(journal_file, dropbox.url).state(batch)["status"] == "accepted"
+
+
+def test_duplicate_without_doubt_is_rejected(dropbox, tmp_path):
+    # a rejection for existing objects is only a recovery if the journal had no receipt for the unit
+    batch = sample_batch(tmp_path, "sam", ["a"])
+    client = client_for(dropbox)
+    client.post(batch)
+    client.close()
+    journal_file = str(tmp_path / "submission.journal")
+    results = submit_journaled(client_for(dropbox), [batch], SubmissionJournal(journal_file, dropbox.url), resume=True)
+    assert results[0][3] == "posted" and receipt_success(results[0][1]) is False
+    with open(journal_file, 'r') as f:
+        assert [json.loads(line)["status"] for line in f] == ["started", "rejected"]
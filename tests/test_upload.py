@@ -0,0 +1,77 @@
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.upload import FtpUploader, UploadState
+
+"""
+FtpUploader against the in-process FTP stand-in (tests/conftest.py): upload, skip and REST resume.
+"""
+
+
+def write_fastq(path, size):
+    data = bytes((i * 7 + i // 251) % 256 for i in range(size))
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path), hashlib.md5(data).hexdigest()
+
+
+def uploader_for(server, **kwargs):
+    host, port = server.server_address
+    return FtpUploader(host, "user", "password", port=port, timeout=10, backoff=0, **kwargs)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def remote(server, name):
+    return read(os.path.join(server.root, name))
+
+
+def test_upload_and_skip(ftp_server, tmp_path):
+    path, md5 = write_fastq(tmp_path / "a.fastq.gz", 200000)
+    uploader = uploader_for(ftp_server)
+    assert uploader.upload(path) == ("uploaded", md5, 200000, 0)
+    assert remote(ftp_server, "a.fastq.gz") == read(path)
+    assert remote(ftp_server, "a.fastq.gz.md5") == f"{md5}  a.fastq.gz\n".encode("ascii")
+
+    # same size and MD5 on the server: nothing is sent again
+    assert uploader.upload(path) == ("skipped", md5, 0, 0)
+    uploader.close()
+
+
+def test_dropped_transfer_is_resumed(ftp_server, tmp_path, capsys):
+    size = 3 * 1024 ** 2 + 12345
+    path, md5 = write_fastq(tmp_path / "a.fastq.gz", size)
+    ftp_server.drop_after = 1024 ** 2   # every STOR is cut after 1 MiB
+    uploader = uploader_for(ftp_server, retries=10)
+    status, uploaded_md5, sent, offset = uploader.upload(path)
+    uploader.close()
+    assert status == "resumed" and 0 < offset < size
+    assert uploaded_md5 == md5
+    assert remote(ftp_server, "a.fastq.gz") == read(path)
+    assert capsys.readouterr().out.count("retrying") >= 3
+
+
+def test_changed_file_is_not_resumed(ftp_server, tmp_path):
+    # a partial upload of another version of the file is uploaded again from the start
+    path, md5 = write_fastq(tmp_path / "a.fastq.gz", 100000)
+    state = UploadState(str(tmp_path / ".upload_state.json"))
+    with open(os.path.join(ftp_server.root, "a.fastq.gz"), 'wb') as f:
+        f.write(b"\0" * 40000)
+    state.entries[os.path.abspath(path)] = {"size": 100000, "mtime_ns": 0}
+    uploader = uploader_for(ftp_server, state=state)
+    assert uploader.upload(path) == ("uploaded", md5, 100000, 0)
+    uploader.close()
+    assert remote(ftp_server, "a.fastq.gz") == read(path)
+    assert UploadState(str(tmp_path / ".upload_state.json")).entries == {}
+
+
+def test_upload_all_keeps_order(ftp_server, tmp_path):
+    files = [write_fastq(tmp_path / f"{name}.fastq.gz", size) for name, size in (("a", 1000), ("b", 50000), ("c", 9))]
+    uploader = uploader_for(ftp_server, workers=2)
+    results = uploader.upload_all([path for path, md5 in files])
+    assert [(path, result[1], error) for path, result, error in results] == [(path, md5, None) for path, md5 in files]
@@ -0,0 +1,91 @@
+import os
+import sys
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+from common.watch import WatchedOutput, WatchedTable
+from samSubmit.create_sam_xml import tsv2XML as sam2XML
+from runExpSubmit.create_runexp_xml import tsv2XML as runexp2XML
+
+"""
+Watch mode: after every edit of the TSVs, the patched XML equals a full regeneration.
+"""
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def repo_lines(*parts):
+    with open(os.path.join(REPO_DIR, *parts), 'r', encoding="UTF-8") as f:
+        return f.readlines()
+
+
+def renamed(line, index, columns):
+    # the same row with other aliases in the given columns
+    fields = line.split("\t")
+    for column in columns:
+        fields[column] = f"{fields[column]}_{index}"
+    return "\t".join(fields)
+
+
+def write_lines(path, lines):
+    with open(path, 'w', encoding="UTF-8") as f:
+        f.writelines(lines)
+    # a new mtime_ns even if the edits come faster than the file system clock
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+
+
+def edits(header, rows):
+    """
+    Versions of a sheet after typical edits: a changed row, rows appended, inserted and deleted,
+    a row emptied, and all rows reordered.
+    """
+    changed = rows[:3] + [rows[3].replace("\t", "\t ", 1)] + rows[4:]
+    yield [header] + changed
+    appended = changed + rows[:2]
+    yield [header] + appended
+    yield [header] + appended[:5] + [rows[7]] + appended[5:]
+    yield [header] + appended[:2] + appended[6:]
+    yield [header] + [rows[0], "\t" * header.count("\t") + "\n"] + rows[2:]
+    yield [header] + rows[::-1]
+
+
+def test_sam_watch_matches_full_conversion(tmp_path):
+    header, *rows = repo_lines("samSubmit", "sam.tsv")
+    rows = [renamed(row, index, [4]) for index in range(4) for row in rows]
+    tsvInFile, xmlOutFile, expected = str(tmp_path / "sam.tsv"), str(tmp_path / "sam.xml"), str(tmp_path / "full.xml")
+    table = WatchedTable(tsvInFile, "sam", [WatchedOutput("SAMPLE", xmlOutFile, "SAMPLE_SET")], validate=False)
+
+    write_lines(tsvInFile, [header] + rows)
+    table.refresh()
+    assert sam2XML(tsvInFile, expected) == len(rows)
+    assert read(xmlOutFile) == read(expected)
+
+    for lines in edits(header, rows):
+        write_lines(tsvInFile, lines)
+        assert table.changed()
+        table.refresh()
+        sam2XML(tsvInFile, expected)
+        assert read(xmlOutFile) == read(expected)
+        assert not table.changed()
+
+
+def test_runexp_watch_matches_full_conversion(tmp_path):
+    rows = [renamed(row, index, [0, 1, 2]) for index in range(3)
+            for row in repo_lines("runExpSubmit", "runExp.tsv")]
+    tsvInFile = str(tmp_path / "runExp.tsv")
+    expOutFile, runOutFile = str(tmp_path / "exp.xml"), str(tmp_path / "run.xml")
+    expected = str(tmp_path / "full_exp.xml"), str(tmp_path / "full_run.xml")
+    table = WatchedTable(tsvInFile, "runExp", [WatchedOutput("EXPERIMENT", expOutFile, "EXPERIMENT_SET"),
+                                               WatchedOutput("RUN", runOutFile, "RUN_SET")], validate=False)
+
+    write_lines(tsvInFile, rows)
+    table.refresh()
+    for lines in [rows] + [lines[1:] for lines in edits(rows[0], rows[1:])]:
+        write_lines(tsvInFile, lines)
+        table.refresh()
+        runexp2XML(tsvInFile, *expected)
+        assert (read(expOutFile), read(runOutFile)) == tuple(map(read, expected))
@@ -0,0 +1,61 @@
+import gzip
+import os
+import sys
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+from common.xml2tsv import xml2tsv
+from samSubmit.create_sam_xml import tsv2XML as sam2XML
+from runExpSubmit.create_runexp_xml import tsv2XML as runexp2XML
+
+"""
+xml2tsv: the XML of the converters reads back into the TSV it was written from.
+"""
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def repo_file(*parts):
+    return os.path.join(REPO_DIR, *parts)
+
+
+def test_sample_round_trip(tmp_path):
+    tsvOutFile = str(tmp_path / "sam.tsv")
+    assert xml2tsv([repo_file("samSubmit", "sam.xml")], tsvOutFile) == (6, {})
+    assert read(tsvOutFile) == read(repo_file("samSubmit", "sam.tsv"))
+
+    # and back: the same XML
+    sam2XML(tsvOutFile, str(tmp_path / "sam.xml"))
+    assert read(tmp_path / "sam.xml") == read(repo_file("samSubmit", "sam.xml"))
+
+
+def test_experiment_run_round_trip(tmp_path):
+    tsvOutFile = str(tmp_path / "runExp.tsv.gz")
+    xmlFiles = [repo_file("runExpSubmit", "exp.xml"), repo_file("runExpSubmit", "run.xml")]
+    assert xml2tsv(xmlFiles, tsvOutFile, header=False) == (6, {})
+    with gzip.open(tsvOutFile, 'rb') as f:
+        assert f.read() == read(repo_file("runExpSubmit", "runExp.tsv"))
+    assert not os.path.exists(tmp_path / "runExp.tsv.tmp.gz")
+
+    runexp2XML(tsvOutFile, str(tmp_path / "exp.xml"), str(tmp_path / "run.xml"))
+    assert read(tmp_path / "exp.xml") == read(xmlFiles[0])
+    assert read(tmp_path / "run.xml") == read(xmlFiles[1])
+
+
+def test_runs_in_reverse_order_are_paired(tmp_path):
+    # run.xml with the runs reversed: every run still gets its experiment's columns
+    with open(repo_file("runExpSubmit", "run.xml"), 'r', encoding="UTF-8") as f:
+        lines = f.readlines()
+    starts = [index for index, line in enumerate(lines) if line.startswith("  <RUN ")] + [len(lines) - 1]
+    runs = [lines[start:end] for start, end in zip(starts, starts[1:])]
+    with open(tmp_path / "run.xml", 'w', encoding="UTF-8") as f:
+        f.writelines(lines[:starts[0]] + [line for run in runs[::-1] for line in run] + lines[-1:])
+
+    tsvOutFile = str(tmp_path / "runExp.tsv")
+    assert xml2tsv([repo_file("runExpSubmit", "exp.xml"), str(tmp_path / "run.xml")], tsvOutFile, header=False) == (6, {})
+    with open(tsvOutFile, 'r', encoding="UTF-8") as f, \
+            open(repo_file("runExpSubmit", "runExp.tsv"), 'r', encoding="UTF-8") as g:
+        assert sorted(f) == sorted(g)
@@ -0,0 +1,71 @@
+import gzip
+import os
+import sys
+
+from lxml import etree
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+from common.xml_stream import StreamingSetWriter
+from samSubmit.create_sam_xml import tsv2XML as sam2XML
+from runExpSubmit.create_runexp_xml import tsv2XML as runexp2XML
+
+"""
+StreamingSetWriter writes the same bytes as serializing the whole *_SET tree at once.
+"""
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def samples():
+    for i in range(3):
+        sample = etree.Element("SAMPLE", alias=f"s{i}", center_name="Zürich & co")
+        etree.SubElement(sample, "TITLE").text = "Usutu <virus>"
+        attributes = etree.SubElement(sample, "SAMPLE_ATTRIBUTES")
+        for tag, value in (("host sex", "female"), ("collection date", "2023-07")):
+            attribute = etree.SubElement(attributes, "SAMPLE_ATTRIBUTE")
+            etree.SubElement(attribute, "TAG").text = tag
+            etree.SubElement(attribute, "VALUE").text = value
+        yield sample
+
+
+def tree_bytes(path, root_tag, elements):
+    root = etree.Element(root_tag)
+    root.extend(elements)
+    etree.ElementTree(root).write(path, pretty_print=True, xml_declaration=True, encoding="UTF-8")
+    return read(path)
+
+
+def stream_bytes(path, root_tag, elements):
+    with StreamingSetWriter(path, root_tag) as writer:
+        for element in elements:
+            writer.write(element)
+    return read(path)
+
+
+def test_same_bytes_as_the_tree(tmp_path):
+    expected = tree_bytes(str(tmp_path / "tree.xml"), "SAMPLE_SET", list(samples()))
+    assert stream_bytes(str(tmp_path / "stream.xml"), "SAMPLE_SET", samples()) == expected
+
+
+def test_empty_set(tmp_path):
+    expected = tree_bytes(str(tmp_path / "tree.xml"), "RUN_SET", [])
+    assert stream_bytes(str(tmp_path / "stream.xml"), "RUN_SET", []) == expected
+
+
+def test_compressed_output(tmp_path):
+    expected = stream_bytes(str(tmp_path / "stream.xml"), "SAMPLE_SET", samples())
+    stream_bytes(str(tmp_path / "stream.xml.gz"), "SAMPLE_SET", samples())
+    with gzip.open(str(tmp_path / "stream.xml.gz"), 'rb') as f:
+        assert f.read() == expected
+
+
+def test_converters_reproduce_the_checked_in_xml(tmp_path):
+    sam2XML(os.path.join(REPO_DIR, "samSubmit", "sam.tsv"), str(tmp_path / "sam.xml"))
+    runexp2XML(os.path.join(REPO_DIR, "runExpSubmit", "runExp.tsv"), str(tmp_path / "exp.xml"), str(tmp_path / "run.xml"))
+    assert read(str(tmp_path / "sam.xml")) == read(os.path.join(REPO_DIR, "samSubmit", "sam.xml"))
+    assert read(str(tmp_path / "exp.xml")) == read(os.path.join(REPO_DIR, "runExpSubmit", "exp.xml"))
+    assert read(str(tmp_path / "run.xml")) == read(os.path.join(REPO_DIR, "runExpSubmit", "run.xml"))